@@ -1,9 +1,10 @@
+import multiprocessing
 import os
 import sqlite3
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from sqlalchemy import event
+from sqlalchemy import event, inspect as sa_inspect
 from sqlalchemy.engine import Engine
 
 # Create database and login manager instances
@@ -11,19 +12,85 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'  # Redirects to login page if not logged in
 
-# Ensure SQLite enforces foreign keys (handy for future DB-level cascades)
+# How long a connection waits for SQLite's write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+# Ensure SQLite enforces foreign keys (handy for future DB-level cascades).
+# WAL lets readers run while the attendance writer commits; synchronous=NORMAL
+# only fsyncs at checkpoints, which is still crash-safe in WAL mode.
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     try:
         if isinstance(dbapi_connection, sqlite3.Connection):
             cursor = dbapi_connection.cursor()
             cursor.execute("PRAGMA foreign_keys=ON;")
+            cursor.execute("PRAGMA journal_mode=WAL;")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};")
+            cursor.execute("PRAGMA synchronous=NORMAL;")
             cursor.close()
     except Exception:
         # Non-SQLite engines or any errors – ignore silently
         pass
 
-def create_app():
+def _ensure_columns():
+    """create_all() never alters existing tables; add nullable columns added to the models since."""
+    inspector = sa_inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            if not column.nullable or column.server_default is not None:
+                raise RuntimeError(f"{table.name}.{column.name} is missing and cannot be added automatically")
+            col_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}')
+
+def _ensure_indexes():
+    """create_all() skips tables that already exist; add any indexes they are missing."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+# Users that already have a template are left alone, so reruns are harmless
+LEGACY_TEMPLATES_SQL = """
+    INSERT INTO face_templates (user_id, embedding, source, captured_at, capture_meta)
+    SELECT u.id, u.face_embedding, 'legacy', COALESCE(u.created_at, CURRENT_TIMESTAMP),
+           '{"migrated_from": "users.face_embedding"}'
+    FROM users u
+    WHERE u.face_embedding IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM face_templates t WHERE t.user_id = u.id)
+"""
+
+def copy_legacy_templates() -> int:
+    """Copy legacy users.face_embedding blobs (headerless float32) into face_templates; returns rows copied."""
+    columns = {c['name'] for c in sa_inspect(db.engine).get_columns('users')}
+    if 'face_embedding' not in columns:
+        return 0
+    with db.engine.begin() as conn:
+        return conn.exec_driver_sql(LEGACY_TEMPLATES_SQL).rowcount
+
+def init_db(app) -> None:
+    """Create missing tables, columns and indexes, and move legacy embeddings into face_templates
+    (web apps do this at startup unless DB_AUTO_CREATE=0)."""
+    with app.app_context():
+        db.create_all()
+        _ensure_columns()
+        _ensure_indexes()
+        copied = copy_legacy_templates()
+        if copied:
+            app.logger.info("Copied %d legacy face embedding(s) into face_templates", copied)
+
+def create_app(config: dict | None = None, *, cli: bool = False):
+    """Build the app. ``cli=True`` gives admin tools just config, the DB and models:
+    no blueprints, background services or schema creation (call ``init_db`` if needed).
+    """
+    from app.startup import StartupReport
+
+    report = StartupReport("cli" if cli else "web")
     app = Flask(__name__)
 
     # Secret key for sessions and encryption
@@ -33,26 +100,154 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Face embedding engine (worker processes; 0 = run inline in the request thread)
+    app.config['FACE_ENGINE_WORKERS'] = int(os.environ.get('FACE_ENGINE_WORKERS', '2'))
+    app.config['FACE_ENGINE_MAX_PENDING'] = int(os.environ.get('FACE_ENGINE_MAX_PENDING', '32'))
+    app.config['FACE_ENGINE_TIMEOUT'] = float(os.environ.get('FACE_ENGINE_TIMEOUT', '10'))
+    app.config['FACE_ENGINE_WARMUP'] = os.environ.get('FACE_ENGINE_WARMUP', '1') == '1'
+    # OpenCV, the worker pool and the gallery load on first use; 1 = load them in create_app
+    app.config['FACE_ENGINE_EAGER'] = os.environ.get('FACE_ENGINE_EAGER', '0') == '1'
+
+    # Run create_all() + missing indexes at startup (off for workers of an already-migrated DB)
+    app.config['DB_AUTO_CREATE'] = os.environ.get('DB_AUTO_CREATE', '1') == '1'
+
+    # Content-hash cache of upload embeddings (see app/face_utils/embed_cache.py)
+    app.config['EMBED_CACHE_ENABLED'] = os.environ.get('EMBED_CACHE_ENABLED', '1') == '1'
+    app.config['EMBED_CACHE_SIZE'] = int(os.environ.get('EMBED_CACHE_SIZE', '256'))
+    app.config['EMBED_CACHE_TTL'] = float(os.environ.get('EMBED_CACHE_TTL', '300'))
+
+    # Live capture: device index, "synthetic", or an image/video file path
+    app.config['CAMERA_SOURCE'] = os.environ.get('CAMERA_SOURCE', '0')
+    app.config['CAMERA_BUFFER_FRAMES'] = int(os.environ.get('CAMERA_BUFFER_FRAMES', '8'))
+
+    # Stored embedding format (see app/face_utils/embedding_format.py)
+    app.config['EMBEDDING_FORMAT'] = os.environ.get('EMBEDDING_FORMAT', 'rp256-f16')
+
+    # Face templates: how many to keep per user, and how their scores combine ('max' | 'mean')
+    app.config['FACE_TEMPLATES_PER_USER'] = int(os.environ.get('FACE_TEMPLATES_PER_USER', '5'))
+    app.config['FACE_TEMPLATE_FUSION'] = os.environ.get('FACE_TEMPLATE_FUSION', 'max')
+
+    # 1:N gallery: 'memory' (a copy per process) or 'mmap' (one shared file store,
+    # see app/face_utils/gallery_store.py; GALLERY_PATH defaults to instance/gallery)
+    app.config['GALLERY_BACKEND'] = os.environ.get('GALLERY_BACKEND', 'memory')
+    app.config['GALLERY_PATH'] = os.environ.get('GALLERY_PATH', '')
+    app.config['GALLERY_NLIST'] = int(os.environ.get('GALLERY_NLIST', '0'))   # IVF lists; 0 = auto
+    app.config['GALLERY_NPROBE'] = int(os.environ.get('GALLERY_NPROBE', '8'))
+
+    # Attendance write-behind queue (see app/attendance_writer.py)
+    app.config['ATTENDANCE_WRITER_ENABLED'] = os.environ.get('ATTENDANCE_WRITER_ENABLED', '1') == '1'
+    app.config['ATTENDANCE_FLUSH_INTERVAL'] = float(os.environ.get('ATTENDANCE_FLUSH_INTERVAL', '0.02'))
+    app.config['ATTENDANCE_BATCH_SIZE'] = int(os.environ.get('ATTENDANCE_BATCH_SIZE', '256'))
+    app.config['ATTENDANCE_ACK_TIMEOUT'] = float(os.environ.get('ATTENDANCE_ACK_TIMEOUT', '5'))
+
+    # Quality gate before embedding (see app/face_utils/quality.py)
+    app.config['QUALITY_GATE_ENABLED'] = os.environ.get('QUALITY_GATE_ENABLED', '1') == '1'
+    app.config['QUALITY_MIN_SHARPNESS'] = float(os.environ.get('QUALITY_MIN_SHARPNESS', '30'))
+    app.config['QUALITY_MIN_BRIGHTNESS'] = float(os.environ.get('QUALITY_MIN_BRIGHTNESS', '40'))
+    app.config['QUALITY_MAX_BRIGHTNESS'] = float(os.environ.get('QUALITY_MAX_BRIGHTNESS', '225'))
+    app.config['QUALITY_MIN_FACE_PX'] = int(os.environ.get('QUALITY_MIN_FACE_PX', '64'))
+
+    # Entrance-clip attendance (see app/face_utils/video.py)
+    app.config['VIDEO_SAMPLE_FPS'] = float(os.environ.get('VIDEO_SAMPLE_FPS', '5'))
+    app.config['VIDEO_MAX_SECONDS'] = float(os.environ.get('VIDEO_MAX_SECONDS', '300'))
+    app.config['VIDEO_TIMEOUT'] = float(os.environ.get('VIDEO_TIMEOUT', '120'))
+    # Frames are searched downscaled to this longer side, for faces of at least VIDEO_MIN_FACE_PX
+    app.config['VIDEO_DETECT_MAX_SIDE'] = int(os.environ.get('VIDEO_DETECT_MAX_SIDE', '1280'))
+    app.config['VIDEO_MIN_FACE_PX'] = int(os.environ.get('VIDEO_MIN_FACE_PX', '40'))
+
+    # Archive tier for old attendance logs (see app/archive.py, tools/archive_logs.py);
+    # ARCHIVE_PATH defaults to instance/archive
+    app.config['ARCHIVE_PATH'] = os.environ.get('ARCHIVE_PATH', '')
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+
+    # Live attendance feed for faculty over server-sent events (see app/live_feed.py)
+    app.config['LIVE_FEED_ENABLED'] = os.environ.get('LIVE_FEED_ENABLED', '1') == '1'
+    app.config['LIVE_FEED_CLIENT_BUFFER'] = int(os.environ.get('LIVE_FEED_CLIENT_BUFFER', '256'))
+    app.config['LIVE_FEED_MAX_CLIENTS'] = int(os.environ.get('LIVE_FEED_MAX_CLIENTS', '50'))
+    app.config['LIVE_FEED_REPLAY_MAX'] = int(os.environ.get('LIVE_FEED_REPLAY_MAX', '500'))
+    app.config['LIVE_FEED_HEARTBEAT'] = float(os.environ.get('LIVE_FEED_HEARTBEAT', '15'))
+
+    # Kiosk JSON API: images accepted per /api/v1/recognize call
+    app.config['API_MAX_IMAGES'] = int(os.environ.get('API_MAX_IMAGES', '16'))
+
+    # Request/query timing hooks for /admin/metrics (see app/metrics.py)
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+    # Overrides (tests, tools, alternate deployments)
+    if config:
+        app.config.update(config)
+
     # Initialize extensions
-    db.init_app(app)
-    login_manager.init_app(app)
+    with report.phase("extensions"):
+        db.init_app(app)
+        login_manager.init_app(app)
+
+        # Import models so Flask-Migrate or shell can see them
+        from app import models  # noqa: F401
+
+        from app.face_utils.embedding_format import set_current_format
+        set_current_format(app.config['EMBEDDING_FORMAT'])
+
+    if cli:
+        app.extensions["startup"] = report.finish()
+        return app
+
+    # Background services are created here but start lazily: the engine's pool
+    # on first submission, the camera on first live capture
+    with report.phase("services"):
+        from app.face_utils.engine import init_engine
+        init_engine(app)
+
+        from app.face_utils.embed_cache import init_embed_cache
+        init_embed_cache(app)
 
-    # Import models so Flask-Migrate or shell can see them
-    from app import models  # noqa: F401
+        from app.attendance_writer import init_attendance_writer
+        init_attendance_writer(app)
+
+        from app.live_feed import init_live_feed
+        init_live_feed(app)
+
+        from app.metrics import init_metrics
+        init_metrics(app)
+
+        from app.face_utils.matcher import check_fusion
+        check_fusion(app.config['FACE_TEMPLATE_FUSION'])
+
+        from app.face_utils.gallery import init_gallery
+        init_gallery(app)
+
+        from app.face_utils.camera import configure_capture
+        configure_capture(app.config['CAMERA_SOURCE'], app.config['CAMERA_BUFFER_FRAMES'])
 
     # Register Blueprints
-    from app.routes.auth import auth_bp
-    from app.routes.dashboard import dashboard_bp
-    from app.routes.recognition import recognition_bp
-    from app.routes.admin import admin_bp
+    with report.phase("blueprints"):
+        from app.routes.auth import auth_bp
+        from app.routes.dashboard import dashboard_bp
+        from app.routes.recognition import recognition_bp
+        from app.routes.admin import admin_bp
+        from app.routes.api import api_bp
 
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(dashboard_bp)
-    app.register_blueprint(recognition_bp)
-    app.register_blueprint(admin_bp)
+        app.register_blueprint(auth_bp)
+        app.register_blueprint(dashboard_bp)
+        app.register_blueprint(recognition_bp)
+        app.register_blueprint(admin_bp)
+        app.register_blueprint(api_bp)
 
-    # Create the database if it doesn't exist
-    with app.app_context():
-        db.create_all()
+    # Create the database if it doesn't exist; the face gallery loads on first match
+    if app.config['DB_AUTO_CREATE']:
+        with report.phase("create_all"):
+            init_db(app)
+
+    app.extensions["startup"] = report.finish()
+    app.logger.info(report.summary())
+
+    # Never from a spawned engine worker that re-imported the entry script: it
+    # would try to start a pool of its own while still bootstrapping. (While the
+    # child re-imports __main__, parent_process() is not set yet, but its name is.)
+    in_child = multiprocessing.parent_process() is not None or \
+        multiprocessing.current_process().name != "MainProcess"
+    if app.config['FACE_ENGINE_EAGER'] and not in_child:
+        from app.startup import warmup
+        warmup(app)
 
     return app
@@ -0,0 +1,295 @@
+# app/archive.py
+"""
+Columnar archive tier for old attendance logs.
+
+attendance_logs only grows, and every listing and export reads it. The
+archival job (``tools/archive_logs.py``) moves whole months older than a
+cutoff out of SQLite into one partition per month under ARCHIVE_PATH
+(default ``instance/archive``)::
+
+    manifest.json          partitions with row counts and time bounds, archived_before
+    2024-09/
+        id.npy             int64   log id
+        user_id.npy        int32
+        ts.npy             int64   timestamp, microseconds since the epoch (UTC, naive)
+        status.npy         uint8   code into meta.json "status"
+        location.npy       int32   code into meta.json "location", -1 = NULL
+        meta.json
+
+Rows in a partition are sorted by ``(timestamp, id)``, the order the log
+pages use. Columns are plain ``.npy`` files, opened with ``mmap_mode="r"``,
+so a scan touches only the pages it reads: time ranges and keyset cursors
+are binary searches on ``ts``, and user filters are one vectorized compare
+over the remaining slice. Narrow dtypes and dictionary-coded strings keep a
+row at 25 bytes; general-purpose compression would rule out mapping.
+
+Everything archived is older than everything still in the table (the
+cutoff only moves forward), so readers return table rows first and archived
+rows after them. The daily rollup stays in the database, so reports do not
+need the archive at all; ``daily_rollups`` lets a rollup rebuild include
+archived days.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import and_, delete, select
+
+from app import db
+from app.models import AttendanceLog
+
+EPOCH = datetime(1970, 1, 1)
+COLUMNS = ("id", "user_id", "ts", "status", "location")
+_DTYPES = {"id": np.int64, "user_id": np.int32, "ts": np.int64, "status": np.uint8, "location": np.int32}
+
+# Rows handed to readers per batch
+SCAN_CHUNK_ROWS = 1000
+
+
+def to_us(dt: datetime) -> int:
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def from_us(values: np.ndarray) -> list[datetime]:
+    return values.astype("datetime64[us]").tolist()
+
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def next_month(dt: datetime) -> datetime:
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+class Batch(NamedTuple):
+    """Decoded columns of consecutive archived rows (one partition slice)."""
+    id: np.ndarray
+    user_id: np.ndarray
+    ts: np.ndarray              # int64 microseconds; see from_us
+    status: np.ndarray          # object array of str
+    location: np.ndarray        # object array of str | None
+
+
+class LogArchive:
+    def __init__(self, path: str):
+        self.path = path
+
+    # ---------------------------------------------------------
+    # Partitions
+    # ---------------------------------------------------------
+    def manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.path, "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"partitions": {}, "archived_before": None}
+
+    def _save_manifest(self, manifest: dict) -> None:
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+
+    def _open(self, name: str) -> tuple[dict, dict]:
+        d = os.path.join(self.path, name)
+        with open(os.path.join(d, "meta.json")) as f:
+            meta = json.load(f)
+        return {c: np.load(os.path.join(d, f"{c}.npy"), mmap_mode="r") for c in COLUMNS}, meta
+
+    def _write_partition(self, name: str, cols: dict, status_dict: list, location_dict: list) -> dict:
+        final = os.path.join(self.path, name)
+        tmp = final + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for c in COLUMNS:
+            np.save(os.path.join(tmp, f"{c}.npy"), np.ascontiguousarray(cols[c], dtype=_DTYPES[c]))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"status": status_dict, "location": location_dict}, f)
+        old = final + ".old"
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(final):
+            os.replace(final, old)
+        os.replace(tmp, final)
+        shutil.rmtree(old, ignore_errors=True)
+        ts = cols["ts"]
+        return {"rows": int(ts.size), "min_ts": int(ts[0]), "max_ts": int(ts[-1])}
+
+    def add_rows(self, rows: list[tuple]) -> dict[str, int]:
+        """Merge ``(id, user_id, timestamp, status, location)`` rows into their month partitions.
+
+        Rows whose id is already archived are skipped, so a rerun after an
+        interrupted job does not duplicate anything. Returns rows added per month.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        manifest = self.manifest()
+        by_month: dict[str, list[tuple]] = {}
+        for row in rows:
+            by_month.setdefault(row[2].strftime("%Y-%m"), []).append(row)
+        added = {}
+        for name, month_rows in sorted(by_month.items()):
+            if name in manifest["partitions"]:
+                cols, meta = self._open(name)
+                cols = {c: np.array(v) for c, v in cols.items()}
+                status_dict, location_dict = meta["status"], meta["location"]
+            else:
+                cols = {c: np.empty(0, dtype=_DTYPES[c]) for c in COLUMNS}
+                status_dict, location_dict = [], []
+            known = set(cols["id"].tolist())
+            month_rows = [r for r in month_rows if r[0] not in known]
+            if not month_rows:
+                continue
+            s_code = {s: i for i, s in enumerate(status_dict)}
+            l_code = {s: i for i, s in enumerate(location_dict)}
+            new = {
+                "id": np.array([r[0] for r in month_rows], dtype=np.int64),
+                "user_id": np.array([r[1] for r in month_rows], dtype=np.int32),
+                "ts": np.array([to_us(r[2]) for r in month_rows], dtype=np.int64),
+                "status": np.array([s_code.setdefault(r[3], len(s_code)) for r in month_rows], dtype=np.uint8),
+                "location": np.array([-1 if r[4] is None else l_code.setdefault(r[4], len(l_code))
+                                      for r in month_rows], dtype=np.int32),
+            }
+            cols = {c: np.concatenate([cols[c], new[c]]) for c in COLUMNS}
+            order = np.lexsort((cols["id"], cols["ts"]))
+            cols = {c: v[order] for c, v in cols.items()}
+            manifest["partitions"][name] = self._write_partition(name, cols, list(s_code), list(l_code))
+            added[name] = len(month_rows)
+        self._save_manifest(manifest)
+        return added
+
+    # ---------------------------------------------------------
+    # Reading
+    # ---------------------------------------------------------
+    def scan(self, *, start: datetime | None = None, end: datetime | None = None, user_id: int | None = None,
+             older_than: tuple[datetime, int] | None = None, newer_than: tuple[datetime, int] | None = None,
+             newest_first: bool = True, chunk: int = SCAN_CHUNK_ROWS):
+        """Yield ``Batch``es of archived rows with ``start <= ts < end``, optionally one
+        user's, strictly older / newer than a ``(timestamp, id)`` keyset cursor."""
+        lo_us = to_us(start) if start else None
+        hi_us = to_us(end) if end else None
+        parts = sorted(self.manifest()["partitions"].items(), reverse=newest_first)
+        for name, info in parts:
+            if lo_us is not None and info["max_ts"] < lo_us or hi_us is not None and info["min_ts"] >= hi_us:
+                continue
+            if older_than and info["min_ts"] > to_us(older_than[0]):
+                continue
+            if newer_than and info["max_ts"] < to_us(newer_than[0]):
+                continue
+            cols, meta = self._open(name)
+            ts, ids = cols["ts"], cols["id"]
+            lo = 0 if lo_us is None else int(np.searchsorted(ts, lo_us, "left"))
+            hi = ts.size if hi_us is None else int(np.searchsorted(ts, hi_us, "left"))
+            if older_than:
+                hi = min(hi, _keyset_pos(ts, ids, older_than))
+            if newer_than:
+                lo = max(lo, _keyset_pos(ts, ids, newer_than, after=True))
+            if lo >= hi:
+                continue
+            idx = np.arange(lo, hi)
+            if user_id is not None:
+                idx = idx[cols["user_id"][lo:hi] == user_id]
+            if newest_first:
+                idx = idx[::-1]
+            statuses = np.asarray(meta["status"], dtype=object)
+            locations = np.asarray(meta["location"] + [None], dtype=object)  # code -1 -> None
+            for s in range(0, idx.size, chunk):
+                sel = idx[s:s + chunk]
+                yield Batch(np.asarray(ids[sel]), np.asarray(cols["user_id"][sel]), np.asarray(ts[sel]),
+                            statuses[cols["status"][sel]], locations[cols["location"][sel]])
+
+    def daily_rollups(self, start: date | None = None, end: date | None = None):
+        """attendance_daily rows ``(day, user_id, first_in, last_out, event_count)`` for archived days."""
+        out = []
+        for batch in self.scan(start=datetime.combine(start, datetime.min.time()) if start else None,
+                               end=datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None,
+                               newest_first=False, chunk=1 << 62):
+            day = batch.ts // (86400 * 10**6)
+            order = np.lexsort((batch.user_id, day))
+            day, uid, ts, status = day[order], batch.user_id[order], batch.ts[order], batch.status[order]
+            keys = np.stack([day, uid.astype(np.int64)], axis=1)
+            _, starts, counts = np.unique(keys, axis=0, return_index=True, return_counts=True)
+            t_in = np.where(status == "TIME_IN", ts, np.iinfo(np.int64).max)
+            t_out = np.where(status == "TIME_OUT", ts, np.iinfo(np.int64).min)
+            first_in = np.minimum.reduceat(t_in, starts)
+            last_out = np.maximum.reduceat(t_out, starts)
+            for i, s in enumerate(starts):
+                fi = None if first_in[i] == np.iinfo(np.int64).max else EPOCH + timedelta(microseconds=int(first_in[i]))
+                lo = None if last_out[i] == np.iinfo(np.int64).min else EPOCH + timedelta(microseconds=int(last_out[i]))
+                out.append(((EPOCH + timedelta(days=int(day[s]))).date(), int(uid[s]), fi, lo, int(counts[i])))
+        return out
+
+    def stats(self) -> dict:
+        parts = self.manifest()["partitions"]
+        size = 0
+        for name in parts:
+            d = os.path.join(self.path, name)
+            size += sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d))
+        return {"path": self.path, "archived_before": self.manifest()["archived_before"],
+                "partitions": len(parts), "rows": sum(p["rows"] for p in parts.values()),
+                "bytes": size}
+
+
+def _keyset_pos(ts: np.ndarray, ids: np.ndarray, cursor: tuple[datetime, int], after: bool = False) -> int:
+    """Index of the first row after (``after``) or at-or-after the ``(timestamp, id)`` cursor."""
+    c_ts, c_id = to_us(cursor[0]), int(cursor[1])
+    lo = int(np.searchsorted(ts, c_ts, "left"))
+    hi = int(np.searchsorted(ts, c_ts, "right"))
+    return lo + int(np.searchsorted(ids[lo:hi], c_id, "right" if after else "left"))
+
+
+# ---------------------------------------------------------
+# Archival job
+# ---------------------------------------------------------
+def archive_logs(archive: LogArchive, before: datetime, dry_run: bool = False, progress=None) -> dict:
+    """Move attendance_logs rows older than ``before`` (rounded down to a month) into ``archive``.
+
+    One month at a time: the partition is written first, then the same rows
+    are deleted from the table in one transaction. An interrupted run leaves
+    rows in both tiers until the next run, which skips the already-archived
+    ids and deletes them from the table.
+    """
+    cutoff = month_start(before)
+    ts = AttendanceLog.timestamp
+    oldest = db.session.execute(select(ts).where(ts.isnot(None)).order_by(ts.asc()).limit(1)).scalar()
+    moved: dict[str, int] = {}
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        end = next_month(month)
+        in_month = and_(ts >= month, ts < end)
+        rows = db.session.execute(
+            select(AttendanceLog.id, AttendanceLog.user_id, ts, AttendanceLog.status, AttendanceLog.location)
+            .where(in_month).order_by(ts, AttendanceLog.id)).all()
+        if rows:
+            name = month.strftime("%Y-%m")
+            moved[name] = len(rows)
+            if not dry_run:
+                archive.add_rows([tuple(r) for r in rows])
+                max_id = max(r[0] for r in rows)
+                db.session.execute(delete(AttendanceLog).where(in_month, AttendanceLog.id <= max_id))
+                db.session.commit()
+            if progress:
+                progress(name, len(rows))
+        month = end
+    if not dry_run:
+        manifest = archive.manifest()
+        previous = manifest.get("archived_before")
+        if previous is None or previous < cutoff.isoformat():
+            os.makedirs(archive.path, exist_ok=True)
+            manifest["archived_before"] = cutoff.isoformat()
+            archive._save_manifest(manifest)
+    return {"cutoff": cutoff, "moved": moved}
+
+
+def get_archive() -> LogArchive:
+    from flask import current_app
+
+    archive = current_app.extensions.get("log_archive")
+    if archive is None:
+        path = current_app.config["ARCHIVE_PATH"] or os.path.join(current_app.instance_path, "archive")
+        archive = current_app.extensions["log_archive"] = LogArchive(path)
+    return archive
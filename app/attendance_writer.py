@@ -0,0 +1,280 @@
+# app/attendance_writer.py
+"""
+Group-commit writer for AttendanceLog rows.
+
+Marks from many request threads are queued and a single background thread
+flushes them in one transaction per batch (every ``flush_interval`` seconds or
+as soon as ``batch_size`` rows are waiting). SQLite then does one fsync per
+batch instead of one per mark, and writers stop fighting over the database
+lock.
+
+Callers still get a durable acknowledgement: ``submit`` returns a Future that
+resolves to the new log id(s) only after the batch containing it has
+committed. ``write`` / ``write_many`` wait for that and are what the routes
+use. Entries passed together to ``submit_many`` always land in the same
+transaction.
+
+An acknowledgement that does not come within ``ack_timeout`` is definitive
+either way: a unit the writer has not taken yet is withdrawn from the queue
+(``Future.cancel``) and reported as not saved, so a retry cannot duplicate
+it; one already being committed is waited for, since its transaction ends
+within SQLite's busy timeout.
+
+With ``enabled=False`` every unit is committed synchronously in the caller's
+thread (same code path, no batching).
+
+Each committed batch is then published to the live feed (app/live_feed.py)
+when anyone is watching it.
+"""
+from __future__ import annotations
+
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime
+
+from app import db, metrics
+from app.models import AttendanceLog
+
+
+class WriterBusy(RuntimeError):
+    """The write queue is full."""
+
+
+class _Unit:
+    __slots__ = ("entries", "future", "queued_at")
+
+    def __init__(self, entries: list[dict]):
+        self.entries = entries
+        self.future: Future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class AttendanceWriter:
+    def __init__(self, app, enabled: bool = True, flush_interval: float = 0.02,
+                 batch_size: int = 256, max_queue: int = 10000, ack_timeout: float = 5.0):
+        self.app = app
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.ack_timeout = ack_timeout
+        self._q: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.batches = 0
+        self.rows = 0
+        self.failures = 0
+        self.withdrawn = 0
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    def start(self) -> "AttendanceWriter":
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name="attendance-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush whatever is queued, then stop the thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ---------------------------------------------------------
+    # Submission
+    # ---------------------------------------------------------
+    @staticmethod
+    def _entry(user_id: int, status: str = "TIME_IN", location: str | None = None,
+               timestamp: datetime | None = None) -> dict:
+        return {"user_id": int(user_id), "status": status, "location": location,
+                "timestamp": timestamp or datetime.utcnow()}
+
+    def submit_many(self, entries: list[dict]) -> Future:
+        """Queue several rows as one unit; the Future resolves to their ids."""
+        unit = _Unit([self._entry(**e) for e in entries])
+        if not unit.entries:
+            unit.future.set_result([])
+            return unit.future
+        if not self.enabled:
+            unit.future.set_running_or_notify_cancel()
+            self._commit([unit])
+            return unit.future
+        self.start()
+        try:
+            self._q.put_nowait(unit)
+        except queue.Full:
+            raise WriterBusy("Attendance queue is full, please retry in a moment.")
+        return unit.future
+
+    def submit(self, user_id: int, status: str = "TIME_IN", location: str | None = None,
+               timestamp: datetime | None = None) -> Future:
+        fut = self.submit_many([{"user_id": user_id, "status": status,
+                                 "location": location, "timestamp": timestamp}])
+        out: Future = Future()
+        fut.add_done_callback(lambda f: out.set_exception(f.exception()) if f.exception()
+                              else out.set_result(f.result()[0]))
+        return out
+
+    def _wait(self, fut: Future) -> list[int]:
+        try:
+            return fut.result(self.ack_timeout)
+        except FutureTimeout:
+            if fut.cancel():
+                self.withdrawn += 1
+                raise WriterBusy("Attendance was not saved in time, please retry.") from None
+            # already taken by the writer: the outcome is moments away, and reporting
+            # a failure now would make a retry duplicate a mark that still commits
+            return fut.result()
+
+    def write(self, user_id: int, status: str = "TIME_IN", location: str | None = None,
+              timestamp: datetime | None = None) -> int:
+        """Queue one row and wait until it is committed; returns the log id."""
+        return self._wait(self.submit_many([{"user_id": user_id, "status": status,
+                                             "location": location, "timestamp": timestamp}]))[0]
+
+    def write_many(self, entries: list[dict]) -> list[int]:
+        return self._wait(self.submit_many(entries))
+
+    @property
+    def depth(self) -> int:
+        return self._q.qsize()
+
+    # ---------------------------------------------------------
+    # Flushing
+    # ---------------------------------------------------------
+    def _loop(self) -> None:
+        while True:
+            try:
+                first = self._q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            units = [first]
+            rows = len(first.entries)
+            deadline = time.perf_counter() + self.flush_interval
+            while rows < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    unit = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                units.append(unit)
+                rows += len(unit.entries)
+            # from here on a unit can no longer be withdrawn; skip any that already were
+            units = [u for u in units if u.future.set_running_or_notify_cancel()]
+            if units:
+                self._commit(units)
+
+    def _insert(self, units: list[_Unit]) -> tuple[list[list[int]], list]:
+        """Commit one transaction for ``units``; returns their log ids and the live-feed events.
+
+        Everything is read before the commit: with expire_on_commit each ``log.id``
+        afterwards would cost its own refresh query.
+        """
+        logs = [[AttendanceLog(**e) for e in u.entries] for u in units]
+        db.session.add_all([log for group in logs for log in group])
+        db.session.flush()
+        ids = [[log.id for log in group] for group in logs]
+        events = self._feed_events([log for group in logs for log in group])
+        db.session.commit()
+        return ids, events
+
+    def _feed_events(self, logs: list[AttendanceLog]) -> list:
+        feed = self.app.extensions.get("live_feed")
+        if feed is None or not feed.enabled or not feed.clients:
+            return []
+        from app.live_feed import FeedEvent
+        from app.models import load_user
+
+        try:
+            events = []
+            for log in logs:
+                user = load_user(log.user_id)
+                if user is None:
+                    continue
+                events.append(FeedEvent(log.id, log.user_id, user.username, user.full_name,
+                                        log.status, log.location, log.timestamp))
+            return events
+        except Exception:
+            # a missed live update is not worth failing the marks
+            self.app.logger.exception("Preparing attendance for the live feed failed")
+            return []
+
+    def _acknowledge(self, units: list[_Unit], ids: list[list[int]], events: list) -> None:
+        """Resolve the futures of a committed batch. Never raises: the marks are saved either way."""
+        for u, unit_ids in zip(units, ids):
+            u.future.set_result(unit_ids)
+        self.batches += 1
+        self.rows += sum(len(u.entries) for u in units)
+        try:
+            done = time.perf_counter()
+            metrics.ATTENDANCE_BATCH_ROWS.observe(sum(len(i) for i in ids))
+            for u in units:
+                metrics.ATTENDANCE_WRITE_SECONDS.observe(done - u.queued_at)
+            if events:
+                self.app.extensions["live_feed"].publish(events)
+        except Exception:
+            self.app.logger.exception("Post-commit bookkeeping for an attendance batch failed")
+
+    def _commit(self, units: list[_Unit]) -> None:
+        with self.app.app_context():
+            try:
+                try:
+                    ids, events = self._insert(units)
+                except Exception as e:
+                    # only the flush or the commit got here, so nothing of this batch is saved
+                    db.session.rollback()
+                    if len(units) == 1:
+                        self.failures += 1
+                        self.app.logger.exception("Attendance batch failed")
+                        units[0].future.set_exception(e)
+                    else:
+                        # isolate the bad unit: retry each one in its own transaction
+                        for u in units:
+                            self._commit([u])
+                    return
+                self._acknowledge(units, ids, events)
+            finally:
+                db.session.remove()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queued": self.depth,
+            "batches": self.batches,
+            "rows": self.rows,
+            "failures": self.failures,
+            "withdrawn": self.withdrawn,
+            "avg_batch": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "flush_interval_s": self.flush_interval,
+            "batch_size": self.batch_size,
+        }
+
+
+def init_attendance_writer(app) -> AttendanceWriter:
+    writer = AttendanceWriter(
+        app,
+        enabled=app.config["ATTENDANCE_WRITER_ENABLED"],
+        flush_interval=app.config["ATTENDANCE_FLUSH_INTERVAL"],
+        batch_size=app.config["ATTENDANCE_BATCH_SIZE"],
+        ack_timeout=app.config["ATTENDANCE_ACK_TIMEOUT"],
+    )
+    app.extensions["attendance_writer"] = writer
+    atexit.register(writer.stop)
+    return writer
+
+
+def get_writer() -> AttendanceWriter:
+    from flask import current_app
+
+    return current_app.extensions["attendance_writer"]
@@ -0,0 +1,7 @@
+# app/face_utils/__init__.py
+# Kept import-free so the app can start without OpenCV; the pipeline is only
+# imported on first use (or by the engine warmup).
+
+# Bump whenever a change in pipeline.py alters the vectors produced for the
+# same image; cached embeddings (see embed_cache.py) are keyed on it
+PIPELINE_VERSION = "1"
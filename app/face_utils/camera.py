@@ -0,0 +1,250 @@
+# app/face_utils/camera.py
+"""
+Long-lived camera capture service.
+
+Instead of opening ``cv2.VideoCapture(0)`` per request (slow to open, and the
+first frames after warmup are often dark), one background thread owns the
+device and keeps a small ring buffer of recent ``(timestamp, frame)`` pairs.
+Live registration and marking just take the freshest good frame.
+
+The frame source is pluggable so the service can run without a webcam:
+
+- ``"0"``, ``"1"`` ...  -> OpenCV device index
+- ``"synthetic"``       -> generated face-like frames
+- any other string      -> image or video file path (videos loop)
+
+OpenCV is imported by the sources when they open, so configuring the service
+at app startup stays cheap.
+"""
+from __future__ import annotations
+
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+# Frames darker than this (mean gray level, 0-255) are treated as warmup junk
+MIN_BRIGHTNESS = 40.0
+
+
+def _brightness(frame: np.ndarray) -> float:
+    # strided sample is plenty for an exposure estimate
+    return float(frame[::8, ::8].mean())
+
+
+# -----------------------------------------------------------
+# Frame sources
+# -----------------------------------------------------------
+class OpenCVSource:
+    def __init__(self, device: int = 0):
+        self.device = device
+        self._cap = None
+
+    def open(self) -> bool:
+        import cv2
+
+        self._cap = cv2.VideoCapture(self.device)
+        return self._cap.isOpened()
+
+    def read(self) -> np.ndarray | None:
+        ok, frame = self._cap.read()
+        return frame if ok else None
+
+    def close(self) -> None:
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+class FileSource:
+    """Replays an image (same frame forever) or a video (looping) at ``fps``."""
+
+    def __init__(self, path: str, fps: float = 15.0):
+        self.path = path
+        self.fps = fps
+        self._image = None
+        self._cap = None
+
+    def open(self) -> bool:
+        import cv2
+
+        img = cv2.imread(self.path, cv2.IMREAD_COLOR)
+        if img is not None:
+            self._image = img
+            return True
+        self._cap = cv2.VideoCapture(self.path)
+        return self._cap.isOpened()
+
+    def read(self) -> np.ndarray | None:
+        time.sleep(1.0 / self.fps)
+        if self._image is not None:
+            return self._image.copy()
+        ok, frame = self._cap.read()
+        if not ok:
+            import cv2
+
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._cap.read()
+        return frame if ok else None
+
+    def close(self) -> None:
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        self._image = None
+
+
+def synthetic_face_frame(width: int, height: int, rng: np.random.Generator, phase: float = 0.0) -> np.ndarray:
+    """Face-like test pattern: a bright oval with eyes and mouth on a noisy background."""
+    import cv2
+
+    frame = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+    cx = width // 2 + int(20 * np.sin(phase))
+    cy = height // 2
+    ax, ay = width // 8, height // 4
+    cv2.ellipse(frame, (cx, cy), (ax, ay), 0, 0, 360, (180, 190, 210), -1)
+    for dx in (-ax // 2, ax // 2):
+        cv2.circle(frame, (cx + dx, cy - ay // 4), max(2, ax // 8), (40, 40, 40), -1)
+    cv2.ellipse(frame, (cx, cy + ay // 2), (ax // 3, ay // 10), 0, 0, 180, (60, 60, 120), -1)
+    return frame
+
+
+class SyntheticSource:
+    """Generated face-like frames drifting sideways (see ``synthetic_face_frame``)."""
+
+    def __init__(self, width: int = 640, height: int = 480, fps: float = 15.0, seed: int = 0):
+        self.width, self.height, self.fps = width, height, fps
+        self._rng = np.random.default_rng(seed)
+        self._n = 0
+
+    def open(self) -> bool:
+        self._n = 0
+        return True
+
+    def read(self) -> np.ndarray | None:
+        time.sleep(1.0 / self.fps)
+        frame = synthetic_face_frame(self.width, self.height, self._rng, self._n / 10.0)
+        self._n += 1
+        return frame
+
+    def close(self) -> None:
+        pass
+
+
+def make_source(spec: str | int):
+    spec = str(spec).strip()
+    if spec.isdigit():
+        return OpenCVSource(int(spec))
+    if spec == "synthetic":
+        return SyntheticSource()
+    if not os.path.exists(spec):
+        raise ValueError(f"camera source not found: {spec}")
+    return FileSource(spec)
+
+
+# -----------------------------------------------------------
+# Capture service
+# -----------------------------------------------------------
+class CaptureService:
+    def __init__(self, source, buffer_size: int = 8, min_brightness: float = MIN_BRIGHTNESS,
+                 reopen_delay: float = 1.0):
+        self.source = source
+        self.min_brightness = min_brightness
+        self.reopen_delay = reopen_delay
+        self._frames: collections.deque = collections.deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.frames_read = 0
+        self.open_failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "CaptureService":
+        if self.running:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="camera-capture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            if not self.source.open():
+                self.open_failures += 1
+                self.source.close()
+                self._stop.wait(self.reopen_delay)
+                continue
+            try:
+                while not self._stop.is_set():
+                    frame = self.source.read()
+                    if frame is None:
+                        break  # device hiccup: reopen
+                    item = (time.monotonic(), frame, _brightness(frame))
+                    with self._cond:
+                        self._frames.append(item)
+                        self.frames_read += 1
+                        self._cond.notify_all()
+            finally:
+                self.source.close()
+
+    def _good(self, max_age: float, min_brightness: float | None) -> list:
+        floor = self.min_brightness if min_brightness is None else min_brightness
+        now = time.monotonic()
+        return [(ts, f) for ts, f, b in self._frames if now - ts <= max_age and b >= floor]
+
+    def latest(self, max_age: float = 1.0, min_brightness: float | None = None,
+               timeout: float = 3.0) -> np.ndarray | None:
+        """Freshest frame no older than ``max_age`` seconds that is bright enough."""
+        self.start()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                good = self._good(max_age, min_brightness)
+                if good:
+                    return good[-1][1]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def recent(self, max_age: float = 1.0, min_brightness: float | None = None) -> list[np.ndarray]:
+        """All buffered good frames within ``max_age``, oldest first."""
+        self.start()
+        with self._cond:
+            return [f for _, f in self._good(max_age, min_brightness)]
+
+
+_service: CaptureService | None = None
+_service_lock = threading.Lock()
+_source_spec: str = os.environ.get("CAMERA_SOURCE", "0")
+_buffer_size: int = 8
+
+
+def configure_capture(source: str | int, buffer_size: int = 8) -> None:
+    """Choose the frame source; takes effect the next time the service is created."""
+    global _source_spec, _buffer_size, _service
+    with _service_lock:
+        _source_spec, _buffer_size = str(source), int(buffer_size)
+        if _service is not None:
+            _service.stop()
+            _service = None
+
+
+def get_capture_service() -> CaptureService:
+    """Process-wide service, created (and the device opened) on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = CaptureService(make_source(_source_spec), buffer_size=_buffer_size)
+        return _service.start()
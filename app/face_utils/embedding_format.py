@@ -0,0 +1,192 @@
+# app/face_utils/embedding_format.py
+"""
+Compact, versioned on-disk format for face embeddings.
+
+The pipeline produces a 96x96 = 9216-dim float32 vector (36 KB). Stored
+embeddings can instead be reduced with a fixed random orthonormal projection
+and quantized:
+
+    name          dims   dtype    bytes   vs raw
+    raw           9216   float32  36864   1x      (legacy, headerless)
+    f32           9216   float32  36872   1x
+    rp256-f16      256   float16    520   ~70x
+    rp256-i8       256   int8       268   ~137x
+
+Every non-legacy blob starts with an 8-byte header so readers can tell formats
+apart:
+
+    magic b"FE" | version u8 | dtype u8 | dims u16 | projection u16
+
+int8 blobs carry a float32 scale right after the header. Blobs without the
+magic are legacy raw float32 vectors.
+
+Cosine scores are only comparable inside one projection space, so callers
+convert everything (stored rows and fresh probes) into the *current* format's
+space with ``to_current`` / ``decode_current``. Legacy raw rows can always be
+projected; rows already in another projection cannot be converted back.
+"""
+from __future__ import annotations
+
+import re
+import struct
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+RAW_DIM = 96 * 96
+MAGIC = b"FE"
+VERSION = 1
+_HEADER = struct.Struct("<2sBBHH")
+
+# dtype codes
+F32, F16, I8 = 0, 1, 2
+_DTYPES = {F32: np.float32, F16: np.float16, I8: np.int8}
+_DTYPE_NAMES = {"f32": F32, "f16": F16, "i8": I8}
+_DTYPE_LABELS = {v: k for k, v in _DTYPE_NAMES.items()}
+
+# projection ids
+PROJ_NONE = 0
+PROJ_RANDOM = 1      # orthonormal Gaussian projection, fixed seed
+_PROJ_SEED = 20240901
+
+DEFAULT_FORMAT = "rp256-f16"
+
+
+class EmbeddingFormat(NamedTuple):
+    name: str
+    dims: int
+    dtype: int
+    projection: int
+
+
+class Decoded(NamedTuple):
+    vec: np.ndarray
+    projection: int
+    fmt: str
+
+
+def parse_format(name: str) -> EmbeddingFormat:
+    name = name.strip().lower()
+    if name in ("raw", "f32"):
+        return EmbeddingFormat(name, RAW_DIM, F32, PROJ_NONE)
+    m = re.fullmatch(r"rp(\d+)-(f32|f16|i8)", name)
+    if not m or not (0 < int(m.group(1)) < RAW_DIM):
+        raise ValueError(f"unknown embedding format: {name!r}")
+    return EmbeddingFormat(name, int(m.group(1)), _DTYPE_NAMES[m.group(2)], PROJ_RANDOM)
+
+
+# ---------------------------------------------------------
+# Projection
+# ---------------------------------------------------------
+_proj_cache: dict[int, np.ndarray] = {}
+_proj_lock = threading.Lock()
+
+
+def projection_matrix(dims: int) -> np.ndarray:
+    """(RAW_DIM, dims) matrix with orthonormal columns, identical in every process."""
+    with _proj_lock:
+        mat = _proj_cache.get(dims)
+        if mat is None:
+            rng = np.random.default_rng(_PROJ_SEED)
+            q, _ = np.linalg.qr(rng.standard_normal((RAW_DIM, dims)))
+            mat = np.ascontiguousarray(q, dtype=np.float32)
+            _proj_cache[dims] = mat
+        return mat
+
+
+def _l2(x: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(x, axis=-1, keepdims=True)
+    n[n == 0] = 1.0
+    return x / n
+
+
+def project(raw: np.ndarray, fmt: EmbeddingFormat) -> np.ndarray:
+    """Map raw pipeline vector(s) into ``fmt``'s space, L2-normalized."""
+    raw = np.asarray(raw, dtype=np.float32)
+    if fmt.projection == PROJ_NONE:
+        return _l2(raw)
+    return _l2(raw @ projection_matrix(fmt.dims))
+
+
+# ---------------------------------------------------------
+# Encode / decode
+# ---------------------------------------------------------
+def encode(raw: np.ndarray, fmt: EmbeddingFormat) -> bytes:
+    """Serialize a raw pipeline vector in ``fmt``."""
+    raw = np.asarray(raw, dtype=np.float32).ravel()
+    if fmt.name == "raw":
+        return raw.tobytes()
+    return quantize(project(raw, fmt), fmt)
+
+
+def quantize(vec: np.ndarray, fmt: EmbeddingFormat) -> bytes:
+    """Serialize a vector that is already in ``fmt``'s space (header + payload)."""
+    vec = np.asarray(vec, dtype=np.float32).ravel()
+    head = _HEADER.pack(MAGIC, VERSION, fmt.dtype, fmt.dims, fmt.projection)
+    if fmt.dtype == I8:
+        scale = float(np.abs(vec).max()) / 127.0 or 1.0
+        q = np.clip(np.rint(vec / scale), -127, 127).astype(np.int8)
+        return head + struct.pack("<f", scale) + q.tobytes()
+    return head + vec.astype(_DTYPES[fmt.dtype]).tobytes()
+
+
+def decode(blob: bytes | None) -> Decoded | None:
+    if not blob:
+        return None
+    if len(blob) >= _HEADER.size and blob[:2] == MAGIC:
+        magic, version, dtype, dims, proj = _HEADER.unpack_from(blob)
+        if version != VERSION or dtype not in _DTYPES:
+            return None
+        body = memoryview(blob)[_HEADER.size:]
+        scale = 1.0
+        if dtype == I8:
+            (scale,) = struct.unpack_from("<f", body)
+            body = body[4:]
+        vec = np.frombuffer(body, dtype=_DTYPES[dtype])
+        if vec.size != dims:
+            return None
+        vec = vec.astype(np.float32) * np.float32(scale) if dtype == I8 else vec.astype(np.float32)
+        name = "f32" if proj == PROJ_NONE else f"rp{dims}-{_DTYPE_LABELS[dtype]}"
+        return Decoded(vec, proj, name)
+    # legacy: headerless float32
+    if len(blob) % 4:
+        return None
+    vec = np.frombuffer(blob, dtype=np.float32)
+    return Decoded(vec, PROJ_NONE, "raw") if vec.size else None
+
+
+# ---------------------------------------------------------
+# Current format (set from app config)
+# ---------------------------------------------------------
+_current = parse_format(DEFAULT_FORMAT)
+
+
+def set_current_format(name: str) -> None:
+    global _current
+    _current = parse_format(name)
+
+
+def current_format() -> EmbeddingFormat:
+    return _current
+
+
+def to_current(raw: np.ndarray) -> np.ndarray:
+    """A fresh (raw) probe, in the current format's matching space."""
+    return project(raw, _current)
+
+
+def decode_current(blob: bytes | None) -> np.ndarray | None:
+    """A stored blob as a vector in the current format's space, or None if incompatible."""
+    d = decode(blob)
+    if d is None:
+        return None
+    if d.projection == _current.projection and d.vec.size == _current.dims:
+        return d.vec
+    if d.projection == PROJ_NONE and d.vec.size == RAW_DIM:
+        return project(d.vec, _current)
+    return None
+
+
+def encode_current(raw: np.ndarray) -> bytes:
+    return encode(raw, _current)
@@ -0,0 +1,288 @@
+# app/face_utils/engine.py
+"""
+Embedding engine: runs the CPU-heavy pipeline (decode, Haar detection, resize,
+normalization) in a pool of worker processes instead of the Flask request
+thread.
+
+- nothing imports OpenCV until the pool starts (first submission or
+  ``start()`` from the app's warmup hook); each worker then imports the
+  pipeline and loads the Haar cascade once, in its initializer, and can
+  optionally run a warmup image through it
+- submissions are bounded: once ``max_pending`` tasks are queued or running,
+  new ones are rejected with ``EngineBusy`` instead of piling up
+- callers wait with a timeout (``EngineTimeout``)
+- per-task queue wait and run time are tracked and exposed via ``stats()``
+
+``workers=0`` runs tasks inline in the calling thread (handy for the dev
+server and for debugging); everything else behaves the same.
+"""
+from __future__ import annotations
+
+import atexit
+import importlib
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from app import metrics
+
+
+class EngineBusy(RuntimeError):
+    """Too many embedding tasks are already queued."""
+
+
+class EngineTimeout(TimeoutError):
+    """An embedding task did not finish in time."""
+
+
+# Entry points workers may run, by task name: (module in app.face_utils, function)
+_TASKS = {
+    "image": ("pipeline", "get_image_embedding"),
+    "image_checked": ("pipeline", "get_checked_image_embedding"),
+    "group": ("pipeline", "get_image_embeddings"),
+    "video": ("video", "track_video"),
+}
+
+
+def _warmup_pipeline() -> None:
+    import numpy as np
+    from app.face_utils import pipeline
+
+    img = np.full((240, 320, 3), 127, dtype=np.uint8)
+    pipeline._preprocess(img)
+
+
+def _worker_init(warmup: bool) -> None:
+    # Load OpenCV and the Haar cascade once per worker process, before the first task
+    from app.face_utils import pipeline
+
+    pipeline._cascade()
+
+    if warmup:
+        _warmup_pipeline()
+
+
+def _run_task(task: str, payload):
+    module, func = _TASKS[task]
+    fn = getattr(importlib.import_module(f"app.face_utils.{module}"), func)
+
+    started = time.time()
+    t0 = time.perf_counter()
+    # stage timings ride back with the result; the parent process observes them
+    metrics.start_recording()
+    try:
+        result = fn(payload)
+    finally:
+        stages = metrics.stop_recording()
+    return result, started, time.perf_counter() - t0, stages
+
+
+def _noop() -> None:
+    return None
+
+
+class _Timing:
+    """Running count / total / max for one timing series (seconds)."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, v: float) -> None:
+        self.count += 1
+        self.total += v
+        if v > self.max:
+            self.max = v
+
+    def as_dict(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "avg_ms": round(avg * 1000, 3), "max_ms": round(self.max * 1000, 3)}
+
+
+class EmbeddingEngine:
+    def __init__(self, workers: int = 2, max_pending: int = 32, timeout: float = 10.0,
+                 warmup: bool = True, start_method: str = "spawn"):
+        self.workers = max(0, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.timeout = float(timeout)
+        self.warmup = bool(warmup)
+        self.start_method = start_method
+
+        self._lock = threading.Lock()
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "poor_quality": 0, "rejected": 0,
+                        "timeouts": 0}
+        self._wait = _Timing()
+        self._run = _Timing()
+        self._started_at: float | None = None
+        self._warmup_s: float | None = None
+
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+    def start(self) -> "EmbeddingEngine":
+        """Spawn the pool (and warm every worker up) if it is not running yet."""
+        with self._lock:
+            if self._started_at is not None and (self._executor is not None or self.workers == 0):
+                return self
+            t0 = time.perf_counter()
+            if self.workers == 0:
+                if self.warmup:
+                    _warmup_pipeline()
+            else:
+                ctx = multiprocessing.get_context(self.start_method)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                                     initializer=_worker_init, initargs=(self.warmup,))
+                if self.warmup:
+                    # workers are spawned on demand; force all of them up now
+                    for f in [self._executor.submit(_noop) for _ in range(self.workers)]:
+                        f.result()
+            self._warmup_s = time.perf_counter() - t0
+            self._started_at = time.time()
+        return self
+
+    def shutdown(self) -> None:
+        with self._lock:
+            ex, self._executor = self._executor, None
+            self._started_at = None
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    # ---------------------------------------------------------
+    # Submission
+    # ---------------------------------------------------------
+    def _drop_broken(self, executor: ProcessPoolExecutor) -> None:
+        # every future of a broken pool lands here; only drop the pool that broke,
+        # not one a later submission has already started in its place
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self._started_at = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, fut: Future, task: str, submitted_at: float,
+                 executor: ProcessPoolExecutor | None = None) -> None:
+        with self._lock:
+            self._pending -= 1
+            if fut.cancelled():
+                return
+            exc = fut.exception()
+            if exc is not None:
+                # quality-gate rejections are answers, not failures (see quality.PoorQuality)
+                outcome = getattr(exc, "outcome", "failed")
+                self._counts[outcome] = self._counts.get(outcome, 0) + 1
+            else:
+                _, started, run_s, stages = fut.result()
+                wait_s = max(0.0, started - submitted_at)
+                self._counts["completed"] += 1
+                self._wait.add(wait_s)
+                self._run.add(run_s)
+        if exc is not None:
+            metrics.EMBED_TASKS.inc(task=task, outcome=outcome)
+            if isinstance(exc, BrokenProcessPool) and executor is not None:
+                self._drop_broken(executor)
+            return
+        metrics.EMBED_TASKS.inc(task=task, outcome="completed")
+        metrics.EMBED_QUEUE_WAIT_SECONDS.observe(wait_s, task=task)
+        metrics.EMBED_RUN_SECONDS.observe(run_s, task=task)
+        metrics.observe_stages(stages)
+
+    def submit(self, task: str, payload) -> Future:
+        """Queue ``task`` and return a future of ``(result, started, run_s, stage_timings)``."""
+        if task not in _TASKS:
+            raise ValueError(f"unknown embedding task: {task}")
+        self.start()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._counts["rejected"] += 1
+                raise EngineBusy("Face engine is busy, please retry in a moment.")
+            self._pending += 1
+            self._counts["submitted"] += 1
+            executor = self._executor
+        submitted_at = time.time()
+        if executor is None:
+            fut = Future()
+            try:
+                fut.set_result(_run_task(task, payload))
+            except Exception as e:
+                fut.set_exception(e)
+        else:
+            try:
+                fut = executor.submit(_run_task, task, payload)
+            except Exception as e:
+                with self._lock:
+                    self._pending -= 1
+                if isinstance(e, BrokenProcessPool):
+                    self._drop_broken(executor)
+                raise
+        fut.add_done_callback(lambda f: self._release(f, task, submitted_at, executor))
+        return fut
+
+    def result(self, fut: Future, timeout: float | None = None):
+        """Wait for a future from ``submit`` and unwrap the pipeline result."""
+        try:
+            result, _, _, _ = fut.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            fut.cancel()
+            with self._lock:
+                self._counts["timeouts"] += 1
+            raise EngineTimeout("Face processing timed out, please try again.")
+        return result
+
+    def run(self, task: str, payload, timeout: float | None = None):
+        return self.result(self.submit(task, payload), timeout)
+
+    def embed_image(self, file_bytes: bytes):
+        return self.run("image", file_bytes)
+
+    def embed_faces(self, file_bytes: bytes):
+        return self.run("group", file_bytes)
+
+    # ---------------------------------------------------------
+    # Introspection
+    # ---------------------------------------------------------
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "mode": "inline" if self.workers == 0 else f"process-pool/{self.start_method}",
+                "running": self._started_at is not None,
+                "warmup": self.warmup,
+                "warmup_ms": round(self._warmup_s * 1000, 3) if self._warmup_s is not None else None,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "timeout_s": self.timeout,
+                **self._counts,
+                "queue_wait": self._wait.as_dict(),
+                "run": self._run.as_dict(),
+            }
+
+
+def init_engine(app) -> EmbeddingEngine:
+    """Create the app's engine from config; the pool itself starts on first use."""
+    engine = EmbeddingEngine(
+        workers=app.config["FACE_ENGINE_WORKERS"],
+        max_pending=app.config["FACE_ENGINE_MAX_PENDING"],
+        timeout=app.config["FACE_ENGINE_TIMEOUT"],
+        warmup=app.config["FACE_ENGINE_WARMUP"],
+    )
+    app.extensions["face_engine"] = engine
+    atexit.register(engine.shutdown)
+    return engine
+
+
+def get_engine() -> EmbeddingEngine:
+    from flask import current_app
+
+    return current_app.extensions["face_engine"]
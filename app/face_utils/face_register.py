@@ -1,21 +1,20 @@
 import cv2
+from app.face_utils.camera import get_capture_service
 
 def register_face_image(username, save_path='registered_faces/'):
     """
     Captures a single face image using webcam and saves it as a binary.
     Returns the image bytes if successful.
     """
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("Error: Webcam not accessible.")
-        return None
+    service = get_capture_service()
+    image_bytes = None
 
     print("Press 's' to capture face, or 'q' to quit.")
 
     while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Failed to capture frame.")
+        frame = service.latest()
+        if frame is None:
+            print("Error: Webcam not accessible.")
             break
 
         cv2.imshow("Register Face - Press 's' to save", frame)
@@ -33,6 +32,5 @@ def register_face_image(username, save_path='registered_faces/'):
             image_bytes = None
             break
 
-    cap.release()
     cv2.destroyAllWindows()
     return image_bytes
@@ -0,0 +1,287 @@
+# app/face_utils/gallery.py
+"""
+In-memory 1:N face gallery.
+
+All registered face templates live in one contiguous float32 matrix (one row
+per template, rows L2-normalized, several rows per user allowed), so
+identifying a probe is a single matrix product followed by a per-user fusion
+(``max`` or ``mean`` over that user's templates, see ``matcher``) and a top-k
+``argpartition`` - no per-row Python loop.
+
+The matrix grows geometrically, so registrations are amortized O(1) and the
+gallery never has to be rebuilt from the database on the request path: load it
+once at startup and keep it in sync with ``add`` / ``remove_template`` /
+``remove_user``.
+
+Note: each process keeps its own copy. With several worker processes a
+registration is only visible in the worker that handled it until the others
+reload. ``GALLERY_BACKEND=mmap`` swaps in ``gallery_store.GalleryStore``, one
+memory-mapped copy shared by every process; ``get_gallery`` returns whichever
+the app is configured with.
+"""
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+
+from app.face_utils.matcher import DEFAULT_FUSION, check_fusion
+from app.metrics import stage
+
+_MIN_CAPACITY = 64
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def group_rows(owners: np.ndarray):
+    """(order, starts, user_ids, counts): rows sorted by owner, for reduceat fusion."""
+    order = np.argsort(owners, kind="stable")
+    users, starts, counts = np.unique(owners[order], return_index=True, return_counts=True)
+    return order, starts, users, counts
+
+
+def fuse_top_k(scores: np.ndarray, grouping, k: int, fusion: str) -> list[list[tuple[int, float]]]:
+    """Per-row cosines (M, rows) -> top-k ``(user_id, fused score)`` per probe, best first."""
+    order, starts, ids, counts = grouping
+    m = scores.shape[0]
+    if ids.size == 0:
+        return [[] for _ in range(m)]
+    if ids.size == scores.shape[1]:
+        # one template per user: nothing to fuse
+        scores = scores[:, order]
+    elif fusion == "max":
+        scores = np.maximum.reduceat(scores[:, order], starts, axis=1)
+    else:
+        scores = np.add.reduceat(scores[:, order], starts, axis=1) / counts
+    n = ids.size
+    k = max(1, min(int(k), n))
+    if k < n:
+        top = np.argpartition(scores, n - k, axis=1)[:, n - k:]
+    else:
+        top = np.broadcast_to(np.arange(n), (m, n))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    rank = np.argsort(top_scores, axis=1)[:, ::-1]
+    top = np.take_along_axis(top, rank, axis=1)
+    top_scores = np.take_along_axis(top_scores, rank, axis=1)
+    return [[(int(ids[j]), float(sc)) for j, sc in zip(row_idx, row_sc)]
+            for row_idx, row_sc in zip(top, top_scores)]
+
+
+class FaceGallery:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dim: int | None = None
+        self._mat = np.empty((0, 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)      # template id per row
+        self._owners = np.empty(0, dtype=np.int64)   # user id per row
+        self._size = 0
+        self._row_of: dict[int, int] = {}
+        self._groups = None  # cached per-user grouping of rows, see _grouping()
+        self.loaded = False  # set by load(); the app fills the gallery on first use
+
+    # ---------------------------------------------------------
+    # Bookkeeping
+    # ---------------------------------------------------------
+    def __len__(self) -> int:
+        """Number of templates (rows), not users."""
+        return self._size
+
+    @property
+    def dim(self) -> int | None:
+        return self._dim
+
+    @property
+    def user_count(self) -> int:
+        with self._lock:
+            return int(np.unique(self._owners[: self._size]).size)
+
+    def __contains__(self, user_id: int) -> bool:
+        with self._lock:
+            return bool(np.any(self._owners[: self._size] == int(user_id)))
+
+    def _reserve(self, n: int) -> None:
+        cap = self._mat.shape[0]
+        if n <= cap:
+            return
+        new_cap = max(_MIN_CAPACITY, cap * 2, n)
+        mat = np.zeros((new_cap, self._dim), dtype=np.float32)
+        ids = np.full(new_cap, -1, dtype=np.int64)
+        owners = np.full(new_cap, -1, dtype=np.int64)
+        mat[: self._size] = self._mat[: self._size]
+        ids[: self._size] = self._ids[: self._size]
+        owners[: self._size] = self._owners[: self._size]
+        self._mat, self._ids, self._owners = mat, ids, owners
+
+    def _reset(self, dim: int | None) -> None:
+        self._dim = dim
+        self._size = 0
+        self._row_of = {}
+        self._groups = None
+        self._mat = np.empty((0, dim or 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._owners = np.empty(0, dtype=np.int64)
+
+    def _grouping(self):
+        """(order, starts, user_ids, counts): rows sorted by owner, for reduceat fusion."""
+        if self._groups is None:
+            self._groups = group_rows(self._owners[: self._size])
+        return self._groups
+
+    # ---------------------------------------------------------
+    # Mutation
+    # ---------------------------------------------------------
+    def load(self, rows) -> int:
+        """Replace the gallery with ``(template_id, user_id, vector)`` rows. Returns rows loaded.
+
+        Vectors whose size differs from the first one are skipped.
+        """
+        tids: list[int] = []
+        uids: list[int] = []
+        vecs: list[np.ndarray] = []
+        dim = None
+        for template_id, user_id, vec in rows:
+            if vec is None:
+                continue
+            vec = np.asarray(vec, dtype=np.float32).ravel()
+            if dim is None:
+                dim = vec.size
+            if vec.size != dim or vec.size == 0:
+                continue
+            tids.append(int(template_id))
+            uids.append(int(user_id))
+            vecs.append(vec)
+
+        with self._lock:
+            self._reset(dim)
+            self.loaded = True
+            if not vecs:
+                return 0
+            mat = _normalize_rows(np.vstack(vecs).astype(np.float32, copy=False))
+            self._reserve(len(tids))
+            # later duplicates win, like repeated adds would
+            for row_src, (template_id, user_id) in enumerate(zip(tids, uids)):
+                row = self._row_of.get(template_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._row_of[template_id] = row
+                    self._ids[row] = template_id
+                self._owners[row] = user_id
+                self._mat[row] = mat[row_src]
+            return self._size
+
+    def add(self, template_id: int, user_id: int, vec: np.ndarray) -> None:
+        """Insert (or replace) one template."""
+        vec = np.asarray(vec, dtype=np.float32).ravel()
+        n = float(np.linalg.norm(vec))
+        if n > 0:
+            vec = vec / n
+        template_id, user_id = int(template_id), int(user_id)
+        with self._lock:
+            if self._dim is None or self._size == 0:
+                self._reset(vec.size)
+            if vec.size != self._dim:
+                raise ValueError(f"embedding has {vec.size} dims, gallery expects {self._dim}")
+            row = self._row_of.get(template_id)
+            if row is None:
+                self._reserve(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._row_of[template_id] = row
+                self._ids[row] = template_id
+            self._owners[row] = user_id
+            self._mat[row] = vec
+            self._groups = None
+
+    def remove_template(self, template_id: int) -> bool:
+        """Drop one template; the last row is swapped into the hole to stay contiguous."""
+        template_id = int(template_id)
+        with self._lock:
+            row = self._row_of.pop(template_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                moved = int(self._ids[last])
+                self._mat[row] = self._mat[last]
+                self._ids[row] = moved
+                self._owners[row] = self._owners[last]
+                self._row_of[moved] = row
+            self._ids[last] = -1
+            self._owners[last] = -1
+            self._size = last
+            self._groups = None
+            return True
+
+    def remove_user(self, user_id: int) -> int:
+        """Drop every template of a user. Returns how many were removed."""
+        with self._lock:
+            rows = np.flatnonzero(self._owners[: self._size] == int(user_id))
+            tids = [int(t) for t in self._ids[rows]]
+            for t in tids:
+                self.remove_template(t)
+            return len(tids)
+
+    # ---------------------------------------------------------
+    # Matching
+    # ---------------------------------------------------------
+    def search(self, probe: np.ndarray, k: int = 1, fusion: str = DEFAULT_FUSION) -> list[tuple[int, float]]:
+        """Top-k ``(user_id, fused cosine)`` for one probe, best first."""
+        probe = np.asarray(probe, dtype=np.float32).ravel()
+        if not probe.any():
+            return []
+        return self.search_many(probe[None, :], k=k, fusion=fusion)[0]
+
+    def search_many(self, probes: np.ndarray, k: int = 1,
+                    fusion: str = DEFAULT_FUSION) -> list[list[tuple[int, float]]]:
+        """Top-k users for a batch of probes (M, D) with one matrix-matrix product."""
+        check_fusion(fusion)
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        m = probes.shape[0]
+        with self._lock:
+            size = self._size
+            if size == 0 or m == 0 or probes.shape[1] != self._dim:
+                return [[] for _ in range(m)]
+            with stage("match"):
+                scores = _normalize_rows(probes) @ self._mat[:size].T
+                grouping = self._grouping()
+        return fuse_top_k(scores, grouping, k, fusion)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "templates": self._size, "users": self.user_count, "dim": self._dim}
+
+
+# Process-wide gallery used by the recognition routes (GALLERY_BACKEND=memory)
+gallery = FaceGallery()
+
+
+GALLERY_BACKENDS = ("memory", "mmap")
+
+
+def init_gallery(app):
+    """Pick the gallery for this app: the in-process one, or the shared on-disk store."""
+    backend = app.config["GALLERY_BACKEND"]
+    if backend not in GALLERY_BACKENDS:
+        raise ValueError(f"unknown GALLERY_BACKEND: {backend!r} (expected one of {GALLERY_BACKENDS})")
+    if backend == "mmap":
+        from app.face_utils.gallery_store import store_from_config
+
+        store = store_from_config(app.config, app.instance_path)
+        app.extensions["face_gallery"] = store
+        return store
+    app.extensions["face_gallery"] = gallery
+    return gallery
+
+
+def get_gallery():
+    from flask import current_app
+
+    return current_app.extensions.get("face_gallery", gallery)
+
@@ -0,0 +1,500 @@
+# app/face_utils/gallery_store.py
+"""
+On-disk 1:N gallery shared by every worker process (``GALLERY_BACKEND=mmap``).
+
+``FaceGallery`` keeps a private copy of every template in each process, so N
+workers hold N copies of the same matrix. This store keeps one copy in files
+that every process memory-maps (shared mappings): the OS page cache holds the
+vectors once, and a registration made in one worker is visible to the others
+on their next search.
+
+Layout of ``GALLERY_PATH``::
+
+    CURRENT            int64 generation number, mapped by every process
+    lock               writers serialize on flock() of this file
+    g<generation>/
+        meta.json      format, dims, list offsets
+        centroids.npy  (nlist, dims) coarse k-means centroids
+        vectors.f32    (capacity, dims) L2-normalized rows
+        ids.i64        template id per row (-1 = removed)
+        owners.i64     user id per row     (-1 = removed)
+        state.i64      [count, tombstones]
+
+IVF partitioning: rows ``[0, n_main)`` are grouped by nearest centroid, so
+list ``c`` is the contiguous slice ``offsets[c]:offsets[c + 1]``. A probe is
+scored against the centroids first and only its ``nprobe`` closest lists are
+scanned, each as a zero-copy slice of the map. Galleries smaller than
+``IVF_MIN_ROWS`` get a single list, i.e. an exhaustive scan. A user's
+templates in lists that were not probed do not take part in fusion; they sit
+close together, so they rarely straddle lists.
+
+Registrations append to the unsorted tail ``[n_main, count)``, which every
+search scans in full, and removals tombstone their row in place. ``compact``
+drops the tombstones, re-clusters and folds the tail into the lists by
+writing a new generation and switching ``CURRENT``; other processes notice
+the switch on their next call and reopen (see ``tools/build_gallery.py``).
+
+The store is derived data: face_templates stays the source of truth.
+``sync_marker`` lets a process that attaches to an existing store detect
+out-of-band changes (batch enrollment, migrations) and rebuild it.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.face_utils.embedding_format import current_format
+from app.face_utils.gallery import _normalize_rows, fuse_top_k, group_rows
+from app.face_utils.matcher import DEFAULT_FUSION, check_fusion
+from app.metrics import stage
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+STORE_VERSION = 1
+# Below this many rows one exhaustive list beats centroid lookups
+IVF_MIN_ROWS = 2048
+KMEANS_ITERS = 12
+# k-means trains on at most this many rows per list
+KMEANS_SAMPLE_PER_LIST = 64
+# Free tail rows reserved at build time; the files double when it fills up
+TAIL_MIN_CAPACITY = 1024
+# needs_compaction once tail rows + tombstones exceed this share of the lists
+COMPACT_FRACTION = 0.2
+_ASSIGN_CHUNK = 8192
+
+
+def auto_nlist(n: int) -> int:
+    return 1 if n < IVF_MIN_ROWS else int(round(np.sqrt(n)))
+
+
+# ---------------------------------------------------------
+# Clustering
+# ---------------------------------------------------------
+def assign_lists(vecs: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by cosine) of every row, in chunks to bound memory."""
+    out = np.empty(len(vecs), dtype=np.int64)
+    for start in range(0, len(vecs), _ASSIGN_CHUNK):
+        out[start:start + _ASSIGN_CHUNK] = np.argmax(vecs[start:start + _ASSIGN_CHUNK] @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(vecs: np.ndarray, nlist: int, seed: int = 0, iters: int = KMEANS_ITERS) -> np.ndarray:
+    """Spherical k-means on a sample of ``vecs`` (L2-normalized rows)."""
+    rng = np.random.default_rng(seed)
+    sample = vecs[np.sort(rng.choice(len(vecs), min(len(vecs), nlist * KMEANS_SAMPLE_PER_LIST), replace=False))]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = assign_lists(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        lists, starts = np.unique(assign[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[lists] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = np.setdiff1d(np.arange(nlist), lists)
+        if empty.size:
+            # restart empty lists from random rows
+            sums[empty] = sample[rng.choice(len(sample), empty.size, replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids.astype(np.float32, copy=False)
+
+
+# ---------------------------------------------------------
+# Store
+# ---------------------------------------------------------
+class GalleryStore:
+    """Memory-mapped gallery with the ``FaceGallery`` interface, plus ``open`` / ``compact``."""
+
+    def __init__(self, path: str, nlist: int = 0, nprobe: int = 8):
+        self.path = path
+        self.nlist = nlist       # 0 = auto_nlist() at build time
+        self.nprobe = nprobe
+        self.loaded = False      # attached to a usable generation
+        self._lock = threading.RLock()
+        self._writer_depth = 0
+        self._lock_fd: int | None = None
+        self._current = None     # mapped CURRENT
+        self._gen = -1
+        self._meta: dict = {}
+        self._detach()
+
+    # ---------------------------------------------------------
+    # Files
+    # ---------------------------------------------------------
+    def _gen_dir(self, gen: int) -> str:
+        return os.path.join(self.path, f"g{gen}")
+
+    def _detach(self) -> None:
+        self._gen = -1
+        self._meta = {}
+        self._centroids = np.empty((0, 0), dtype=np.float32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._owners = np.empty(0, dtype=np.int64)
+        self._state = np.zeros(2, dtype=np.int64)
+        self._capacity = 0
+
+    def _map_rows(self) -> None:
+        d, dims = self._gen_dir(self._gen), self._meta["dims"]
+        self._capacity = os.path.getsize(os.path.join(d, "ids.i64")) // 8
+        self._vectors = np.memmap(os.path.join(d, "vectors.f32"), dtype=np.float32, mode="r+",
+                                  shape=(self._capacity, dims))
+        self._ids = np.memmap(os.path.join(d, "ids.i64"), dtype=np.int64, mode="r+", shape=(self._capacity,))
+        self._owners = np.memmap(os.path.join(d, "owners.i64"), dtype=np.int64, mode="r+", shape=(self._capacity,))
+
+    def _attach(self) -> bool:
+        """Map the generation named by CURRENT; False if the store has not been built."""
+        current = os.path.join(self.path, "CURRENT")
+        if self._current is None:
+            if not os.path.exists(current):
+                return False
+            self._current = np.memmap(current, dtype=np.int64, mode="r+", shape=(1,))
+        for _ in range(3):
+            gen = int(self._current[0])
+            d = self._gen_dir(gen)
+            try:
+                with open(os.path.join(d, "meta.json")) as f:
+                    self._meta = json.load(f)
+                self._gen = gen
+                self._centroids = np.load(os.path.join(d, "centroids.npy"))
+                self._offsets = np.asarray(self._meta["offsets"], dtype=np.int64)
+                self._state = np.memmap(os.path.join(d, "state.i64"), dtype=np.int64, mode="r+", shape=(2,))
+                self._map_rows()
+                return True
+            except FileNotFoundError:
+                # compacted away between reading CURRENT and opening it; read CURRENT again
+                continue
+        self._detach()
+        return False
+
+    def _refresh(self) -> None:
+        """Follow a generation switch or a grown file made by another process."""
+        if self._current is None:
+            if not self._attach():
+                return
+        elif int(self._current[0]) != self._gen:
+            self._attach()
+        elif int(self._state[0]) > self._capacity:
+            self._map_rows()
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the store's writer lock (re-entrant within this process)."""
+        with self._lock:
+            if self._writer_depth == 0 and fcntl is not None:
+                os.makedirs(self.path, exist_ok=True)
+                self._lock_fd = os.open(os.path.join(self.path, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._writer_depth += 1
+            try:
+                self._refresh()
+                yield
+            finally:
+                self._writer_depth -= 1
+                if self._writer_depth == 0 and self._lock_fd is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+                    os.close(self._lock_fd)
+                    self._lock_fd = None
+
+    # ---------------------------------------------------------
+    # Building
+    # ---------------------------------------------------------
+    def _write_generation(self, tids: np.ndarray, uids: np.ndarray, mat: np.ndarray, dims: int,
+                          skipped: tuple[int, int | None]) -> int:
+        """Cluster and write a new generation, then switch CURRENT to it (writer lock held)."""
+        n = len(tids)
+        nlist = max(1, min(self.nlist or auto_nlist(n), n))
+        if nlist > 1:
+            centroids = train_centroids(mat, nlist)
+            assign = assign_lists(mat, centroids)
+            order = np.argsort(assign, kind="stable")
+            offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        else:
+            centroids = np.zeros((1, dims), dtype=np.float32)
+            order = np.arange(n)
+            offsets = np.array([0, n])
+        capacity = n + max(TAIL_MIN_CAPACITY, n // 4)
+
+        gen = (int(self._current[0]) if self._current is not None else 0) + 1
+        final = self._gen_dir(gen)
+        tmp = final + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        vectors = np.memmap(os.path.join(tmp, "vectors.f32"), dtype=np.float32, mode="w+", shape=(capacity, dims))
+        vectors[:n] = mat[order]
+        for name, values in (("ids.i64", tids), ("owners.i64", uids)):
+            col = np.memmap(os.path.join(tmp, name), dtype=np.int64, mode="w+", shape=(capacity,))
+            col[:] = -1
+            col[:n] = values[order]
+            col.flush()
+        vectors.flush()
+        del vectors
+        np.array([n, 0], dtype=np.int64).tofile(os.path.join(tmp, "state.i64"))
+        np.save(os.path.join(tmp, "centroids.npy"), centroids)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"version": STORE_VERSION, "format": current_format().name, "dims": dims,
+                       "nlist": nlist, "n_main": n, "offsets": [int(o) for o in offsets],
+                       "skipped": skipped[0], "skipped_max_id": skipped[1]}, f)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+
+        current = os.path.join(self.path, "CURRENT")
+        if self._current is None:
+            np.array([gen], dtype=np.int64).tofile(current)
+            self._current = np.memmap(current, dtype=np.int64, mode="r+", shape=(1,))
+        else:
+            self._current[0] = gen
+            self._current.flush()
+        self._attach()
+        for name in os.listdir(self.path):
+            if name.startswith("g") and name != f"g{gen}":
+                # processes still on an old generation keep their maps until they reattach
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        self.loaded = True
+        return n
+
+    def load(self, rows) -> int:
+        """Rebuild from ``(template_id, user_id, vector)`` rows. Returns rows stored.
+
+        Vectors whose size differs from the current embedding format are skipped
+        (and counted, so ``sync_marker`` still lines up with the source rows); a
+        template id repeated later wins, as in ``FaceGallery.load``.
+        """
+        dims = current_format().dims
+        latest: dict[int, int] = {}
+        uids: list[int] = []
+        vecs: list[np.ndarray] = []
+        skipped, skipped_max = 0, None
+        for template_id, user_id, vec in rows:
+            vec = None if vec is None else np.asarray(vec, dtype=np.float32).ravel()
+            if vec is None or vec.size != dims:
+                skipped += 1
+                skipped_max = max(int(template_id), skipped_max or 0)
+                continue
+            latest[int(template_id)] = len(vecs)
+            uids.append(int(user_id))
+            vecs.append(vec)
+        keep = np.fromiter(latest.values(), dtype=np.int64, count=len(latest))
+        tids = np.fromiter(latest.keys(), dtype=np.int64, count=len(latest))
+        mat = (_normalize_rows(np.vstack(vecs)[keep].astype(np.float32, copy=False)) if vecs
+               else np.empty((0, dims), dtype=np.float32))
+        with self.exclusive():
+            return self._write_generation(tids, np.asarray(uids, dtype=np.int64)[keep], mat, dims,
+                                          (skipped, skipped_max))
+
+    def compact(self) -> dict:
+        """Drop tombstones, re-cluster and fold the tail into the lists."""
+        with self.exclusive():
+            if self._gen < 0:
+                raise RuntimeError(f"no gallery store at {self.path}; build it first")
+            count = int(self._state[0])
+            live = np.flatnonzero(self._owners[:count] >= 0)
+            before = self.stats()
+            self._write_generation(np.asarray(self._ids[live]), np.asarray(self._owners[live]),
+                                   np.asarray(self._vectors[live]), self._meta["dims"],
+                                   (self._meta.get("skipped", 0), self._meta.get("skipped_max_id")))
+            return {"before": before, "after": self.stats()}
+
+    def open(self, expected: tuple[int, int | None] | None = None) -> bool:
+        """Attach to the built store. False if it is missing, in another embedding
+        format, or its ``sync_marker`` differs from ``expected``."""
+        with self._lock:
+            self._refresh()
+            if self._gen < 0 or self._meta.get("version") != STORE_VERSION:
+                return False
+            if self._meta["format"] != current_format().name or self._meta["dims"] != current_format().dims:
+                return False
+            if expected is not None and self.sync_marker() != tuple(expected):
+                return False
+            self.loaded = True
+            return True
+
+    # ---------------------------------------------------------
+    # Bookkeeping
+    # ---------------------------------------------------------
+    def _live_owners(self) -> np.ndarray:
+        owners = self._owners[: int(self._state[0])]
+        return owners[owners >= 0]
+
+    def sync_marker(self) -> tuple[int, int | None]:
+        """(template count, highest template id) as face_templates should report them:
+        live rows plus the rows skipped at build time."""
+        with self._lock:
+            self._refresh()
+            ids = self._ids[: int(self._state[0])]
+            ids = ids[ids >= 0]
+            top = [int(ids.max())] if ids.size else []
+            if self._meta.get("skipped_max_id") is not None:
+                top.append(self._meta["skipped_max_id"])
+            return int(ids.size) + self._meta.get("skipped", 0), (max(top) if top else None)
+
+    def __len__(self) -> int:
+        """Number of live templates (rows), not users."""
+        with self._lock:
+            self._refresh()
+            return int(self._state[0] - self._state[1])
+
+    @property
+    def dim(self) -> int | None:
+        return self._meta.get("dims")
+
+    @property
+    def user_count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(np.unique(self._live_owners()).size)
+
+    def __contains__(self, user_id: int) -> bool:
+        with self._lock:
+            self._refresh()
+            return bool(np.any(self._live_owners() == int(user_id)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            count, tombstones = (int(v) for v in self._state)
+            n_main = int(self._meta.get("n_main", 0))
+            churn = (count - n_main) + tombstones
+            return {
+                "backend": "mmap", "path": self.path, "generation": self._gen,
+                "templates": count - tombstones, "users": int(np.unique(self._live_owners()).size),
+                "dim": self.dim, "nlist": int(self._meta.get("nlist", 0)), "nprobe": self.nprobe,
+                "listed": n_main, "tail": count - n_main, "tombstones": tombstones, "capacity": self._capacity,
+                "needs_compaction": churn > COMPACT_FRACTION * max(n_main, IVF_MIN_ROWS),
+                "file_mb": round(self._capacity * ((self.dim or 0) * 4 + 16) / 1e6, 1),
+            }
+
+    # ---------------------------------------------------------
+    # Mutation
+    # ---------------------------------------------------------
+    def _grow(self) -> None:
+        new_cap = self._capacity + max(TAIL_MIN_CAPACITY, self._capacity)
+        d, dims = self._gen_dir(self._gen), self._meta["dims"]
+        for name, row_bytes in (("vectors.f32", dims * 4), ("ids.i64", 8), ("owners.i64", 8)):
+            with open(os.path.join(d, name), "r+b") as f:
+                f.truncate(new_cap * row_bytes)
+        # rows past count are never read, so the zero-filled extension needs no init;
+        # other processes remap once they see count pass their capacity
+        self._map_rows()
+
+    def _tombstone(self, rows: np.ndarray) -> int:
+        if rows.size:
+            self._ids[rows] = -1
+            self._owners[rows] = -1
+            self._state[1] += rows.size
+        return int(rows.size)
+
+    def _require_attached(self) -> None:
+        if self._gen < 0:
+            raise RuntimeError(f"no gallery store at {self.path}; load() or build it first")
+
+    def add(self, template_id: int, user_id: int, vec: np.ndarray) -> None:
+        """Insert (or replace) one template by appending it to the tail."""
+        vec = np.asarray(vec, dtype=np.float32).ravel()
+        n = float(np.linalg.norm(vec))
+        if n > 0:
+            vec = vec / n
+        template_id, user_id = int(template_id), int(user_id)
+        with self.exclusive():
+            self._require_attached()
+            if vec.size != self.dim:
+                raise ValueError(f"embedding has {vec.size} dims, gallery expects {self.dim}")
+            count = int(self._state[0])
+            self._tombstone(np.flatnonzero(self._ids[:count] == template_id))
+            if count >= self._capacity:
+                self._grow()
+            self._vectors[count] = vec
+            self._ids[count] = template_id
+            self._owners[count] = user_id
+            # publish the row only once it is fully written
+            self._state[0] = count + 1
+
+    def remove_template(self, template_id: int) -> bool:
+        """Tombstone one template."""
+        with self.exclusive():
+            if self._gen < 0:
+                return False
+            count = int(self._state[0])
+            return self._tombstone(np.flatnonzero(self._ids[:count] == int(template_id))) > 0
+
+    def remove_user(self, user_id: int) -> int:
+        """Tombstone every template of a user. Returns how many were removed."""
+        with self.exclusive():
+            if self._gen < 0:
+                return 0
+            count = int(self._state[0])
+            return self._tombstone(np.flatnonzero(self._owners[:count] == int(user_id)))
+
+    # ---------------------------------------------------------
+    # Matching
+    # ---------------------------------------------------------
+    def _ranges(self, probes: np.ndarray, count: int) -> list[tuple[int, int]]:
+        """Row ranges to scan: the probed lists (merged where adjacent) and the tail."""
+        n_main = int(self._meta["n_main"])
+        nlist = len(self._offsets) - 1
+        if nlist <= 1 or self.nprobe >= nlist:
+            spans = [(0, n_main)]
+        else:
+            near = np.argpartition(probes @ self._centroids.T, nlist - self.nprobe, axis=1)[:, nlist - self.nprobe:]
+            spans = []
+            for c in np.unique(near):
+                start, end = int(self._offsets[c]), int(self._offsets[c + 1])
+                if start == end:
+                    continue
+                if spans and spans[-1][1] == start:
+                    spans[-1] = (spans[-1][0], end)
+                else:
+                    spans.append((start, end))
+            if sum(b - a for a, b in spans) > n_main // 2:
+                # a large batch touches most lists anyway: one contiguous pass is cheaper
+                spans = [(0, n_main)]
+        if count > n_main:
+            spans.append((n_main, count))
+        return [(a, b) for a, b in spans if b > a]
+
+    def search(self, probe: np.ndarray, k: int = 1, fusion: str = DEFAULT_FUSION) -> list[tuple[int, float]]:
+        """Top-k ``(user_id, fused cosine)`` for one probe, best first."""
+        probe = np.asarray(probe, dtype=np.float32).ravel()
+        if not probe.any():
+            return []
+        return self.search_many(probe[None, :], k=k, fusion=fusion)[0]
+
+    def search_many(self, probes: np.ndarray, k: int = 1,
+                    fusion: str = DEFAULT_FUSION) -> list[list[tuple[int, float]]]:
+        """Top-k users for a batch of probes (M, D); the batch shares one set of probed lists
+        (the union of each probe's ``nprobe`` nearest)."""
+        check_fusion(fusion)
+        probes = np.asarray(probes, dtype=np.float32)
+        if probes.ndim == 1:
+            probes = probes[None, :]
+        m = probes.shape[0]
+        with self._lock:
+            self._refresh()
+            count = int(self._state[0])
+            if self._gen < 0 or count == 0 or m == 0 or probes.shape[1] != self.dim:
+                return [[] for _ in range(m)]
+            with stage("match"):
+                probes = _normalize_rows(probes)
+                spans = self._ranges(probes, count)
+                if len(spans) == 1:
+                    (a, b), = spans
+                    scores, owners = probes @ self._vectors[a:b].T, np.asarray(self._owners[a:b])
+                else:
+                    scores = np.hstack([probes @ self._vectors[a:b].T for a, b in spans])
+                    owners = np.concatenate([self._owners[a:b] for a, b in spans])
+        live = owners >= 0
+        if not live.all():
+            scores, owners = scores[:, live], owners[live]
+        return fuse_top_k(scores, group_rows(owners), k, fusion)
+
+
+def store_from_config(config, instance_path: str) -> GalleryStore:
+    return GalleryStore(config["GALLERY_PATH"] or os.path.join(instance_path, "gallery"),
+                        nlist=config["GALLERY_NLIST"], nprobe=config["GALLERY_NPROBE"])
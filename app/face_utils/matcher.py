@@ -0,0 +1,50 @@
+# app/face_utils/matcher.py
+"""
+Score a probe against a user's face templates.
+
+A user can have several templates (different lighting, angles, days). The
+probe is compared with all of them in one matrix-vector product and the
+per-template cosines are fused into a single score:
+
+- ``max``:  best single template (tolerant of one bad enrollment photo)
+- ``mean``: average over templates (steadier when all templates are good)
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from app.metrics import stage
+
+FUSIONS = ("max", "mean")
+DEFAULT_FUSION = "max"
+
+
+def check_fusion(fusion: str) -> str:
+    if fusion not in FUSIONS:
+        raise ValueError(f"unknown template fusion: {fusion!r} (expected one of {FUSIONS})")
+    return fusion
+
+
+def template_scores(probe: np.ndarray, templates: np.ndarray) -> np.ndarray:
+    """Cosine of ``probe`` (D,) against every row of ``templates`` (T, D)."""
+    probe = np.asarray(probe, dtype=np.float32).ravel()
+    templates = np.asarray(templates, dtype=np.float32)
+    if templates.ndim == 1:
+        templates = templates[None, :]
+    if templates.shape[0] == 0 or templates.shape[1] != probe.size:
+        return np.empty(0, dtype=np.float32)
+    pn = float(np.linalg.norm(probe))
+    tn = np.linalg.norm(templates, axis=1)
+    tn[tn == 0] = 1.0
+    if pn == 0:
+        return np.full(templates.shape[0], -1.0, dtype=np.float32)
+    return (templates @ (probe / pn)) / tn
+
+
+def score_templates(probe: np.ndarray, templates: np.ndarray, fusion: str = DEFAULT_FUSION) -> float:
+    """Fused cosine of ``probe`` against one user's templates; -1.0 if none are comparable."""
+    with stage("match"):
+        scores = template_scores(probe, templates)
+    if scores.size == 0:
+        return -1.0
+    return float(scores.max() if check_fusion(fusion) == "max" else scores.mean())
@@ -4,63 +4,286 @@ Lightweight, dependency-free (beyond OpenCV+NumPy) "embedding" pipeline.
 
 This is NOT production-grade face recognition. It:
 - decodes an image
-- detects a face with Haar cascade (or center-crops if none found)
+- detects a face with Haar cascade (or center-crops if none found); by
+  default on a downscaled copy, with boxes mapped back to full resolution
+  (group photos are searched at full resolution for small faces)
 - normalizes a 96x96 grayscale crop
 - flattens to a vector and L2-normalizes
 
+For group photos, ``get_image_embeddings`` keeps every detection and
+normalizes all crops in one batched NumPy pass.
+
 Cosine similarity on these vectors is enough for a demo and for wiring up
 the rest of the app without extra heavy deps.
 """
 from __future__ import annotations
 
+import threading
+import time
+
 import cv2
 import numpy as np
 
-_FACE_CASCADE = cv2.CascadeClassifier(
-    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-)
+from app.face_utils import PIPELINE_VERSION  # noqa: F401  (re-exported)
+from app.face_utils import quality
+from app.face_utils.quality import PoorQuality, QualityThresholds
+from app.metrics import stage
 
-def _extract_face(gray: np.ndarray) -> np.ndarray:
-    faces = _FACE_CASCADE.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5)
+# Loaded on first detection (or by the engine's warmup), not at import
+_FACE_CASCADE: cv2.CascadeClassifier | None = None
+_cascade_lock = threading.Lock()
+
+def _cascade() -> cv2.CascadeClassifier:
+    global _FACE_CASCADE
+    if _FACE_CASCADE is None:
+        with _cascade_lock:
+            if _FACE_CASCADE is None:
+                _FACE_CASCADE = cv2.CascadeClassifier(
+                    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+                )
+    return _FACE_CASCADE
+
+# Detection tuning
+#   "fast": search a copy downscaled to DETECT_MAX_SIDE, map boxes back and crop
+#           from the original, so detection cost barely depends on upload size
+#   "full": search the full-resolution frame
+DETECT_MODE = "fast"
+DETECT_MAX_SIDE = 640
+DETECT_SCALE_FACTOR = 1.2
+DETECT_MIN_NEIGHBORS = 5
+# Face size limits as fractions of the frame's shorter side (single-face uploads and live frames)
+MIN_FACE_FRAC = 0.08
+MAX_FACE_FRAC = 1.0
+# Group photos are many small faces, not one that fills the frame: search the
+# full-resolution image with an absolute size floor instead
+GROUP_DETECT_MODE = "full"
+GROUP_MIN_FACE_PX = 32
+# A previous-face ROI is grown by this fraction of its size on every side
+ROI_MARGIN = 0.5
+# Haar's own minimum window
+_HAAR_MIN_PX = 24
+
+def _search(gray: np.ndarray, min_px: int, max_px: int, mode: str, max_side: int) -> np.ndarray:
+    h, w = gray.shape[:2]
+    scale = 1.0
+    small = gray
+    if mode == "fast" and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        small = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+    lo = max(_HAAR_MIN_PX, int(min_px * scale))
+    hi = max(lo + 1, int(max_px * scale))
+    faces = _cascade().detectMultiScale(small, scaleFactor=DETECT_SCALE_FACTOR,
+                                           minNeighbors=DETECT_MIN_NEIGHBORS,
+                                           minSize=(lo, lo), maxSize=(hi, hi))
+    if len(faces) == 0:
+        return np.empty((0, 4), dtype=np.int32)
+    boxes = np.asarray(faces, dtype=np.float64).reshape(-1, 4)
+    if scale != 1.0:
+        boxes = boxes / scale
+    boxes = np.rint(boxes).astype(np.int32)
+    # keep mapped boxes inside the original frame
+    boxes[:, 0] = np.clip(boxes[:, 0], 0, w - 1)
+    boxes[:, 1] = np.clip(boxes[:, 1], 0, h - 1)
+    boxes[:, 2] = np.minimum(boxes[:, 2], w - boxes[:, 0])
+    boxes[:, 3] = np.minimum(boxes[:, 3], h - boxes[:, 1])
+    return boxes
+
+def _detect_faces(gray: np.ndarray, roi: tuple[int, int, int, int] | None = None,
+                  mode: str | None = None, min_face: float = MIN_FACE_FRAC,
+                  max_face: float = MAX_FACE_FRAC, min_px: int | None = None,
+                  max_side: int = DETECT_MAX_SIDE) -> np.ndarray:
+    """All Haar detections as an (N, 4) int array of x, y, w, h, largest first.
+
+    ``roi`` (a previous face box) restricts the search to the area around it;
+    if nothing is found there the whole frame is searched. ``min_px`` is an
+    absolute minimum face size that replaces the ``min_face`` fraction, and
+    ``max_side`` is the size "fast" mode downscales to.
+    """
+    mode = mode or DETECT_MODE
+    h, w = gray.shape[:2]
+    short = min(h, w)
+    max_px = int(short * max_face)
+    min_px = int(short * min_face) if min_px is None else min_px
+
+    faces = np.empty((0, 4), dtype=np.int32)
+    if roi is not None:
+        rx, ry, rw, rh = (int(v) for v in roi)
+        mx, my = int(rw * ROI_MARGIN), int(rh * ROI_MARGIN)
+        x0, y0 = max(0, rx - mx), max(0, ry - my)
+        x1, y1 = min(w, rx + rw + mx), min(h, ry + rh + my)
+        if x1 - x0 >= _HAAR_MIN_PX and y1 - y0 >= _HAAR_MIN_PX:
+            faces = _search(gray[y0:y1, x0:x1], min_px, max_px, mode, max_side)
+            faces[:, 0] += x0
+            faces[:, 1] += y0
+    if len(faces) == 0:
+        faces = _search(gray, min_px, max_px, mode, max_side)
+    if len(faces) == 0:
+        return faces
+    order = np.argsort(faces[:, 2] * faces[:, 3])[::-1]
+    return faces[order]
+
+def _locate_face(gray: np.ndarray, roi=None) -> tuple[np.ndarray, np.ndarray | None]:
+    """Largest face crop and its box, or a center crop and ``None``."""
+    faces = _detect_faces(gray, roi=roi)
     if len(faces) > 0:
         # choose the largest detected face
-        x, y, w, h = sorted(faces, key=lambda r: r[2] * r[3], reverse=True)[0]
-        return gray[y : y + h, x : x + w]
+        x, y, w, h = faces[0]
+        return gray[y : y + h, x : x + w], faces[0]
     # fallback: safe center crop
     h, w = gray.shape[:2]
     sz = min(h, w)
     y0 = (h - sz) // 2
     x0 = (w - sz) // 2
-    return gray[y0 : y0 + sz, x0 : x0 + sz]
+    return gray[y0 : y0 + sz, x0 : x0 + sz], None
+
+def _extract_face(gray: np.ndarray) -> np.ndarray:
+    return _locate_face(gray)[0]
+
+def _resize_equalize(crops: list[np.ndarray]) -> np.ndarray:
+    """96x96 resize + histogram equalization per crop, stacked as float32 rows."""
+    batch = np.empty((len(crops), 96 * 96), dtype=np.float32)
+    for i, crop in enumerate(crops):
+        face = cv2.resize(crop, (96, 96), interpolation=cv2.INTER_AREA)
+        batch[i] = cv2.equalizeHist(face).ravel()
+    return batch
+
+def _standardize_l2(batch: np.ndarray) -> np.ndarray:
+    """Standardize then L2 normalize, row-wise, in place."""
+    batch -= batch.mean(axis=1, keepdims=True)
+    batch /= batch.std(axis=1, keepdims=True) + 1e-6
+    n = np.linalg.norm(batch, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    batch /= n
+    return batch
+
+def _normalize_crops(crops: list[np.ndarray]) -> np.ndarray:
+    """Resize/equalize each crop, then standardize + L2 all rows in one NumPy pass."""
+    return _standardize_l2(_resize_equalize(crops))
 
 def _preprocess(img_bgr: np.ndarray) -> np.ndarray | None:
     if img_bgr is None:
         return None
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-    face = _extract_face(gray)
-    face = cv2.resize(face, (96, 96), interpolation=cv2.INTER_AREA)
-    face = cv2.equalizeHist(face)
-    vec = face.astype(np.float32).ravel()
-    # standardize then L2 normalize
-    vec = (vec - vec.mean()) / (vec.std() + 1e-6)
-    n = float(np.linalg.norm(vec))
-    if n > 0:
-        vec = vec / n
-    return vec.astype(np.float32)
+    with stage("detect"):
+        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        face = _extract_face(gray)
+    with stage("preprocess"):
+        return _normalize_crops([face])[0]
+
+def _preprocess_all(img_bgr: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Embed every detected face. No center-crop fallback: zero detections => zero rows."""
+    with stage("detect"):
+        gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+        boxes = _detect_faces(gray, mode=GROUP_DETECT_MODE, min_px=GROUP_MIN_FACE_PX)
+    if len(boxes) == 0:
+        return np.empty((0, 96 * 96), dtype=np.float32), boxes
+    crops = [gray[y : y + h, x : x + w] for x, y, w, h in boxes]
+    with stage("preprocess"):
+        return _normalize_crops(crops), boxes
 
 def get_image_embedding(file_bytes: bytes) -> np.ndarray | None:
     nparr = np.frombuffer(file_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    with stage("decode"):
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
     if img is None:
         return None
     return _preprocess(img)
 
-def get_live_face_embedding() -> np.ndarray | None:
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
+def get_image_embeddings(file_bytes: bytes) -> tuple[np.ndarray, np.ndarray] | None:
+    """Multi-face variant for group photos: ``(vectors (N, D), boxes (N, 4))``."""
+    nparr = np.frombuffer(file_bytes, np.uint8)
+    with stage("decode"):
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return _preprocess_all(img)
+
+def _gated_crop(gray: np.ndarray, report: quality.QualityReport, th: QualityThresholds,
+                roi=None) -> tuple[np.ndarray, np.ndarray]:
+    """Largest face crop and box of a frame that passed ``assess_frame``; raises PoorQuality."""
+    with stage("detect"):
+        faces = _detect_faces(gray, roi=roi)
+    box = faces[0] if len(faces) else None
+    report = quality.assess_face(report, box, th)
+    if not report.ok:
+        raise PoorQuality(report)
+    x, y, w, h = box
+    return gray[y : y + h, x : x + w], box
+
+def get_checked_image_embedding(job: tuple[bytes, QualityThresholds]) -> np.ndarray | None:
+    """``get_image_embedding`` behind the quality gate: no center-crop guess, PoorQuality instead."""
+    file_bytes, th = job
+    nparr = np.frombuffer(file_bytes, np.uint8)
+    with stage("decode"):
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    with stage("quality"):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        report = quality.assess_frame(gray, th)
+    if not report.ok:
+        raise PoorQuality(report)
+    face, _ = _gated_crop(gray, report, th)
+    with stage("preprocess"):
+        return _normalize_crops([face])[0]
+
+# Last live face box, used as the search ROI for the next live frame
+_LIVE_ROI_TTL = 2.0
+_live_roi: tuple[float, np.ndarray] | None = None
+
+# Live capture scores this many of the freshest buffered frames and embeds the best
+LIVE_BURST = 5
+# ...trying detection on at most this many of them, sharpest first
+LIVE_DETECT_ATTEMPTS = 2
+
+def get_live_face_embedding(th: QualityThresholds | None = None) -> np.ndarray | None:
+    # Frames come from the long-lived capture service; no per-call device open
+    from app.face_utils.camera import get_capture_service
+    global _live_roi
+
+    if th is not None:
+        return _best_live_embedding(get_capture_service(), th)
+    frame = get_capture_service().latest()
+    if frame is None:
         return None
-    ok, frame = cap.read()
-    cap.release()
-    if not ok:
+    now = time.monotonic()
+    roi = _live_roi[1] if _live_roi and now - _live_roi[0] <= _LIVE_ROI_TTL else None
+    with stage("detect"):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        face, box = _locate_face(gray, roi=roi)
+    _live_roi = (now, box) if box is not None else None
+    with stage("preprocess"):
+        return _normalize_crops([face])[0]
+
+def _best_live_embedding(service, th: QualityThresholds) -> np.ndarray | None:
+    """Score a burst of recent frames, then detect and embed only the best one(s)."""
+    global _live_roi
+
+    # the gate judges exposure itself, so take dark frames too (for the reason)
+    frames = service.recent(min_brightness=0.0)[-LIVE_BURST:]
+    if not frames:
+        frame = service.latest(min_brightness=0.0)
+        frames = [frame] if frame is not None else []
+    if not frames:
         return None
-    return _preprocess(frame)
+    with stage("quality"):
+        grays = [cv2.cvtColor(f, cv2.COLOR_BGR2GRAY) for f in frames]
+        order, reports = quality.rank_frames(grays, th)
+    if not order:
+        reason = quality.most_common_reason(reports)
+        raise PoorQuality(next(r for r in reports if r.reason == reason))
+
+    now = time.monotonic()
+    roi = _live_roi[1] if _live_roi and now - _live_roi[0] <= _LIVE_ROI_TTL else None
+    rejection = None
+    for i in order[:LIVE_DETECT_ATTEMPTS]:
+        try:
+            face, box = _gated_crop(grays[i], reports[i], th, roi=roi)
+        except PoorQuality as e:
+            rejection = rejection or e
+            continue
+        _live_roi = (now, box)
+        with stage("preprocess"):
+            return _normalize_crops([face])[0]
+    _live_roi = None
+    raise rejection
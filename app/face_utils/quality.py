@@ -0,0 +1,135 @@
+# app/face_utils/quality.py
+"""
+Cheap input-quality gate run before (and right after) face detection.
+
+Detection and matching cost ~100 ms per image; the checks below cost ~1 ms,
+so inputs that cannot match are turned away early, with a reason the kiosk
+or student can act on:
+
+- brightness: mean gray level of a strided sample     (``too_dark`` / ``too_bright``)
+- sharpness:  variance of the Laplacian on a small copy, in the sharpest
+              cell of a grid, so a sharp face on a plain wall still passes (``blurry``)
+- face size:  detected face box in pixels              (``no_face`` / ``face_too_small``)
+
+The first two run before detection; the face-size check needs the box that
+detection produces anyway. Rejections raise ``PoorQuality``, which pickles,
+so it crosses the embedding engine's process boundary intact.
+
+For live capture, ``rank_frames`` scores a short burst of buffered frames so
+that only the sharpest acceptable one is detected on and embedded.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+# Longest side of the copy the Laplacian runs on
+SHARPNESS_MAX_SIDE = 320
+# ...split into GRID x GRID cells; the score is the sharpest cell's
+SHARPNESS_GRID = 4
+
+REASONS = {
+    "too_dark": "The image is too dark. Add light or face the camera.",
+    "too_bright": "The image is overexposed. Move away from direct light.",
+    "blurry": "The image is too blurry. Hold still and try again.",
+    "no_face": "No face was found in the image.",
+    "face_too_small": "The face is too small. Move closer to the camera.",
+}
+
+
+class QualityThresholds(NamedTuple):
+    min_sharpness: float = 30.0
+    min_brightness: float = 40.0
+    max_brightness: float = 225.0
+    min_face_px: int = 64
+
+
+class QualityReport(NamedTuple):
+    ok: bool
+    reason: str | None
+    brightness: float
+    sharpness: float | None = None
+    face_px: int | None = None
+
+
+class PoorQuality(Exception):
+    """Input rejected by the quality gate; ``str()`` is a user-facing message."""
+
+    outcome = "poor_quality"  # engine/metrics outcome label
+
+    def __init__(self, report: QualityReport):
+        super().__init__(report)
+        self.report = report
+
+    @property
+    def reason(self) -> str:
+        return self.report.reason
+
+    def __str__(self) -> str:
+        return REASONS.get(self.report.reason, "The image quality is too low.")
+
+
+def thresholds_from_config(config) -> QualityThresholds | None:
+    """The app's thresholds, or None when QUALITY_GATE_ENABLED is off."""
+    if not config["QUALITY_GATE_ENABLED"]:
+        return None
+    return QualityThresholds(
+        min_sharpness=config["QUALITY_MIN_SHARPNESS"],
+        min_brightness=config["QUALITY_MIN_BRIGHTNESS"],
+        max_brightness=config["QUALITY_MAX_BRIGHTNESS"],
+        min_face_px=config["QUALITY_MIN_FACE_PX"],
+    )
+
+
+def brightness(gray: np.ndarray) -> float:
+    return float(gray[::8, ::8].mean())
+
+
+def sharpness(gray: np.ndarray) -> float:
+    import cv2
+
+    h, w = gray.shape[:2]
+    scale = SHARPNESS_MAX_SIDE / max(h, w)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    lap = cv2.Laplacian(gray, cv2.CV_32F)
+    h, w = lap.shape
+    n = SHARPNESS_GRID if min(h, w) >= SHARPNESS_GRID * 8 else 1
+    return max(float(lap[i * h // n : (i + 1) * h // n, j * w // n : (j + 1) * w // n].var())
+               for i in range(n) for j in range(n))
+
+
+def assess_frame(gray: np.ndarray, th: QualityThresholds) -> QualityReport:
+    """Pre-detection checks: exposure first (cheapest), then sharpness."""
+    b = brightness(gray)
+    if b < th.min_brightness:
+        return QualityReport(False, "too_dark", b)
+    if b > th.max_brightness:
+        return QualityReport(False, "too_bright", b)
+    s = sharpness(gray)
+    if s < th.min_sharpness:
+        return QualityReport(False, "blurry", b, s)
+    return QualityReport(True, None, b, s)
+
+
+def assess_face(report: QualityReport, box, th: QualityThresholds) -> QualityReport:
+    """Post-detection check on the chosen face box (``None`` if nothing was found)."""
+    if box is None:
+        return report._replace(ok=False, reason="no_face")
+    px = int(min(box[2], box[3]))
+    if px < th.min_face_px:
+        return report._replace(ok=False, reason="face_too_small", face_px=px)
+    return report._replace(face_px=px)
+
+
+def rank_frames(grays: list[np.ndarray], th: QualityThresholds) -> tuple[list[int], list[QualityReport]]:
+    """Indices of the frames that pass ``assess_frame``, sharpest first, and every report."""
+    reports = [assess_frame(g, th) for g in grays]
+    passing = sorted((i for i, r in enumerate(reports) if r.ok), key=lambda i: reports[i].sharpness, reverse=True)
+    return passing, reports
+
+
+def most_common_reason(reports: list[QualityReport]) -> str:
+    reasons = [r.reason for r in reports if r.reason]
+    return max(set(reasons), key=reasons.count) if reasons else "no_face"
@@ -0,0 +1,275 @@
+# app/face_utils/video.py
+"""
+Face tracks from short video clips (entrance cameras).
+
+The clip is decoded one frame at a time, so memory does not grow with its
+length:
+
+- sampling: at most ``sample_fps`` frames per second of video are decoded
+  and searched; frames in between are only ``grab()``-ed
+- adaptive skip: while nobody is in view the stride doubles, up to
+  ``max_skip_s`` seconds of video, and drops back to the base stride as soon
+  as a face shows up (or while any track is still open)
+- tracking: each open track's box is moved on by its last per-sample
+  displacement, then detections are associated with the predictions by
+  greedy IoU, and leftovers by center distance (up to ``max_shift`` box
+  widths, for small faces that move further than their own width between
+  samples); a track not seen for ``max_gap`` sampled frames is closed
+- each track is embedded at most ``samples_per_track`` times, at least
+  ``sample_gap`` sampled frames apart, instead of on every frame
+- tracks seen in fewer than ``min_hits`` sampled frames are dropped as
+  spurious detections, and at most ``max_tracks`` are kept per clip
+- detection downscales frames to ``detect_max_side`` (not the single-face
+  upload default) and uses an absolute ``min_face_px`` floor, since people
+  at an entrance camera are small in a wide frame
+
+``track_video`` runs in the embedding engine's workers (task ``"video"``);
+matching the per-track samples against the gallery and marking attendance
+happen in the web process (``aggregate_track`` combines a track's matches),
+which imports this module without loading OpenCV.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+from app.metrics import stage
+
+
+class VideoOptions(NamedTuple):
+    sample_fps: float = 5.0
+    max_skip_s: float = 1.0
+    iou: float = 0.3
+    max_shift: float = 1.5
+    max_gap: int = 3
+    samples_per_track: int = 3
+    sample_gap: int = 2
+    min_hits: int = 2
+    max_tracks: int = 200
+    max_seconds: float = 300.0
+    detect_max_side: int = 1280
+    min_face_px: int = 40
+
+
+class VideoJob(NamedTuple):
+    path: str
+    options: VideoOptions = VideoOptions()
+
+
+class TrackResult(NamedTuple):
+    track_id: int
+    first_s: float
+    last_s: float
+    hits: int
+    box: tuple[int, int, int, int]   # largest box seen, x, y, w, h
+    samples: np.ndarray              # (n, 96*96) float32 embeddings
+
+
+class VideoResult(NamedTuple):
+    tracks: list[TrackResult]
+    fps: float
+    duration_s: float
+    frames_read: int
+    frames_sampled: int
+    truncated: bool                  # hit max_tracks or max_seconds
+
+
+class _Track:
+    __slots__ = ("id", "box", "best_box", "velocity", "first", "last", "hits", "missed", "samples", "last_sample")
+
+    def __init__(self, track_id: int, box: np.ndarray, t: float):
+        self.id = track_id
+        self.box = box
+        self.best_box = box
+        self.velocity = np.zeros(2)   # x, y displacement per sampled frame
+        self.first = self.last = t
+        self.hits = 1
+        self.missed = 0
+        self.samples: list[np.ndarray] = []
+        self.last_sample = -(1 << 30)
+
+    def predicted(self) -> np.ndarray:
+        """Where the box should be in the current sample, if it keeps moving the same way."""
+        box = self.box.astype(np.float64)
+        box[:2] += self.velocity * (self.missed + 1)
+        return box
+
+    def update(self, box: np.ndarray, t: float) -> None:
+        self.velocity = (box[:2] - self.box[:2]) / (self.missed + 1)
+        self.box, self.last, self.missed = box, t, 0
+
+    def result(self) -> TrackResult:
+        x, y, w, h = (int(v) for v in self.best_box)
+        samples = np.vstack(self.samples) if self.samples else np.empty((0, 96 * 96), dtype=np.float32)
+        return TrackResult(self.id, round(self.first, 3), round(self.last, 3), self.hits, (x, y, w, h), samples)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) x, y, w, h boxes."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    ax1, ay1 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx1, by1 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.clip(np.minimum(ax1[:, None], bx1[None, :]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    ih = np.clip(np.minimum(ay1[:, None], by1[None, :]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = iw * ih
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def _associate(tracks: list[_Track], boxes: np.ndarray, min_iou: float,
+               max_shift: float = 0.0) -> tuple[dict[int, int], list[int]]:
+    """Greedy IoU matching, then center distance for the rest: ({track index: box index}, unmatched box indices)."""
+    prev = np.array([t.predicted() for t in tracks]).reshape(-1, 4)
+    ious = iou_matrix(prev, boxes)
+    pairs: dict[int, int] = {}
+    used = set()
+    if ious.size:
+        for flat in np.argsort(ious, axis=None)[::-1]:
+            ti, bi = divmod(int(flat), ious.shape[1])
+            if ious[ti, bi] < min_iou:
+                break
+            if ti in pairs or bi in used:
+                continue
+            pairs[ti] = bi
+            used.add(bi)
+    if max_shift > 0 and ious.size and len(pairs) < len(tracks) and len(used) < len(boxes):
+        # center distance in units of the track's box width
+        pc = prev[:, :2] + prev[:, 2:] / 2.0
+        bc = boxes[:, :2] + boxes[:, 2:] / 2.0
+        dist = np.linalg.norm(pc[:, None, :] - bc[None, :, :], axis=2) / np.maximum(prev[:, 2:3], 1)
+        for flat in np.argsort(dist, axis=None):
+            ti, bi = divmod(int(flat), dist.shape[1])
+            if dist[ti, bi] > max_shift:
+                break
+            if ti in pairs or bi in used:
+                continue
+            pairs[ti] = bi
+            used.add(bi)
+    return pairs, [i for i in range(len(boxes)) if i not in used]
+
+
+def track_video(job: VideoJob) -> VideoResult | None:
+    """Track and sample faces through the clip at ``job.path``; None if it cannot be opened."""
+    import cv2
+    from app.face_utils import pipeline
+
+    opts = job.options
+    cap = cv2.VideoCapture(job.path)
+    if not cap.isOpened():
+        return None
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps and fps > 0 else 25.0
+        base = max(1, round(fps / max(opts.sample_fps, 1e-3)))
+        max_stride = max(base, round(fps * opts.max_skip_s))
+        max_frames = int(fps * opts.max_seconds)
+
+        open_tracks: list[_Track] = []
+        done: list[TrackResult] = []
+        next_id = 0
+        stride = base
+        frame_no = -1        # index of the last frame read
+        sampled = 0
+        truncated = False
+
+        def close(track: _Track) -> None:
+            if track.hits >= opts.min_hits:
+                done.append(track.result())
+
+        while True:
+            with stage("decode"):
+                ok, frame = True, None
+                for _ in range(stride - 1):
+                    if not cap.grab():
+                        ok = False
+                        break
+                    frame_no += 1
+                if ok:
+                    ok, frame = cap.read()
+                    if ok:
+                        frame_no += 1
+            if not ok or frame is None:
+                break
+            if frame_no >= max_frames:
+                truncated = True
+                break
+            t = frame_no / fps
+            sampled += 1
+
+            with stage("detect"):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                boxes = pipeline._detect_faces(gray, min_px=opts.min_face_px, max_side=opts.detect_max_side)
+            pairs, fresh = _associate(open_tracks, boxes, opts.iou, opts.max_shift)
+
+            for ti, track in enumerate(open_tracks):
+                bi = pairs.get(ti)
+                if bi is None:
+                    track.missed += 1
+                    continue
+                box = boxes[bi]
+                track.update(box, t)
+                track.hits += 1
+                if box[2] * box[3] > track.best_box[2] * track.best_box[3]:
+                    track.best_box = box
+            for bi in fresh:
+                if next_id >= opts.max_tracks:
+                    truncated = True
+                    continue
+                open_tracks.append(_Track(next_id, boxes[bi], t))
+                next_id += 1
+
+            # embed the tracks that are due for another sample, in one batch
+            due = [tr for tr in open_tracks
+                   if tr.missed == 0 and len(tr.samples) < opts.samples_per_track
+                   and sampled - tr.last_sample >= opts.sample_gap]
+            if due:
+                crops = [gray[y : y + h, x : x + w] for x, y, w, h in (tr.box for tr in due)]
+                with stage("preprocess"):
+                    vecs = pipeline._normalize_crops(crops)
+                for tr, vec in zip(due, vecs):
+                    tr.samples.append(vec)
+                    tr.last_sample = sampled
+
+            for tr in [tr for tr in open_tracks if tr.missed > opts.max_gap]:
+                open_tracks.remove(tr)
+                close(tr)
+
+            # nobody around: look less often until someone shows up
+            stride = base if (len(boxes) or open_tracks) else min(stride * 2, max_stride)
+
+        for tr in open_tracks:
+            close(tr)
+        done.sort(key=lambda r: r.first_s)
+        return VideoResult(done, fps, round((frame_no + 1) / fps, 3), frame_no + 1, sampled, truncated)
+    finally:
+        cap.release()
+
+
+def aggregate_track(top_hits: list[tuple[int, float] | None], threshold: float,
+                    min_agreement: float = 0.5) -> tuple[int | None, float | None]:
+    """Combine one track's per-sample top matches into ``(user_id, score)``.
+
+    The user matched (at or above ``threshold``) by the most samples wins,
+    ties going to the higher mean score; it must account for at least
+    ``min_agreement`` of the samples, otherwise the track stays unknown with
+    its best single score.
+    """
+    votes: dict[int, list[float]] = {}
+    best = None
+    for hit in top_hits:
+        if not hit:
+            continue
+        uid, score = hit
+        best = score if best is None else max(best, score)
+        if score >= threshold:
+            votes.setdefault(uid, []).append(score)
+    if not votes:
+        return None, best
+    uid, scores = max(votes.items(), key=lambda kv: (len(kv[1]), sum(kv[1]) / len(kv[1])))
+    if len(scores) < min_agreement * len(top_hits):
+        return None, best
+    return uid, float(sum(scores) / len(scores))
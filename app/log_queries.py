@@ -0,0 +1,252 @@
+# app/log_queries.py
+"""
+Shared query, pagination and CSV helpers for the attendance log pages.
+
+Queries select plain tuples with the user columns joined in (no per-row lazy
+load of ``log.user``). Listing pages use keyset pagination on
+``(timestamp, id)``, so a deep page costs the same as the first one. Exports
+read rows in ``yield_per`` chunks and stream the CSV out as it is produced, so
+memory stays flat regardless of the date range.
+
+Rows moved to the archive tier (see ``app/archive.py``) are older than every
+row left in the table, so pages and exports continue into the archive once
+the table runs out, with the same filters and the same row shape.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import itertools
+import zlib
+from datetime import datetime
+from typing import NamedTuple
+
+from flask import Response, request, stream_with_context, url_for
+from sqlalchemy import and_, or_, select
+
+from app import db
+from app.archive import from_us, get_archive
+from app.models import User, AttendanceLog
+
+# Rows fetched from the DB cursor per round trip
+EXPORT_CHUNK_ROWS = 1000
+
+# Rows per listing page
+LOG_PAGE_SIZE = 50
+
+
+def end_of_day(d: datetime) -> datetime:
+    return d.replace(hour=23, minute=59, second=59, microsecond=999999)
+
+
+def _filtered(q, start: datetime | None, end: datetime | None, user_id: int | None):
+    q = q.select_from(AttendanceLog).join(User, User.id == AttendanceLog.user_id)
+    if user_id is not None:
+        q = q.where(AttendanceLog.user_id == user_id)
+    if start:
+        q = q.where(AttendanceLog.timestamp >= start)
+    if end:
+        q = q.where(AttendanceLog.timestamp < end_of_day(end))
+    return q
+
+
+def log_rows_query(*columns, start: datetime | None = None, end: datetime | None = None,
+                   user_id: int | None = None):
+    """SELECT ``columns`` from attendance_logs joined to users, newest first."""
+    q = _filtered(select(*columns), start, end, user_id)
+    return q.order_by(AttendanceLog.timestamp.desc(), AttendanceLog.id.desc())
+
+
+# ---------------------------------------------------------
+# Archived rows
+# ---------------------------------------------------------
+_ARCHIVE_FIELDS = {"id": "id", "user_id": "user_id", "timestamp": "ts", "status": "status", "location": "location"}
+
+
+def _archived_chunks(columns, limit: int | None = None, **scan):
+    """Archived rows as tuples of ``columns`` (attendance_logs / users columns), newest first.
+
+    Users are looked up per chunk; rows of deleted users are dropped, like the
+    table's join (their live rows cascade away).
+    """
+    exprs = [c.expression for c in columns]
+    user_keys = sorted({e.key for e in exprs if e.table is User.__table__} - {"id"})
+    left = limit
+    for batch in get_archive().scan(chunk=min(limit or EXPORT_CHUNK_ROWS, EXPORT_CHUNK_ROWS), **scan):
+        uids = batch.user_id.tolist()
+        users = {row.id: row for row in db.session.execute(
+            select(User.id, *[getattr(User, k) for k in user_keys]).where(User.id.in_(set(uids))))}
+        fields = {"id": batch.id.tolist(), "user_id": uids, "ts": from_us(batch.ts),
+                  "status": batch.status.tolist(), "location": batch.location.tolist()}
+        chunk = []
+        for i, uid in enumerate(uids):
+            user = users.get(uid)
+            if user is None:
+                continue
+            chunk.append(tuple(fields[_ARCHIVE_FIELDS[e.key]][i] if e.table is AttendanceLog.__table__
+                               else getattr(user, e.key) for e in exprs))
+        if left is not None:
+            chunk = chunk[:left]
+            left -= len(chunk)
+        if chunk:
+            yield chunk
+        if left == 0:
+            return
+
+
+def archived_log_rows(*columns, start: datetime | None = None, end: datetime | None = None,
+                      user_id: int | None = None):
+    """``log_rows_query``'s rows from the archive tier, as chunks for ``stream_csv(archived=...)``."""
+    return _archived_chunks(columns, start=start, end=end_of_day(end) if end else None, user_id=user_id)
+
+
+# ---------------------------------------------------------
+# Keyset pagination
+# ---------------------------------------------------------
+class LogPage(NamedTuple):
+    rows: list
+    older: str | None   # cursor for the next (older) page
+    newer: str | None   # cursor for the previous (newer) page
+
+
+class ArchivedLogRow(NamedTuple):
+    """A page row served from the archive tier (same fields as the table's)."""
+    id: int
+    timestamp: datetime
+    status: str
+    location: str | None
+    user_id: int
+    full_name: str
+    username: str
+
+
+_PAGE_COLUMNS = (AttendanceLog.id, AttendanceLog.timestamp, AttendanceLog.status, AttendanceLog.location,
+                 AttendanceLog.user_id, User.full_name, User.username)
+
+
+def encode_cursor(ts: datetime, log_id: int) -> str:
+    return f"{ts.strftime('%Y%m%d%H%M%S%f')}.{log_id}"
+
+
+def decode_cursor(s: str | None) -> tuple[datetime, int] | None:
+    if not s:
+        return None
+    try:
+        ts, log_id = s.split('.', 1)
+        return datetime.strptime(ts, '%Y%m%d%H%M%S%f'), int(log_id)
+    except ValueError:
+        return None
+
+
+def log_page(*, start: datetime | None = None, end: datetime | None = None,
+             user_id: int | None = None, after: str | None = None, before: str | None = None,
+             limit: int = LOG_PAGE_SIZE) -> LogPage:
+    """One page of log rows, newest first.
+
+    ``after`` continues past a cursor towards older rows, ``before`` goes back
+    towards newer rows. Rows are lightweight tuples with ``id``, ``timestamp``,
+    ``status``, ``location``, ``user_id``, ``full_name`` and ``username``.
+    """
+    ts, lid = AttendanceLog.timestamp, AttendanceLog.id
+    q = _filtered(select(*_PAGE_COLUMNS), start, end, user_id)
+    after_c, before_c = decode_cursor(after), decode_cursor(before)
+    scan = {"start": start, "end": end_of_day(end) if end else None, "user_id": user_id}
+
+    def archived(n: int, **cursor) -> list:
+        chunks = _archived_chunks(_PAGE_COLUMNS, limit=n, **scan, **cursor)
+        return [ArchivedLogRow(*row) for chunk in chunks for row in chunk]
+
+    if before_c and not after_c:
+        c_ts, c_id = before_c
+        # oldest first: archived rows newer than the cursor, then the table's
+        rows = archived(limit + 1, newer_than=before_c, newest_first=False)
+        if len(rows) <= limit:
+            # ts >= c_ts keeps the index range bound; the OR breaks timestamp ties by id
+            q = q.where(and_(ts >= c_ts, or_(ts > c_ts, lid > c_id))).order_by(ts.asc(), lid.asc())
+            rows += db.session.execute(q.limit(limit + 1 - len(rows))).all()
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        if not rows:
+            return LogPage([], None, None)
+        return LogPage(rows,
+                       encode_cursor(rows[-1].timestamp, rows[-1].id),
+                       encode_cursor(rows[0].timestamp, rows[0].id) if has_newer else None)
+
+    if after_c:
+        c_ts, c_id = after_c
+        q = q.where(and_(ts <= c_ts, or_(ts < c_ts, lid < c_id)))
+    q = q.order_by(ts.desc(), lid.desc())
+    rows = db.session.execute(q.limit(limit + 1)).all()
+    if len(rows) <= limit:
+        rows += archived(limit + 1 - len(rows), older_than=after_c)
+    has_older = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return LogPage([], None, None)
+    return LogPage(rows,
+                   encode_cursor(rows[-1].timestamp, rows[-1].id) if has_older else None,
+                   encode_cursor(rows[0].timestamp, rows[0].id) if after_c else None)
+
+
+def page_urls(page: LogPage, endpoint: str, **values) -> dict:
+    """first/newer/older links for ``page``, keeping the current from/to filters."""
+    args = {k: request.args[k] for k in ('from', 'to') if request.args.get(k)}
+    args.update(values)
+    return {
+        'first': url_for(endpoint, **args),
+        'newer': url_for(endpoint, before=page.newer, **args) if page.newer else None,
+        'older': url_for(endpoint, after=page.older, **args) if page.older else None,
+    }
+
+
+# ---------------------------------------------------------
+# CSV export
+# ---------------------------------------------------------
+def _fmt_ts(ts: datetime | None) -> str:
+    return ts.isoformat(sep=' ', timespec='seconds') if ts else ''
+
+
+def _iter_csv(header: list[str], query, ts_index: int | None, archived=()):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(header)
+    result = db.session.execute(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+    for chunk in itertools.chain(result.partitions(), archived):
+        if ts_index is None:
+            w.writerows(chunk)
+        else:
+            for row in chunk:
+                row = list(row)
+                row[ts_index] = _fmt_ts(row[ts_index])
+                w.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def _gzip(chunks):
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = z.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield z.flush()
+
+
+def stream_csv(header: list[str], query, filename: str, ts_index: int | None = -1,
+               archived=()) -> Response:
+    """Stream ``query`` rows as a CSV attachment; gzip on the wire if the client accepts it.
+
+    The datetime column at ``ts_index`` is written as ``YYYY-MM-DD HH:MM:SS``;
+    pass ``None`` to write every column as-is. ``archived`` (see
+    ``archived_log_rows``) is written after the query's rows.
+    """
+    body = _iter_csv(header, query, ts_index, archived)
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"',
+               'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip']:
+        body = _gzip(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), mimetype='text/csv', headers=headers)
@@ -0,0 +1,289 @@
+# app/metrics.py
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters, gauges and fixed-bucket histograms that cost a lock and a bisect
+per observation; nothing is formatted until ``/admin/metrics`` is scraped.
+Gauges backed by a function (queue depths) are only evaluated at scrape time.
+
+Pipeline stages (decode / detect / preprocess) usually run in the embedding
+engine's worker processes, whose metrics would otherwise be lost. ``stage()``
+therefore appends to a thread-local recording when one is active; the engine
+records around each task, ships the timings back with the result and the
+parent observes them. Without an active recording (live capture in the web
+process, tools) timings go straight into the histogram.
+
+With ``METRICS_ENABLED`` off, the per-request and per-query hooks are not
+installed at all.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    parts = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{n}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._fn = None
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn) -> None:
+        """Read the value from ``fn()`` at scrape time instead (unlabelled gauges)."""
+        self._fn = fn
+
+    def _samples(self):
+        if self._fn is not None:
+            try:
+                return [f"{self.name} {_num(self._fn())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((k, (list(c), total)) for k, (c, total) in self._series.items())
+        out = []
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in items:
+            cum = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cum += c
+                out.append(f"{self.name}_bucket{_labels(names, key + (_num(bound),))} {cum}")
+            lbl = _labels(self.labelnames, key)
+            out.append(f"{self.name}_sum{lbl} {_num(total)}")
+            out.append(f"{self.name}_count{lbl} {cum}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+PIPELINE_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "facial_pipeline_stage_seconds", "Time spent in each face pipeline stage.", ("stage",)))
+EMBED_TASKS = REGISTRY.register(Counter(
+    "facial_embedding_tasks_total", "Embedding tasks finished, by outcome.", ("task", "outcome")))
+EMBED_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "facial_embedding_queue_wait_seconds", "Time embedding tasks waited for a worker.", ("task",)))
+EMBED_RUN_SECONDS = REGISTRY.register(Histogram(
+    "facial_embedding_run_seconds", "Time embedding tasks ran in a worker.", ("task",)))
+EMBED_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "facial_embedding_queue_depth", "Embedding tasks queued or running."))
+ATTENDANCE_WRITE_SECONDS = REGISTRY.register(Histogram(
+    "facial_attendance_write_seconds", "Time from queueing an attendance unit to its commit."))
+ATTENDANCE_BATCH_ROWS = REGISTRY.register(Histogram(
+    "facial_attendance_batch_rows", "Rows committed per attendance writer batch.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)))
+ATTENDANCE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "facial_attendance_queue_depth", "Attendance units waiting for the writer."))
+LIVE_FEED_CLIENTS = REGISTRY.register(Gauge(
+    "facial_live_feed_clients", "Connected live attendance feed clients."))
+LIVE_FEED_DROPPED = REGISTRY.register(Counter(
+    "facial_live_feed_dropped_total", "Live feed events dropped from full client buffers."))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "facial_http_request_seconds", "Request handling time by endpoint.", ("endpoint",)))
+HTTP_REQUEST_DB_QUERIES = REGISTRY.register(Histogram(
+    "facial_http_request_db_queries", "Database queries issued per request.", ("endpoint",),
+    buckets=COUNT_BUCKETS))
+HTTP_REQUEST_DB_SECONDS = REGISTRY.register(Histogram(
+    "facial_http_request_db_seconds", "Total database time per request.", ("endpoint",)))
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    "facial_db_query_seconds", "Duration of individual database queries."))
+
+
+# ---------------------------------------------------------
+# Pipeline stage recording (works across the process pool)
+# ---------------------------------------------------------
+_local = threading.local()
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        rec = getattr(_local, "stages", None)
+        if rec is not None:
+            rec.append((name, dt))
+        else:
+            PIPELINE_STAGE_SECONDS.observe(dt, stage=name)
+
+
+def start_recording() -> None:
+    _local.stages = []
+
+
+def stop_recording() -> list[tuple[str, float]]:
+    stages, _local.stages = getattr(_local, "stages", None) or [], None
+    return stages
+
+
+def observe_stages(stages) -> None:
+    for name, dt in stages:
+        PIPELINE_STAGE_SECONDS.observe(dt, stage=name)
+
+
+# ---------------------------------------------------------
+# Flask / SQLAlchemy hooks
+# ---------------------------------------------------------
+# The start time lives on the execution context, so a statement that raises
+# (no after_cursor_execute) leaves nothing behind on the pooled connection
+def _on_before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _on_after_cursor(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    dt = time.perf_counter() - start
+    DB_QUERY_SECONDS.observe(dt)
+    req = getattr(_local, "request", None)
+    if req is not None:
+        req[0] += 1
+        req[1] += dt
+
+
+def init_metrics(app) -> None:
+    """Install request/query hooks and scrape-time gauges for ``app``."""
+    from flask import request
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    engine = app.extensions.get("face_engine")
+    if engine is not None:
+        EMBED_QUEUE_DEPTH.set_function(lambda: engine.pending)
+    writer = app.extensions.get("attendance_writer")
+    if writer is not None:
+        ATTENDANCE_QUEUE_DEPTH.set_function(lambda: writer.depth)
+    feed = app.extensions.get("live_feed")
+    if feed is not None:
+        LIVE_FEED_CLIENTS.set_function(lambda: feed.clients)
+
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    if not event.contains(Engine, "before_cursor_execute", _on_before_cursor):
+        event.listen(Engine, "before_cursor_execute", _on_before_cursor)
+        event.listen(Engine, "after_cursor_execute", _on_after_cursor)
+
+    @app.before_request
+    def _metrics_start():
+        _local.request = [0, 0.0, time.perf_counter()]
+
+    @app.teardown_request
+    def _metrics_finish(exc=None):
+        req, _local.request = getattr(_local, "request", None), None
+        if req is None:
+            return
+        endpoint = request.endpoint or "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - req[2], endpoint=endpoint)
+        HTTP_REQUEST_DB_QUERIES.observe(req[0], endpoint=endpoint)
+        HTTP_REQUEST_DB_SECONDS.observe(req[1], endpoint=endpoint)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -1,13 +1,74 @@
 from app import db, login_manager
 from flask_login import UserMixin
 from datetime import datetime
+from collections import OrderedDict
 import hashlib
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import time
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.security import check_password_hash
+from app.passwords import hash_password
+
+# How long a cached session principal is trusted before re-reading the users row.
+# Edits/deletes in this process invalidate immediately; other processes catch up
+# within the TTL.
+PRINCIPAL_TTL_SECONDS = 30.0
+PRINCIPAL_CACHE_MAX = 10000
+
+class Principal(UserMixin):
+    """Read-only view of a User for ``current_user``: just the columns requests need."""
+    __slots__ = ('id', 'username', 'full_name', 'role')
+
+    def __init__(self, id, username, full_name, role):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.role = role
+
+    def get_id(self):
+        return str(self.id)
+
+    def __repr__(self):
+        return f"<Principal {self.username} ({self.role})>"
+
+_principals: "OrderedDict[int, tuple[float, Principal]]" = OrderedDict()
+_principals_lock = threading.Lock()
+
+def invalidate_principal(user_id: int | None = None) -> None:
+    """Forget one cached principal (or all of them)."""
+    with _principals_lock:
+        if user_id is None:
+            _principals.clear()
+        else:
+            _principals.pop(int(user_id), None)
 
 # Flask-Login: load user
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    uid = int(user_id)
+    now = time.monotonic()
+    with _principals_lock:
+        hit = _principals.get(uid)
+        if hit and hit[0] > now:
+            _principals.move_to_end(uid)
+            return hit[1]
+    row = (db.session.query(User.id, User.username, User.full_name, User.role)
+           .filter(User.id == uid)
+           .first())
+    if row is None:
+        invalidate_principal(uid)
+        return None
+    principal = Principal(*row)
+    with _principals_lock:
+        _principals[uid] = (now + PRINCIPAL_TTL_SECONDS, principal)
+        _principals.move_to_end(uid)
+        while len(_principals) > PRINCIPAL_CACHE_MAX:
+            _principals.popitem(last=False)
+    return principal
+
+ROLES = ('admin', 'faculty', 'student')
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -17,7 +78,6 @@ class User(UserMixin, db.Model):
     full_name = db.Column(db.String(150), nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'admin' | 'faculty' | 'student'
-    face_embedding = db.Column(db.LargeBinary, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     attendance_logs = db.relationship(
@@ -28,8 +88,18 @@ class User(UserMixin, db.Model):
         passive_deletes=True  # don't try to NULL the FK
     )
 
+    # Face templates live in their own table so loading a User never drags
+    # embedding blobs along (see FaceTemplate)
+    face_templates = db.relationship(
+        'FaceTemplate',
+        backref='user',
+        lazy='dynamic',
+        cascade='all, delete-orphan',
+        passive_deletes=True
+    )
+
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256', salt_length=16)
+        self.password_hash = hash_password(password)
 
     def _sha256_hex(self, password: str) -> str:
         return hashlib.sha256(password.encode()).hexdigest()
@@ -56,8 +126,78 @@ class User(UserMixin, db.Model):
     def __repr__(self):
         return f"<User {self.username} ({self.role})>"
 
+# Role/password edits and deletions drop the cached principal once they commit:
+# flush-time events run inside the transaction, and a request that reloads the
+# principal before the commit would cache the old row again
+_CHANGED_PRINCIPALS = 'changed_principals'
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _note_changed_principal(mapper, connection, target):
+    object_session(target).info.setdefault(_CHANGED_PRINCIPALS, set()).add(target.id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_principals(session):
+    if session.in_nested_transaction():
+        return  # a released savepoint; wait for the outer commit
+    for uid in session.info.pop(_CHANGED_PRINCIPALS, ()):
+        invalidate_principal(uid)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changed_principals(session, previous_transaction):
+    # a rolled-back savepoint may leave outer changes to commit; keep those ids
+    if previous_transaction.parent is None:
+        session.info.pop(_CHANGED_PRINCIPALS, None)
+
+class FaceTemplate(db.Model):
+    """One enrolled face embedding; a user may have several (lighting, angles, days)."""
+    __tablename__ = 'face_templates'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+        index=True
+    )
+    embedding = db.Column(db.LargeBinary, nullable=False)  # see face_utils/embedding_format.py
+    source = db.Column(db.String(20), nullable=False)      # 'live' | 'upload' | 'legacy' | 'batch'
+    captured_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    capture_meta = db.Column(db.JSON, nullable=True)       # e.g. camera, filename, format
+    source_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the source image (batch enrollment)
+
+    __table_args__ = (
+        db.Index('ix_face_templates_user_source_hash', 'user_id', 'source_hash'),
+    )
+
+    def __repr__(self):
+        return f"<FaceTemplate {self.id} user={self.user_id} ({self.source})>"
+
+class Device(db.Model):
+    """A kiosk allowed to call the JSON API; only a SHA-256 of its token is stored."""
+    __tablename__ = 'devices'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    location = db.Column(db.String(100), nullable=True)   # default location for its marks
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def __repr__(self):
+        return f"<Device {self.name}>"
+
 class AttendanceLog(db.Model):
     __tablename__ = 'attendance_logs'
+    __table_args__ = (
+        # per-user listings page on (timestamp, id); id rides along as the rowid
+        db.Index('ix_attendance_logs_user_ts', 'user_id', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
@@ -72,3 +212,42 @@ class AttendanceLog(db.Model):
 
     def __repr__(self):
         return f"<Log {self.user_id} - {self.status} @ {self.timestamp}>"
+
+class DailyAttendance(db.Model):
+    """Per-day, per-user rollup of attendance_logs, maintained on every insert."""
+    __tablename__ = 'attendance_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+        index=True
+    )
+    first_in = db.Column(db.DateTime, nullable=True)   # earliest TIME_IN of the day
+    last_out = db.Column(db.DateTime, nullable=True)   # latest TIME_OUT of the day
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<Daily {self.user_id} @ {self.day}: {self.event_count}>"
+
+# Keep attendance_daily in step with attendance_logs, inside the same transaction
+@event.listens_for(AttendanceLog, 'after_insert')
+def _rollup_after_insert(mapper, connection, target):
+    ts = target.timestamp or datetime.utcnow()
+    first_in = ts if target.status == 'TIME_IN' else None
+    last_out = ts if target.status == 'TIME_OUT' else None
+    t = DailyAttendance.__table__
+    stmt = sqlite_insert(t).values(day=ts.date(), user_id=target.user_id,
+                                   first_in=first_in, last_out=last_out, event_count=1)
+    ex = stmt.excluded
+    # SQLite's scalar min()/max() return NULL if any argument is NULL, hence the coalesces
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.day, t.c.user_id],
+        set_={
+            'first_in': func.min(func.coalesce(t.c.first_in, ex.first_in), func.coalesce(ex.first_in, t.c.first_in)),
+            'last_out': func.max(func.coalesce(t.c.last_out, ex.last_out), func.coalesce(ex.last_out, t.c.last_out)),
+            'event_count': t.c.event_count + 1,
+        },
+    )
+    connection.execute(stmt)
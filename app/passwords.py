@@ -0,0 +1,17 @@
+# app/passwords.py
+"""
+Password hashing parameters, shared by ``User.set_password`` and the bulk
+importer (tools/import_users.py), which hashes in worker processes.
+"""
+from __future__ import annotations
+
+from werkzeug.security import generate_password_hash
+
+# Keyword arguments for werkzeug's generate_password_hash. Worker pools take
+# functools.partial(generate_password_hash, **PASSWORD_HASH_ARGS) so that
+# children only import werkzeug, not the app package.
+PASSWORD_HASH_ARGS = {"method": "pbkdf2:sha256", "salt_length": 16}
+
+
+def hash_password(password: str) -> str:
+    return generate_password_hash(password, **PASSWORD_HASH_ARGS)
@@ -0,0 +1,100 @@
+# app/reports.py
+"""
+Attendance reports built on the attendance_daily rollup.
+
+The rollup holds one row per (day, user) and is kept current by the
+after_insert hook on AttendanceLog, so a report over a whole term reads a few
+thousand rollup rows instead of scanning the raw log. The rollup is never
+archived, so reports cover archived months too; only a rebuild has to read
+the archive tier (see app/archive.py).
+"""
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from sqlalchemy import case, delete, distinct, func, insert, select
+
+from app import db
+from app.archive import get_archive
+from app.models import User, AttendanceLog, DailyAttendance
+
+
+def rebuild_daily_rollups(start: date | None = None, end: date | None = None) -> int:
+    """Recompute attendance_daily from attendance_logs and the archive (whole range or a day range).
+
+    Used to backfill existing data; returns the number of rollup rows written.
+    """
+    day = func.date(AttendanceLog.timestamp)
+    src = select(
+        day,
+        AttendanceLog.user_id,
+        func.min(case((AttendanceLog.status == 'TIME_IN', AttendanceLog.timestamp))),
+        func.max(case((AttendanceLog.status == 'TIME_OUT', AttendanceLog.timestamp))),
+        func.count(),
+    ).where(AttendanceLog.timestamp.isnot(None))
+    purge = delete(DailyAttendance)
+    if start:
+        src = src.where(day >= start.isoformat())
+        purge = purge.where(DailyAttendance.day >= start)
+    if end:
+        src = src.where(day <= end.isoformat())
+        purge = purge.where(DailyAttendance.day <= end)
+    archive = get_archive()
+    archived_before = archive.manifest()["archived_before"]
+    if archived_before:
+        # older rows live in the archive (rows an interrupted archive run left behind are copies)
+        src = src.where(AttendanceLog.timestamp >= datetime.fromisoformat(archived_before))
+    src = src.group_by(day, AttendanceLog.user_id)
+
+    db.session.execute(purge)
+    res = db.session.execute(insert(DailyAttendance).from_select(
+        ['day', 'user_id', 'first_in', 'last_out', 'event_count'], src))
+    written = res.rowcount
+    users = set(db.session.scalars(select(User.id)))   # archived rows of deleted users stay out
+    archived = [{'day': d, 'user_id': u, 'first_in': fi, 'last_out': lo, 'event_count': n}
+                for d, u, fi, lo, n in archive.daily_rollups(start, end) if u in users]
+    for i in range(0, len(archived), 500):
+        db.session.execute(insert(DailyAttendance), archived[i:i + 500])
+    written += len(archived)
+    db.session.commit()
+    return written
+
+
+def _in_range(q, start: date | None, end: date | None):
+    if start:
+        q = q.where(DailyAttendance.day >= start)
+    if end:
+        q = q.where(DailyAttendance.day <= end)
+    return q
+
+
+def daily_summary(start: date | None = None, end: date | None = None):
+    """Rows of (day, students_present, events), newest day first."""
+    q = select(DailyAttendance.day,
+               func.count(DailyAttendance.user_id).label('students_present'),
+               func.sum(DailyAttendance.event_count).label('events'))
+    q = _in_range(q, start, end).group_by(DailyAttendance.day).order_by(DailyAttendance.day.desc())
+    return db.session.execute(q).all()
+
+
+def student_summary_query(start: date | None = None, end: date | None = None):
+    """Per-student totals: user_id, full_name, username, days_present, events, first_day, last_day."""
+    q = (select(DailyAttendance.user_id, User.full_name, User.username,
+                func.count(DailyAttendance.day).label('days_present'),
+                func.sum(DailyAttendance.event_count).label('events'),
+                func.min(DailyAttendance.day).label('first_day'),
+                func.max(DailyAttendance.day).label('last_day'))
+         .join(User, User.id == DailyAttendance.user_id))
+    return (_in_range(q, start, end)
+            .group_by(DailyAttendance.user_id, User.full_name, User.username)
+            .order_by(User.full_name))
+
+
+def student_summary(start: date | None = None, end: date | None = None):
+    return db.session.execute(student_summary_query(start, end)).all()
+
+
+def active_days(start: date | None = None, end: date | None = None) -> int:
+    """Days in range with any attendance at all (denominator for attendance %)."""
+    q = _in_range(select(func.count(distinct(DailyAttendance.day))), start, end)
+    return db.session.execute(q).scalar() or 0
@@ -1,10 +1,16 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, Response
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.models import User, AttendanceLog
+from app.face_utils.gallery import get_gallery
+from app.face_utils.engine import get_engine
+from app.face_utils.embed_cache import get_embed_cache
+from app.attendance_writer import get_writer
+from app.live_feed import get_live_feed
+from app.log_queries import archived_log_rows, log_page, log_rows_query, page_urls, stream_csv
+from app.metrics import render as render_metrics
+from app.user_directory import directory_urls, normalize_username, user_page
 from datetime import datetime
-import csv
-import io
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -24,8 +30,9 @@ def _parse_date(s: str | None):
 def view_users():
     if not is_admin():
         return "Unauthorized", 403
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('admin/manage_users.html', users=users)
+    page = user_page(q=request.args.get('q'), after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('admin/manage_users.html', users=page.rows, q=request.args.get('q', ''),
+                           pager=directory_urls(page, 'admin.view_users'))
 
 @admin_bp.route('/add_user', methods=['POST'])
 @login_required
@@ -33,7 +40,7 @@ def add_user():
     if not is_admin():
         return "Unauthorized", 403
 
-    username = (request.form.get('username') or '').strip().lower()
+    username = normalize_username(request.form.get('username'))
     full_name = (request.form.get('full_name') or '').strip()
     password = request.form.get('password') or ''
     role = (request.form.get('role') or '').strip() or 'student'
@@ -69,6 +76,7 @@ def delete_user(user_id):
     try:
         db.session.delete(user)  # cascades to attendance_logs via model relationship
         db.session.commit()
+        get_gallery().remove_user(user_id)
         flash(f'User {user.full_name} deleted.', 'info')
     except Exception as e:
         db.session.rollback()
@@ -109,11 +117,9 @@ def view_user_logs(user_id):
     if not user:
         return "User not found", 404
 
-    logs = (AttendanceLog.query
-            .filter_by(user_id=user_id)
-            .order_by(AttendanceLog.timestamp.desc())
-            .all())
-    return render_template('admin/user_logs.html', user=user, logs=logs)
+    page = log_page(user_id=user_id, after=request.args.get("after"), before=request.args.get("before"))
+    return render_template('admin/user_logs.html', user=user, logs=page.rows,
+                           pager=page_urls(page, 'admin.view_user_logs', user_id=user_id))
 
 # ---------- NEW: All logs (admin-wide) + CSV export ----------
 @admin_bp.route('/all_logs', methods=['GET'])
@@ -125,14 +131,9 @@ def view_all_logs():
     start = _parse_date(request.args.get("from"))
     end = _parse_date(request.args.get("to"))
 
-    q = AttendanceLog.query
-    if start:
-        q = q.filter(AttendanceLog.timestamp >= start)
-    if end:
-        q = q.filter(AttendanceLog.timestamp < end.replace(hour=23, minute=59, second=59, microsecond=999999))
-
-    logs = q.order_by(AttendanceLog.timestamp.desc()).all()
-    return render_template('admin/all_logs.html', logs=logs, start=start, end=end)
+    page = log_page(start=start, end=end, after=request.args.get("after"), before=request.args.get("before"))
+    return render_template('admin/all_logs.html', logs=page.rows, start=start, end=end,
+                           pager=page_urls(page, 'admin.view_all_logs'))
 
 @admin_bp.route('/all_logs/export', methods=['GET'])
 @login_required
@@ -143,23 +144,11 @@ def export_all_logs():
     start = _parse_date(request.args.get("from"))
     end = _parse_date(request.args.get("to"))
 
-    q = AttendanceLog.query
-    if start:
-        q = q.filter(AttendanceLog.timestamp >= start)
-    if end:
-        q = q.filter(AttendanceLog.timestamp < end.replace(hour=23, minute=59, second=59, microsecond=999999))
-
-    logs = q.order_by(AttendanceLog.timestamp.desc()).all()
-
-    out = io.StringIO()
-    w = csv.writer(out)
-    w.writerow(["user_id", "full_name", "username", "role", "status", "timestamp"])
-    for l in logs:
-        w.writerow([l.user_id, l.user.full_name, l.user.username, l.user.role,
-                    l.status, l.timestamp.isoformat(sep=' ', timespec='seconds')])
-
-    return Response(out.getvalue(), mimetype='text/csv',
-                    headers={'Content-Disposition': 'attachment; filename="attendance_all.csv"'})
+    cols = (AttendanceLog.user_id, User.full_name, User.username, User.role,
+            AttendanceLog.status, AttendanceLog.timestamp)
+    return stream_csv(["user_id", "full_name", "username", "role", "status", "timestamp"],
+                      log_rows_query(*cols, start=start, end=end), "attendance_all.csv",
+                      archived=archived_log_rows(*cols, start=start, end=end))
 
 # ---------- NEW: System Settings (Coming Soon placeholder) ----------
 @admin_bp.route('/settings', methods=['GET'])
@@ -168,3 +157,28 @@ def system_settings():
     if not is_admin():
         return "Unauthorized", 403
     return render_template('admin/settings.html')
+
+# Prometheus text exposition of app/metrics.py
+@admin_bp.route('/metrics', methods=['GET'])
+@login_required
+def metrics_text():
+    if not is_admin():
+        return "Unauthorized", 403
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+# Embedding engine status (pool size, queue, per-task timings), attendance writer,
+# embedding cache and live feed counters as JSON
+@admin_bp.route('/engine', methods=['GET'])
+@login_required
+def engine_stats():
+    if not is_admin():
+        return "Unauthorized", 403
+    stats = get_engine().stats()
+    stats["attendance_writer"] = get_writer().stats()
+    stats["embed_cache"] = get_embed_cache().stats()
+    stats["gallery"] = get_gallery().stats()
+    stats["live_feed"] = get_live_feed().stats()
+    stats["startup"] = current_app.extensions["startup"].as_dict()
+    if "warmup" in current_app.extensions:
+        stats["warmup"] = current_app.extensions["warmup"].as_dict()
+    return jsonify(stats)
@@ -0,0 +1,285 @@
+# app/routes/api.py
+"""
+Versioned JSON API for kiosk devices.
+
+    POST /api/v1/recognize
+    Authorization: Bearer <device token>     (see tools/create_device.py)
+
+Images come either as multipart files (any number of ``images`` fields) or as
+JSON::
+
+    {"images": ["<base64>", {"id": "cam1-0042", "data": "<base64 or data: URL>"}],
+     "mode": "identify", "mark": true, "location": "Room 101"}
+
+``mode`` is ``identify`` (one face per image, like the kiosk page) or
+``group`` (every face in every image). All images are submitted to the
+embedding engine at once and matched against the gallery in a single batch.
+A student recognized in several images of the same call is marked once, on
+the best-scoring face. Every image gets its own result entry::
+
+    {"index": 0, "id": "cam1-0042", "status": "ok",
+     "faces": [{"box": null, "status": "matched", "user_id": 3, "username": "...",
+                "full_name": "...", "score": 0.91, "log_id": 1234}]}
+
+Image status is ``ok``, ``no_face``, ``rejected`` (identify mode: the quality
+gate turned the image away; with ``reason``, e.g. ``blurry``, and a readable
+``error``) or ``error`` (with ``error``); face status is ``matched``,
+``duplicate`` or ``unknown``. The top level carries ``marked``
+and, if the attendance write failed, ``mark_error``.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+import numpy as np
+from flask import Blueprint, current_app, g, jsonify, request
+
+from app import db
+from app.models import Device, User
+from app.attendance_writer import get_writer
+from app.face_utils.embed_cache import MISSING, get_embed_cache
+from app.face_utils.engine import EngineBusy, EngineTimeout, get_engine
+from app.face_utils.quality import PoorQuality, thresholds_from_config
+from app.routes.recognition import match_faces
+
+api_bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+API_MODES = {"identify": "image", "group": "group"}
+
+# Only refresh devices.last_seen_at this often (it is a write per call otherwise)
+LAST_SEEN_RESOLUTION = timedelta(seconds=60)
+
+
+def _error(message: str, status: int):
+    return jsonify({"error": message}), status
+
+
+# -----------------------------------------------------------
+# Device authentication
+# -----------------------------------------------------------
+def _device_token() -> str:
+    auth = request.headers.get("Authorization", "")
+    if auth[:7].lower() == "bearer ":
+        return auth[7:].strip()
+    return request.headers.get("X-Device-Token", "").strip()
+
+
+def device_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _device_token()
+        device = None
+        if token:
+            device = Device.query.filter_by(token_hash=Device.hash_token(token), is_active=True).first()
+        if device is None:
+            return _error("Invalid or missing device token.", 401)
+        now = datetime.utcnow()
+        if device.last_seen_at is None or now - device.last_seen_at > LAST_SEEN_RESOLUTION:
+            device.last_seen_at = now
+            try:
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+        g.device = device
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# -----------------------------------------------------------
+# Request parsing
+# -----------------------------------------------------------
+def _b64(data: str) -> bytes:
+    if data.startswith("data:"):
+        data = data.split(",", 1)[-1]
+    return base64.b64decode(data, validate=True)
+
+
+def _flag(value, default: bool) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _parse_request() -> tuple[list[tuple[str | None, bytes]], dict]:
+    """``([(client_id, image_bytes), ...], options)``; raises ValueError on bad input."""
+    if request.files:
+        images = [(f.filename or None, f.read()) for f in request.files.getlist("images")]
+        images += [(f.filename or None, f.read()) for f in request.files.getlist("image")]
+        return images, request.form.to_dict()
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ValueError("Send images as multipart files or a JSON object with an 'images' list.")
+    raw = body.get("images")
+    if not isinstance(raw, list):
+        raise ValueError("'images' must be a list.")
+    images = []
+    for i, item in enumerate(raw):
+        client_id, data = (item.get("id"), item.get("data")) if isinstance(item, dict) else (None, item)
+        if not isinstance(data, str):
+            raise ValueError(f"images[{i}]: expected a base64 string.")
+        try:
+            images.append((client_id, _b64(data)))
+        except (binascii.Error, ValueError):
+            raise ValueError(f"images[{i}]: invalid base64 data.")
+    return images, body
+
+
+# -----------------------------------------------------------
+# Embedding (concurrent, cache-aware)
+# -----------------------------------------------------------
+def _embed_all(task: str, payloads: list[bytes]) -> tuple[list, list[str | None], list[PoorQuality | None]]:
+    """Submit every payload to the engine before waiting on any of them.
+
+    Single-face images go through the quality gate when it is enabled;
+    rejections come back in the third list.
+    """
+    engine, cache = get_engine(), get_embed_cache()
+    th = thresholds_from_config(current_app.config) if task == "image" else None
+    if th is not None:
+        task = "image_checked"
+    results: list = [None] * len(payloads)
+    errors: list[str | None] = [None] * len(payloads)
+    rejected: list[PoorQuality | None] = [None] * len(payloads)
+    futures = {}
+    for i, payload in enumerate(payloads):
+        key = cache.key(task, payload) if cache.enabled else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not MISSING:
+                results[i] = cached
+                continue
+        try:
+            futures[i] = (engine.submit(task, payload if th is None else (payload, th)), key)
+        except EngineBusy as e:
+            errors[i] = str(e)
+
+    deadline = time.monotonic() + engine.timeout
+    for i, (fut, key) in futures.items():
+        try:
+            results[i] = engine.result(fut, timeout=max(0.0, deadline - time.monotonic()))
+        except EngineTimeout as e:
+            errors[i] = str(e)
+            continue
+        except PoorQuality as e:
+            rejected[i] = e
+            continue
+        except Exception as e:
+            current_app.logger.exception("API embedding failed")
+            errors[i] = f"Failed to process image: {e}"
+            continue
+        if key is not None:
+            cache.put(key, results[i])
+    return results, errors, rejected
+
+
+def _collect_faces(mode: str, results: list) -> tuple[list[np.ndarray], list, list[int]]:
+    """Flatten per-image embeddings into (vectors, boxes, owning image index)."""
+    vecs, boxes, owner = [], [], []
+    for i, res in enumerate(results):
+        if res is None:
+            continue
+        if mode == "identify":
+            if res.size:
+                vecs.append(res[None, :])
+                boxes.append(None)
+                owner.append(i)
+        else:
+            face_vecs, face_boxes = res
+            vecs.append(face_vecs)
+            boxes.extend(face_boxes)
+            owner.extend([i] * len(face_boxes))
+    return vecs, boxes, owner
+
+
+# -----------------------------------------------------------
+# Routes
+# -----------------------------------------------------------
+@api_bp.route("/ping", methods=["GET"])
+@device_required
+def ping():
+    return jsonify({"device": g.device.name, "location": g.device.location,
+                    "time": datetime.utcnow().isoformat(timespec="seconds") + "Z"})
+
+
+@api_bp.route("/recognize", methods=["POST"])
+@device_required
+def recognize():
+    t0 = time.perf_counter()
+    try:
+        images, opts = _parse_request()
+    except ValueError as e:
+        return _error(str(e), 400)
+    if not images:
+        return _error("No images supplied.", 400)
+    max_images = current_app.config["API_MAX_IMAGES"]
+    if len(images) > max_images:
+        return _error(f"At most {max_images} images per request.", 413)
+
+    mode = str(opts.get("mode") or "identify").lower()
+    if mode not in API_MODES:
+        return _error(f"mode must be one of {sorted(API_MODES)}.", 400)
+    mark = _flag(opts.get("mark"), True)
+    location = (str(opts.get("location") or "").strip() or g.device.location)
+
+    results, errors, rejected = _embed_all(API_MODES[mode], [data for _, data in images])
+
+    out = []
+    for i, (client_id, _) in enumerate(images):
+        entry = {"index": i, "id": client_id, "status": "ok", "faces": []}
+        if errors[i]:
+            entry.update(status="error", error=errors[i])
+        elif rejected[i] is not None:
+            entry.update(status="rejected", reason=rejected[i].reason, error=str(rejected[i]))
+        elif results[i] is None:
+            entry.update(status="error", error="Could not decode image.")
+        out.append(entry)
+
+    vecs, boxes, owner = _collect_faces(mode, results)
+    faces = []
+    if vecs:
+        stacked = np.vstack(vecs)
+        faces = match_faces(stacked, None if mode == "identify" else np.asarray(boxes))
+    ids = {f["user_id"] for f in faces if f["user_id"] is not None}
+    users = {u.id: u for u in User.query.with_entities(User.id, User.username, User.full_name)
+             .filter(User.id.in_(ids))} if ids else {}
+    for f, i in zip(faces, owner):
+        u = users.get(f["user_id"])
+        f["username"] = u.username if u else None
+        f["full_name"] = u.full_name if u else None
+        f["log_id"] = None
+        out[i]["faces"].append(f)
+    for entry in out:
+        if entry["status"] == "ok" and not entry["faces"]:
+            entry["status"] = "no_face"
+
+    marked = 0
+    mark_error = None
+    matched = [f for f in faces if f["status"] == "matched"]
+    if mark and matched:
+        try:
+            log_ids = get_writer().write_many([{"user_id": f["user_id"], "status": "TIME_IN", "location": location}
+                                               for f in matched])
+            for f, log_id in zip(matched, log_ids):
+                f["log_id"] = log_id
+            marked = len(log_ids)
+        except Exception as e:
+            # match results are still useful to the kiosk; it can retry the mark
+            current_app.logger.exception("API attendance write failed")
+            mark_error = f"Failed to mark attendance: {e}"
+
+    current_app.logger.info(f"[api] device={g.device.name} images={len(images)} faces={len(faces)} marked={marked}")
+    return jsonify({
+        "device": g.device.name,
+        "mode": mode,
+        "results": out,
+        "marked": marked,
+        "mark_error": mark_error,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+    })
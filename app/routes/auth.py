@@ -1,19 +1,20 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required
-from sqlalchemy import func
 from app import db
 from app.models import User
+from app.user_directory import normalize_username
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        username = (request.form.get('username') or '').strip()
+        username = normalize_username(request.form.get('username'))
         password = request.form.get('password') or ''
 
-        # case-insensitive lookup
-        user = User.query.filter(func.lower(User.username) == username.lower()).first()
+        # usernames are stored lowercase, so plain equality is case-insensitive
+        # and can use the unique index
+        user = User.query.filter_by(username=username).first()
 
         if user and user.check_password(password):
             login_user(user)
@@ -35,7 +36,7 @@ def logout():
 def register():
     if request.method == 'POST':
         full_name = (request.form.get('full_name') or '').strip()
-        username  = (request.form.get('username') or '').strip().lower()   # store lowercase
+        username  = normalize_username(request.form.get('username'))   # store lowercase
         password  = request.form.get('password') or ''
 
         if not username or not full_name or not password:
@@ -43,7 +44,7 @@ def register():
             return redirect(url_for('auth.register'))
 
         # ensure uniqueness in lowercase space
-        existing_user = User.query.filter(func.lower(User.username) == username).first()
+        existing_user = User.query.filter_by(username=username).first()
         if existing_user:
             flash('Username already taken.', 'warning')
             return redirect(url_for('auth.register'))
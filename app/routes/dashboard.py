@@ -1,9 +1,13 @@
-from flask import Blueprint, render_template, request, Response
+import json
+from flask import Blueprint, Response, current_app, render_template, request, stream_with_context, url_for
 from flask_login import login_required, current_user
-from app.models import AttendanceLog
-from datetime import datetime
-import csv
-import io
+from sqlalchemy import func, select
+from app import db
+from app.models import User, AttendanceLog
+from app.live_feed import FeedBusy, FeedEvent, FeedFilter, get_live_feed
+from app.log_queries import archived_log_rows, end_of_day, log_page, log_rows_query, page_urls, stream_csv
+from app.reports import active_days, daily_summary, student_summary, student_summary_query
+from datetime import datetime, timedelta
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -35,13 +39,9 @@ def faculty_logs():
         return "Unauthorized", 403
     start = _parse_date(request.args.get("from"))
     end = _parse_date(request.args.get("to"))
-    q = AttendanceLog.query
-    if start:
-        q = q.filter(AttendanceLog.timestamp >= start)
-    if end:
-        q = q.filter(AttendanceLog.timestamp < (end.replace(hour=23, minute=59, second=59, microsecond=999999)))
-    logs = q.order_by(AttendanceLog.timestamp.desc()).all()
-    return render_template('dashboard/faculty_logs.html', logs=logs, start=start, end=end)
+    page = log_page(start=start, end=end, after=request.args.get("after"), before=request.args.get("before"))
+    return render_template('dashboard/faculty_logs.html', logs=page.rows, start=start, end=end,
+                           pager=page_urls(page, 'dashboard.faculty_logs'))
 
 @dashboard_bp.route('/faculty/logs/export')
 @login_required
@@ -50,57 +50,189 @@ def faculty_logs_export():
         return "Unauthorized", 403
     start = _parse_date(request.args.get("from"))
     end = _parse_date(request.args.get("to"))
-    q = AttendanceLog.query
-    if start:
-        q = q.filter(AttendanceLog.timestamp >= start)
-    if end:
-        q = q.filter(AttendanceLog.timestamp < (end.replace(hour=23, minute=59, second=59, microsecond=999999)))
-    logs = q.order_by(AttendanceLog.timestamp.desc()).all()
-
-    out = io.StringIO()
-    w = csv.writer(out)
-    w.writerow(["user_id", "full_name", "username", "status", "timestamp"])
-    for l in logs:
-        w.writerow([l.user_id, l.user.full_name, l.user.username, l.status,
-                    l.timestamp.isoformat(sep=' ', timespec='seconds')])
-
-    return Response(out.getvalue(), mimetype='text/csv',
-                    headers={'Content-Disposition': 'attachment; filename="attendance_faculty_view.csv"'})
-
-# ---------- NEW: Faculty reports (Coming Soon placeholder) ----------
+    cols = (AttendanceLog.user_id, User.full_name, User.username, AttendanceLog.status, AttendanceLog.timestamp)
+    return stream_csv(["user_id", "full_name", "username", "status", "timestamp"],
+                      log_rows_query(*cols, start=start, end=end), "attendance_faculty_view.csv",
+                      archived=archived_log_rows(*cols, start=start, end=end))
+
+# Faculty-only: live attendance feed (server-sent events, see app/live_feed.py)
+LIVE_RETRY_MS = 3000
+
+def _live_user():
+    """The ``user`` filter as a user id: a numeric id or a username. Raises ValueError if unknown."""
+    value = (request.args.get("user") or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        user_id = db.session.scalar(select(User.id).where(User.id == int(value)))
+    else:
+        user_id = db.session.scalar(select(User.id).where(User.username == value))
+    if user_id is None:
+        raise ValueError(f"Unknown user {value!r}.")
+    return user_id
+
+def _live_replay(flt, after_id, limit):
+    """Logs matching ``flt`` committed after ``after_id``, oldest first; None if there are more than ``limit``."""
+    cols = (AttendanceLog.id, AttendanceLog.user_id, User.username, User.full_name,
+            AttendanceLog.status, AttendanceLog.location, AttendanceLog.timestamp)
+    q = (log_rows_query(*cols, start=flt.start, user_id=flt.user_id)
+         .where(AttendanceLog.id > after_id).order_by(None).order_by(AttendanceLog.id.asc()).limit(limit + 1))
+    if flt.end is not None:
+        q = q.where(AttendanceLog.timestamp < flt.end)
+    try:
+        rows = db.session.execute(q).all()
+    finally:
+        # an open stream should not pin a pooled connection between replays
+        db.session.close()
+    return None if len(rows) > limit else [FeedEvent(*r) for r in rows]
+
+def _sse(event=None, data=None, id=None):
+    out = ""
+    if id is not None:
+        out += f"id: {id}\n"
+    if event:
+        out += f"event: {event}\n"
+    return out + f"data: {json.dumps(data)}\n\n"
+
+def _live_stream(feed, sub, flt, last_id, replay_max, heartbeat):
+    """Replay what the client missed, then relay the subscription until it disconnects.
+
+    ``sent`` is the newest log id the client has; anything at or below it that
+    also arrives live is skipped. When the subscriber's buffer overflowed, the
+    missing rows are backfilled from the table the same way a reconnect would.
+    """
+    sent = last_id
+    try:
+        yield f"retry: {LIVE_RETRY_MS}\n\n"
+        backfill = sent is not None
+        while True:
+            if backfill:
+                rows = _live_replay(flt, sent, replay_max)
+                if rows is None:
+                    # too far behind to replay: have the client reload, and resume from now on reconnect
+                    sent = db.session.scalar(select(func.max(AttendanceLog.id))) or 0
+                    db.session.close()
+                    yield _sse("reset", {"reason": "too many missed events"}, id=sent)
+                else:
+                    for e in rows:
+                        yield _sse("attendance", e.as_dict(), id=e.id)
+                        sent = e.id
+                backfill = False
+            events, dropped = sub.get(heartbeat)
+            if dropped and sent is not None:
+                # what is still buffered is committed too: replay the whole range in order instead
+                backfill = True
+                continue
+            if dropped:
+                yield _sse("gap", {"dropped": dropped})
+            fresh = [e for e in events if sent is None or e.id > sent]
+            for e in fresh:
+                yield _sse("attendance", e.as_dict(), id=e.id)
+                sent = e.id
+            if not fresh:
+                yield ": keepalive\n\n"
+    finally:
+        feed.unsubscribe(sub)
+
+@dashboard_bp.route('/faculty/live')
+@login_required
+def faculty_live():
+    if current_user.role != 'faculty':
+        return "Unauthorized", 403
+    if not get_live_feed().enabled:
+        return "Live feed is disabled", 404
+    start = _parse_date(request.args.get("from"))
+    end = _parse_date(request.args.get("to"))
+    try:
+        user_id = _live_user()
+    except ValueError as e:
+        return str(e), 400
+    # taken before the listing, so the stream resumes from exactly what the page shows
+    last_id = db.session.scalar(select(func.max(AttendanceLog.id))) or 0
+    page = log_page(start=start, end=end, user_id=user_id)
+    return render_template('dashboard/faculty_live.html', logs=page.rows, start=start, end=end,
+                           user_filter=request.args.get("user", ""),
+                           stream_url=url_for('dashboard.faculty_live_stream',
+                                              **{**request.args.to_dict(), "last_id": last_id}))
+
+@dashboard_bp.route('/faculty/live/stream')
+@login_required
+def faculty_live_stream():
+    if current_user.role != 'faculty':
+        return "Unauthorized", 403
+    feed = get_live_feed()
+    if not feed.enabled:
+        return "Live feed is disabled", 404
+    start = _parse_date(request.args.get("from"))
+    end = _parse_date(request.args.get("to"))
+    try:
+        user_id = _live_user()
+    except ValueError as e:
+        return str(e), 400
+    resume = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+    last_id = int(resume) if resume and resume.isdigit() else None
+    flt = FeedFilter(start=start, end=end_of_day(end) if end else None, user_id=user_id)
+    try:
+        # subscribe before replaying so nothing committed in between is lost
+        sub = feed.subscribe(flt)
+    except FeedBusy as e:
+        return str(e), 503
+    db.session.close()
+    cfg = current_app.config
+    gen = _live_stream(feed, sub, flt, last_id, cfg['LIVE_FEED_REPLAY_MAX'], cfg['LIVE_FEED_HEARTBEAT'])
+    return Response(stream_with_context(gen), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Faculty reports, answered from the attendance_daily rollup
+REPORT_DEFAULT_DAYS = 30
+
+def _report_range():
+    start = _parse_date(request.args.get("from"))
+    end = _parse_date(request.args.get("to"))
+    if not start and not end:
+        end = datetime.utcnow()
+        start = end - timedelta(days=REPORT_DEFAULT_DAYS - 1)
+    return start, end
+
 @dashboard_bp.route('/faculty/reports')
 @login_required
 def faculty_reports():
     if current_user.role != 'faculty':
         return "Unauthorized", 403
-    # Simple placeholder page; keeps a link to existing CSV export as an interim.
-    return render_template('dashboard/faculty_reports.html')
-    
+    start, end = _report_range()
+    start_d = start.date() if start else None
+    end_d = end.date() if end else None
+    return render_template('dashboard/faculty_reports.html',
+                           start=start, end=end,
+                           days=daily_summary(start_d, end_d),
+                           students=student_summary(start_d, end_d),
+                           active_days=active_days(start_d, end_d))
+
+@dashboard_bp.route('/faculty/reports/export')
+@login_required
+def faculty_reports_export():
+    if current_user.role != 'faculty':
+        return "Unauthorized", 403
+    start, end = _report_range()
+    query = student_summary_query(start.date() if start else None, end.date() if end else None)
+    return stream_csv(["user_id", "full_name", "username", "days_present", "events", "first_day", "last_day"],
+                      query, "attendance_report.csv", ts_index=None)
+
 # Student-only: my logs
 @dashboard_bp.route('/student/logs')
 @login_required
 def student_logs():
     if current_user.role != 'student':
         return "Unauthorized", 403
-    logs = (AttendanceLog.query
-            .filter_by(user_id=current_user.id)
-            .order_by(AttendanceLog.timestamp.desc())
-            .all())
-    return render_template('dashboard/student_logs.html', logs=logs)
+    page = log_page(user_id=current_user.id, after=request.args.get("after"), before=request.args.get("before"))
+    return render_template('dashboard/student_logs.html', logs=page.rows,
+                           pager=page_urls(page, 'dashboard.student_logs'))
 
 @dashboard_bp.route('/student/logs/export')
 @login_required
 def student_logs_export():
     if current_user.role != 'student':
         return "Unauthorized", 403
-    logs = (AttendanceLog.query
-            .filter_by(user_id=current_user.id)
-            .order_by(AttendanceLog.timestamp.desc())
-            .all())
-    out = io.StringIO()
-    w = csv.writer(out)
-    w.writerow(["status", "timestamp"])
-    for l in logs:
-        w.writerow([l.status, l.timestamp.isoformat(sep=' ', timespec='seconds')])
-    return Response(out.getvalue(), mimetype='text/csv',
-                    headers={'Content-Disposition': 'attachment; filename="my_attendance.csv"'})
+    cols = (AttendanceLog.status, AttendanceLog.timestamp)
+    return stream_csv(["status", "timestamp"], log_rows_query(*cols, user_id=current_user.id), "my_attendance.csv",
+                      archived=archived_log_rows(*cols, user_id=current_user.id))
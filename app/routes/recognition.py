@@ -1,49 +1,65 @@
 # app/routes/recognition.py
 from __future__ import annotations
 
+import importlib.util
 import io
+import os
+import tempfile
+import threading
 import numpy as np
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy import func
 from app import db
-from app.models import AttendanceLog
+from app.models import User, FaceTemplate
+from app.face_utils.gallery import get_gallery
+from app.face_utils.engine import get_engine
+from app.face_utils.embed_cache import get_embed_cache
+from app.face_utils.embedding_format import current_format, decode_current, encode_current, to_current
+from app.face_utils.matcher import score_templates
+from app.face_utils.quality import PoorQuality, thresholds_from_config
+from app.face_utils.video import VideoJob, VideoOptions, aggregate_track
+from app.attendance_writer import get_writer
 
 recognition_bp = Blueprint("recognition", __name__, url_prefix="/recognition")
 
 # -----------------------------------------------------------
-# Embedding providers (now guaranteed to exist via our pipeline)
+# Embedding providers
 # -----------------------------------------------------------
-try:
-    from app.face_utils.pipeline import get_live_face_embedding as _live_embed
-    from app.face_utils.pipeline import get_image_embedding as _image_embed
-except Exception as e:
-    _live_embed = None
-    _image_embed = None
+# The pipeline (and OpenCV with it) is imported on first use rather than with
+# this module, so the app factory and CLI tools start without loading it.
+_FEATURE_NAMES = {"live": "live capture", "image": "image upload", "group": "group photos",
+                  "video": "video clips"}
+_cv2_available: bool | None = None
+
+def _face_engine_available() -> bool:
+    global _cv2_available
+    if _cv2_available is None:
+        _cv2_available = importlib.util.find_spec("cv2") is not None
+    return _cv2_available
+
+def _live_embed() -> np.ndarray | None:
+    from app.face_utils.pipeline import get_live_face_embedding
+    # with the quality gate on, a burst of frames is scored and only the best one embedded
+    return get_live_face_embedding(thresholds_from_config(current_app.config))
 
 # Tune for your simple embedding: higher => stricter match
 MIN_COSINE_SIM = 0.75
 
+# How many candidates the kiosk identify page shows
+IDENTIFY_TOP_K = 3
+
 # -----------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------
+# Stored blobs are versioned (see embedding_format); both helpers work in the
+# configured format's space, which is also the gallery's matching space.
 def _bytes_to_vec(b: bytes | None) -> np.ndarray | None:
-    if not b:
-        return None
-    arr = np.frombuffer(b, dtype=np.float32)
-    return arr if arr.size else None
+    vec = decode_current(b)
+    return vec if vec is not None and vec.size else None
 
 def _vec_to_bytes(arr: np.ndarray) -> bytes:
-    arr = np.asarray(arr, dtype=np.float32).ravel()
-    return arr.tobytes()
-
-def _cosine(a: np.ndarray | None, b: np.ndarray | None) -> float:
-    if a is None or b is None:
-        return -1.0
-    na = np.linalg.norm(a)
-    nb = np.linalg.norm(b)
-    if na == 0 or nb == 0:
-        return -1.0
-    return float(np.dot(a, b) / (na * nb))
+    return encode_current(arr)
 
 def _require_student():
     if current_user.role != "student":
@@ -52,22 +68,124 @@ def _require_student():
     return True
 
 def _ensure_face_engine(feature: str) -> bool:
-    if feature == "live" and _live_embed is None:
-        current_app.logger.error("Face engine missing: live embedding not available.")
-        flash("Face engine for live capture is not configured.", "danger")
+    if not _face_engine_available():
+        current_app.logger.error(f"Face engine missing: OpenCV not installed ({feature} embedding).")
+        flash(f"Face engine for {_FEATURE_NAMES[feature]} is not configured.", "danger")
         return False
-    if feature == "image" and _image_embed is None:
-        current_app.logger.error("Face engine missing: image embedding not available.")
-        flash("Face engine for image upload is not configured.", "danger")
+    return True
+
+def _require_kiosk_operator():
+    if current_user.role not in ("admin", "faculty"):
+        flash("Only faculty or admin accounts can identify students.", "warning")
         return False
     return True
 
+def _skip_embed_cache() -> bool:
+    # per-request opt-out: "Cache-Control: no-cache" recomputes (and re-caches)
+    return "no-cache" in request.headers.get("Cache-Control", "")
+
+def _embed_upload(buf: bytes) -> np.ndarray | None:
+    # decode/detect/normalize runs in the engine's worker pool, not this thread;
+    # byte-identical retries are answered from the content-hash cache.
+    # Raises PoorQuality when the quality gate turns the image away.
+    th = thresholds_from_config(current_app.config)
+    if th is None:
+        return get_embed_cache().get_or_compute("image", buf, lambda: get_engine().embed_image(buf),
+                                                refresh=_skip_embed_cache())
+    return get_embed_cache().get_or_compute("image_checked", buf,
+                                            lambda: get_engine().run("image_checked", (buf, th)),
+                                            refresh=_skip_embed_cache())
+
+def _embed_group_upload(buf: bytes) -> tuple[np.ndarray, np.ndarray] | None:
+    return get_embed_cache().get_or_compute("group", buf, lambda: get_engine().embed_faces(buf),
+                                            refresh=_skip_embed_cache())
+
+def _fusion() -> str:
+    return current_app.config['FACE_TEMPLATE_FUSION']
+
+def _template_count(user_id: int) -> int:
+    return db.session.query(FaceTemplate.id).filter(FaceTemplate.user_id == user_id).count()
+
 def _match_current_user(probe_vec: np.ndarray) -> bool:
-    ref_vec = _bytes_to_vec(current_user.face_embedding)
-    sim = _cosine(probe_vec, ref_vec)
-    current_app.logger.info(f"[recognition] user={current_user.id} cosine={sim:.3f}")
+    blobs = db.session.query(FaceTemplate.embedding).filter(FaceTemplate.user_id == current_user.id)
+    refs = [v for v in (_bytes_to_vec(b) for (b,) in blobs) if v is not None]
+    sim = score_templates(to_current(probe_vec), np.vstack(refs), _fusion()) if refs else -1.0
+    current_app.logger.info(f"[recognition] user={current_user.id} templates={len(refs)} "
+                            f"{_fusion()}-cosine={sim:.3f}")
     return sim >= MIN_COSINE_SIM
 
+def load_gallery() -> int:
+    """(Re)fill the gallery from every stored template (rebuilds the mmap store)."""
+    gallery = get_gallery()
+    rows = db.session.query(FaceTemplate.id, FaceTemplate.user_id, FaceTemplate.embedding).all()
+    n = gallery.load((tid, uid, _bytes_to_vec(blob)) for tid, uid, blob in rows)
+    current_app.logger.info(f"[recognition] gallery loaded: {n} templates for {gallery.user_count} users")
+    return n
+
+def _template_marker() -> tuple[int, int | None]:
+    count, max_id = db.session.query(func.count(FaceTemplate.id), func.max(FaceTemplate.id)).one()
+    return int(count), max_id
+
+_gallery_lock = threading.Lock()
+
+def ensure_gallery() -> None:
+    """Load the gallery on first use (or from the warmup hook), once per process.
+
+    With the mmap backend an existing store is attached instead, unless it is
+    missing or out of step with face_templates (then the first worker to get
+    here rebuilds it and the others attach to the result).
+    """
+    gallery = get_gallery()
+    if gallery.loaded:
+        return
+    with _gallery_lock:
+        if gallery.loaded:
+            return
+        if current_app.config['GALLERY_BACKEND'] == 'mmap':
+            marker = _template_marker()
+            if gallery.open(marker):
+                return
+            with gallery.exclusive():
+                if gallery.open(marker):
+                    return
+                current_app.logger.info(f"[recognition] gallery store at {gallery.path} missing or stale; rebuilding")
+                load_gallery()
+            return
+        load_gallery()
+
+def _save_template(probe_vec: np.ndarray, source: str, meta: dict | None = None) -> bool:
+    """Add a template for the current user, keeping only the newest FACE_TEMPLATES_PER_USER."""
+    cap = current_app.config['FACE_TEMPLATES_PER_USER']
+    # attach before inserting, so the new row doesn't make an mmap store look stale
+    ensure_gallery()
+    try:
+        tmpl = FaceTemplate(user_id=current_user.id, embedding=_vec_to_bytes(probe_vec), source=source,
+                            capture_meta={**(meta or {}), "format": current_format().name})
+        db.session.add(tmpl)
+        db.session.flush()
+        stale = [tid for (tid,) in (db.session.query(FaceTemplate.id)
+                                    .filter(FaceTemplate.user_id == current_user.id)
+                                    .order_by(FaceTemplate.captured_at.desc(), FaceTemplate.id.desc())
+                                    .offset(cap))]
+        if stale:
+            FaceTemplate.query.filter(FaceTemplate.id.in_(stale)).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Failed to save face template")
+        flash(f"Failed to save face: {e}", "danger")
+        return False
+    try:
+        gallery = get_gallery()
+        gallery.add(tmpl.id, current_user.id, to_current(probe_vec))
+        for tid in stale:
+            gallery.remove_template(tid)
+    except ValueError:
+        current_app.logger.exception("Gallery rejected new template; reloading")
+        load_gallery()
+    flash(f"Face template saved ({_template_count(current_user.id)} of {cap} kept for this account).", "success")
+    return True
+
 # -----------------------------------------------------------
 # Register face
 #   GET  -> show page (upload or start live)
@@ -86,6 +204,10 @@ def register_face():
             return redirect(url_for("recognition.register_face"))
         try:
             probe_vec = _live_embed()
+        except PoorQuality as e:
+            current_app.logger.info(f"[recognition] quality gate (register): {e.reason} {e.report}")
+            flash(str(e), "warning")
+            return redirect(url_for("recognition.register_face"))
         except Exception as e:
             current_app.logger.exception("Live embedding failed during register")
             flash(f"Failed to capture live face: {e}", "danger")
@@ -95,15 +217,7 @@ def register_face():
             flash("No face detected. Please try again.", "warning")
             return redirect(url_for("recognition.register_face"))
 
-        try:
-            current_user.face_embedding = _vec_to_bytes(probe_vec)
-            db.session.add(current_user)
-            db.session.commit()
-            flash("Face registered to this account.", "success")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.exception("Failed to save face embedding")
-            flash(f"Failed to save face: {e}", "danger")
+        _save_template(probe_vec, "live", {"camera": current_app.config['CAMERA_SOURCE']})
         return redirect(url_for("dashboard.dashboard_home"))
 
     # Upload image (POST)
@@ -117,7 +231,11 @@ def register_face():
 
         try:
             buf = io.BytesIO(file.read()).getvalue()
-            probe_vec = _image_embed(buf)
+            probe_vec = _embed_upload(buf)
+        except PoorQuality as e:
+            current_app.logger.info(f"[recognition] quality gate (register): {e.reason} {e.report}")
+            flash(str(e), "warning")
+            return redirect(url_for("recognition.register_face"))
         except Exception as e:
             current_app.logger.exception("Image embedding failed during register")
             flash(f"Failed to process uploaded image: {e}", "danger")
@@ -127,19 +245,13 @@ def register_face():
             flash("No face detected in the uploaded image.", "warning")
             return redirect(url_for("recognition.register_face"))
 
-        try:
-            current_user.face_embedding = _vec_to_bytes(probe_vec)
-            db.session.add(current_user)
-            db.session.commit()
-            flash("Face registered to this account.", "success")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.exception("Failed to save face embedding")
-            flash(f"Failed to save face: {e}", "danger")
+        _save_template(probe_vec, "upload", {"filename": file.filename})
         return redirect(url_for("dashboard.dashboard_home"))
 
     # Default GET -> render page
-    return render_template("recognition/register_face.html")
+    return render_template("recognition/register_face.html",
+                           template_count=_template_count(current_user.id),
+                           max_templates=current_app.config['FACE_TEMPLATES_PER_USER'])
 
 # -----------------------------------------------------------
 # Mark attendance
@@ -153,18 +265,15 @@ def mark_attendance():
     if not _require_student():
         return redirect(url_for("dashboard.dashboard_home"))
 
-    if not current_user.face_embedding:
+    if not _template_count(current_user.id):
         flash("No face registered for this account. Register your face first.", "warning")
         return redirect(url_for("recognition.register_face"))
 
     def _finalize_after_match():
         try:
-            log = AttendanceLog(user_id=current_user.id, status="TIME_IN")
-            db.session.add(log)
-            db.session.commit()
+            get_writer().write(current_user.id, status="TIME_IN")
             flash("Attendance marked successfully.", "success")
         except Exception as e:
-            db.session.rollback()
             current_app.logger.exception("Failed to write attendance log")
             flash(f"Failed to mark attendance: {e}", "danger")
         return redirect(url_for("dashboard.student_logs"))
@@ -175,6 +284,10 @@ def mark_attendance():
             return redirect(url_for("recognition.mark_attendance"))
         try:
             probe_vec = _live_embed()
+        except PoorQuality as e:
+            current_app.logger.info(f"[recognition] quality gate (mark): {e.reason} {e.report}")
+            flash(str(e), "warning")
+            return redirect(url_for("recognition.mark_attendance"))
         except Exception as e:
             current_app.logger.exception("Live embedding failed during mark")
             flash(f"Failed to capture live face: {e}", "danger")
@@ -200,7 +313,11 @@ def mark_attendance():
             return redirect(url_for("recognition.mark_attendance"))
         try:
             buf = io.BytesIO(file.read()).getvalue()
-            probe_vec = _image_embed(buf)
+            probe_vec = _embed_upload(buf)
+        except PoorQuality as e:
+            current_app.logger.info(f"[recognition] quality gate (mark): {e.reason} {e.report}")
+            flash(str(e), "warning")
+            return redirect(url_for("recognition.mark_attendance"))
         except Exception as e:
             current_app.logger.exception("Image embedding failed during mark")
             flash(f"Failed to process uploaded image: {e}", "danger")
@@ -218,3 +335,284 @@ def mark_attendance():
 
     # Default GET -> render page
     return render_template("recognition/mark.html")
+
+# -----------------------------------------------------------
+# Kiosk identify (1:N)
+#   GET  -> show page
+#   POST -> upload image, identify against every registered
+#           student and mark the best match
+# -----------------------------------------------------------
+@recognition_bp.route("/identify", methods=["GET", "POST"])
+@login_required
+def identify():
+    if not _require_kiosk_operator():
+        return redirect(url_for("dashboard.dashboard_home"))
+
+    if request.method == "POST":
+        if not _ensure_face_engine("image"):
+            return redirect(url_for("recognition.identify"))
+        file = request.files.get("image")
+        if not (file and file.filename):
+            flash("Please choose an image.", "warning")
+            return redirect(url_for("recognition.identify"))
+        try:
+            buf = io.BytesIO(file.read()).getvalue()
+            probe_vec = _embed_upload(buf)
+        except PoorQuality as e:
+            current_app.logger.info(f"[recognition] quality gate (identify): {e.reason} {e.report}")
+            flash(str(e), "warning")
+            return redirect(url_for("recognition.identify"))
+        except Exception as e:
+            current_app.logger.exception("Image embedding failed during identify")
+            flash(f"Failed to process uploaded image: {e}", "danger")
+            return redirect(url_for("recognition.identify"))
+
+        if probe_vec is None or (isinstance(probe_vec, np.ndarray) and probe_vec.size == 0):
+            flash("No face detected in the uploaded image.", "warning")
+            return redirect(url_for("recognition.identify"))
+
+        ensure_gallery()
+        hits = get_gallery().search(to_current(probe_vec), k=IDENTIFY_TOP_K, fusion=_fusion())
+        names = {}
+        if hits:
+            names = {u.id: u for u in User.query.filter(User.id.in_([uid for uid, _ in hits])).all()}
+        candidates = [(names[uid], score) for uid, score in hits if uid in names]
+        current_app.logger.info(f"[recognition] identify top={[(u.id, round(s, 3)) for u, s in candidates]}")
+
+        if not candidates or candidates[0][1] < MIN_COSINE_SIM:
+            flash("No registered student matched this face.", "danger")
+            return render_template("recognition/identify.html", candidates=candidates, threshold=MIN_COSINE_SIM)
+
+        match, score = candidates[0]
+        try:
+            get_writer().write(match.id, status="TIME_IN")
+            flash(f"Attendance marked for {match.full_name} ({match.username}), score {score:.3f}.", "success")
+        except Exception as e:
+            current_app.logger.exception("Failed to write attendance log")
+            flash(f"Failed to mark attendance: {e}", "danger")
+        return render_template("recognition/identify.html", candidates=candidates, threshold=MIN_COSINE_SIM)
+
+    # Default GET -> render page
+    return render_template("recognition/identify.html", candidates=None, threshold=MIN_COSINE_SIM)
+
+# -----------------------------------------------------------
+# Group / classroom photo
+#   GET  -> show page
+#   POST -> detect every face, match all of them against the
+#           gallery and mark every recognized student at once
+#   ?format=json returns the per-face results instead of HTML
+# -----------------------------------------------------------
+def match_faces(vecs: np.ndarray, boxes: np.ndarray | None = None) -> list[dict]:
+    """Match raw face vectors against the gallery in one batch.
+
+    Each user is claimed by at most one face (the best-scoring one); any other
+    face matching the same user is reported as ``duplicate``.
+    """
+    ensure_gallery()
+    hits = get_gallery().search_many(to_current(vecs), k=1, fusion=_fusion())
+    faces = []
+    best_face_of: dict[int, int] = {}
+    for i, top in enumerate(hits):
+        box = [int(v) for v in boxes[i]] if boxes is not None else None
+        face = {"box": box, "user_id": None, "score": None, "status": "unknown"}
+        if top:
+            uid, score = top[0]
+            face["score"] = score
+            if score >= MIN_COSINE_SIM:
+                face["user_id"] = uid
+                face["status"] = "matched"
+                prev = best_face_of.get(uid)
+                if prev is None or faces[prev]["score"] < score:
+                    if prev is not None:
+                        faces[prev]["status"] = "duplicate"
+                    best_face_of[uid] = i
+                else:
+                    face["status"] = "duplicate"
+        faces.append(face)
+    return faces
+
+@recognition_bp.route("/group", methods=["GET", "POST"])
+@login_required
+def group_photo():
+    if not _require_kiosk_operator():
+        return redirect(url_for("dashboard.dashboard_home"))
+    want_json = request.args.get("format") == "json"
+
+    if request.method == "POST":
+        if not _ensure_face_engine("group"):
+            return redirect(url_for("recognition.group_photo"))
+        file = request.files.get("image")
+        if not (file and file.filename):
+            flash("Please choose an image.", "warning")
+            return redirect(url_for("recognition.group_photo"))
+        location = (request.form.get("location") or "").strip() or None
+        try:
+            result = _embed_group_upload(file.read())
+        except Exception as e:
+            current_app.logger.exception("Group embedding failed")
+            flash(f"Failed to process uploaded image: {e}", "danger")
+            return redirect(url_for("recognition.group_photo"))
+
+        if result is None:
+            flash("Could not decode the uploaded image.", "warning")
+            return redirect(url_for("recognition.group_photo"))
+
+        vecs, boxes = result
+        faces = match_faces(vecs, boxes)
+        matched = [f for f in faces if f["status"] == "matched"]
+
+        users = {}
+        ids = {f["user_id"] for f in faces if f["user_id"] is not None}
+        if ids:
+            users = {u.id: u for u in User.query.filter(User.id.in_(ids)).all()}
+        for f in faces:
+            u = users.get(f["user_id"])
+            f["username"] = u.username if u else None
+            f["full_name"] = u.full_name if u else None
+
+        marked = 0
+        if matched:
+            try:
+                # one unit: the whole room lands in the same transaction
+                get_writer().write_many([{"user_id": f["user_id"], "status": "TIME_IN", "location": location}
+                                         for f in matched])
+                marked = len(matched)
+            except Exception as e:
+                current_app.logger.exception("Failed to write group attendance logs")
+                for f in matched:
+                    f["status"] = "error"
+                flash(f"Failed to mark attendance: {e}", "danger")
+        current_app.logger.info(f"[recognition] group faces={len(faces)} marked={marked}")
+
+        if want_json:
+            return jsonify({"faces": faces, "marked": marked})
+        if not faces:
+            flash("No faces detected in the uploaded image.", "warning")
+        elif marked:
+            flash(f"Marked {marked} of {len(faces)} detected face(s).", "success")
+        return render_template("recognition/group.html", faces=faces, threshold=MIN_COSINE_SIM)
+
+    # Default GET -> render page
+    return render_template("recognition/group.html", faces=None, threshold=MIN_COSINE_SIM)
+
+# -----------------------------------------------------------
+# Entrance video clip
+#   GET  -> show page
+#   POST -> track faces through the clip, match each track's
+#           samples against the gallery and mark every
+#           recognized student once
+#   ?format=json returns the per-track results instead of HTML
+# -----------------------------------------------------------
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v"}
+
+def match_tracks(tracks) -> list[dict]:
+    """Match every track's samples against the gallery in one batch.
+
+    Per-sample matches are combined per track (``aggregate_track``); a student
+    seen in several tracks is claimed by the best-scoring one, the others are
+    reported as ``duplicate``.
+    """
+    ensure_gallery()
+    stacked = [t.samples for t in tracks if len(t.samples)]
+    hits = get_gallery().search_many(to_current(np.vstack(stacked)), k=1, fusion=_fusion()) if stacked else []
+    out = []
+    best_track_of: dict[int, int] = {}
+    pos = 0
+    for i, t in enumerate(tracks):
+        n = len(t.samples)
+        uid, score = aggregate_track([top[0] if top else None for top in hits[pos:pos + n]], MIN_COSINE_SIM)
+        pos += n
+        entry = {"track": t.track_id, "first_s": t.first_s, "last_s": t.last_s, "hits": t.hits,
+                 "samples": n, "box": list(t.box), "user_id": uid, "score": score,
+                 "status": "matched" if uid is not None else "unknown"}
+        if uid is not None:
+            prev = best_track_of.get(uid)
+            if prev is None or out[prev]["score"] < score:
+                if prev is not None:
+                    out[prev]["status"] = "duplicate"
+                best_track_of[uid] = i
+            else:
+                entry["status"] = "duplicate"
+        out.append(entry)
+    return out
+
+@recognition_bp.route("/video", methods=["GET", "POST"])
+@login_required
+def video_attendance():
+    if not _require_kiosk_operator():
+        return redirect(url_for("dashboard.dashboard_home"))
+    want_json = request.args.get("format") == "json"
+
+    if request.method == "POST":
+        if not _ensure_face_engine("video"):
+            return redirect(url_for("recognition.video_attendance"))
+        file = request.files.get("video")
+        if not (file and file.filename):
+            flash("Please choose a video file.", "warning")
+            return redirect(url_for("recognition.video_attendance"))
+        ext = os.path.splitext(file.filename)[1].lower()
+        if ext not in VIDEO_EXTENSIONS:
+            flash(f"Unsupported video type '{ext or file.filename}'.", "warning")
+            return redirect(url_for("recognition.video_attendance"))
+        location = (request.form.get("location") or "").strip() or None
+
+        # OpenCV reads videos from a path, so the clip is spooled to disk for the worker
+        fd, path = tempfile.mkstemp(suffix=ext, prefix="clip-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                file.save(out)
+            opts = VideoOptions(sample_fps=current_app.config['VIDEO_SAMPLE_FPS'],
+                                max_seconds=current_app.config['VIDEO_MAX_SECONDS'],
+                                detect_max_side=current_app.config['VIDEO_DETECT_MAX_SIDE'],
+                                min_face_px=current_app.config['VIDEO_MIN_FACE_PX'])
+            result = get_engine().run("video", VideoJob(path, opts), timeout=current_app.config['VIDEO_TIMEOUT'])
+        except Exception as e:
+            current_app.logger.exception("Video processing failed")
+            flash(f"Failed to process uploaded video: {e}", "danger")
+            return redirect(url_for("recognition.video_attendance"))
+        finally:
+            os.remove(path)
+
+        if result is None:
+            flash("Could not read the uploaded video.", "warning")
+            return redirect(url_for("recognition.video_attendance"))
+
+        tracks = match_tracks(result.tracks)
+        matched = [t for t in tracks if t["status"] == "matched"]
+
+        users = {}
+        ids = {t["user_id"] for t in tracks if t["user_id"] is not None}
+        if ids:
+            users = {u.id: u for u in User.query.filter(User.id.in_(ids)).all()}
+        for t in tracks:
+            u = users.get(t["user_id"])
+            t["username"] = u.username if u else None
+            t["full_name"] = u.full_name if u else None
+
+        marked = 0
+        if matched:
+            try:
+                get_writer().write_many([{"user_id": t["user_id"], "status": "TIME_IN", "location": location}
+                                         for t in matched])
+                marked = len(matched)
+            except Exception as e:
+                current_app.logger.exception("Failed to write video attendance logs")
+                for t in matched:
+                    t["status"] = "error"
+                flash(f"Failed to mark attendance: {e}", "danger")
+        clip = {"duration_s": result.duration_s, "fps": round(result.fps, 2), "frames_read": result.frames_read,
+                "frames_sampled": result.frames_sampled, "truncated": result.truncated}
+        current_app.logger.info(f"[recognition] video tracks={len(tracks)} marked={marked} {clip}")
+
+        if want_json:
+            return jsonify({"tracks": tracks, "marked": marked, "clip": clip})
+        if result.truncated:
+            flash("Only part of the clip was processed (length or track limit reached).", "warning")
+        if not tracks:
+            flash("No faces were tracked in the uploaded video.", "warning")
+        elif marked:
+            flash(f"Marked {marked} student(s) from {len(tracks)} tracked face(s).", "success")
+        return render_template("recognition/video.html", tracks=tracks, clip=clip, threshold=MIN_COSINE_SIM)
+
+    # Default GET -> render page
+    return render_template("recognition/video.html", tracks=None, clip=None, threshold=MIN_COSINE_SIM)
@@ -0,0 +1,76 @@
+# app/startup.py
+"""
+Startup-time report and the explicit warmup hook.
+
+``create_app`` times each of its phases into a ``StartupReport`` (kept in
+``app.extensions["startup"]``, logged once, and shown under ``startup`` in
+``/admin/engine``). Nothing heavy happens there any more:
+
+- OpenCV, the Haar cascade and the engine's worker pool load on the first
+  embedding (or in ``warmup``)
+- the face gallery loads on the first match (or in ``warmup``)
+- ``cli=True`` apps skip blueprints, background services and schema creation
+
+``warmup(app)`` front-loads all of it, for deployments that prefer a slower
+boot to a slow first request (``FACE_ENGINE_EAGER=1`` runs it from
+``create_app``; ``tools/startup_report.py`` measures both paths).
+"""
+from __future__ import annotations
+
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupReport:
+    def __init__(self, mode: str = "web"):
+        self.mode = mode
+        self.phases: list[tuple[str, float]] = []
+        self._t0 = time.perf_counter()
+        self.total_s: float | None = None
+        self.opencv_loaded: bool | None = None
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t0))
+
+    def finish(self) -> "StartupReport":
+        self.total_s = time.perf_counter() - self._t0
+        self.opencv_loaded = "cv2" in sys.modules
+        return self
+
+    def as_dict(self) -> dict:
+        return {
+            "mode": self.mode,
+            "total_ms": round((self.total_s or 0.0) * 1000, 3),
+            "phases_ms": {name: round(dt * 1000, 3) for name, dt in self.phases},
+            "opencv_loaded": self.opencv_loaded,
+        }
+
+    def summary(self) -> str:
+        parts = ", ".join(f"{name}={dt * 1000:.1f}ms" for name, dt in self.phases)
+        cv = "loaded" if self.opencv_loaded else "not loaded"
+        return f"[startup] {self.mode} app ready in {(self.total_s or 0.0) * 1000:.1f}ms ({parts}; OpenCV {cv})"
+
+
+def warmup(app) -> StartupReport:
+    """Load the pipeline, start the embedding engine and fill the gallery now."""
+    report = StartupReport("warmup")
+    with app.app_context():
+        with report.phase("pipeline"):
+            from app.face_utils import pipeline
+            pipeline._cascade()
+        with report.phase("engine"):
+            from app.face_utils.engine import get_engine
+            get_engine().start()
+        with report.phase("gallery"):
+            from app.routes.recognition import ensure_gallery
+            ensure_gallery()
+    report.finish()
+    app.extensions["warmup"] = report
+    app.logger.info(report.summary())
+    return report
@@ -0,0 +1,79 @@
+# app/user_directory.py
+"""
+Paginated, searchable user listing for the admin directory.
+
+Only the listed columns are selected (never password hashes or whole ORM
+rows). Usernames are stored lowercase and unique, so the listing walks the
+username index in order, and a search is a prefix *range* on that index
+(``username >= 'ab' AND username < 'ac'``) rather than a ``LIKE`` or
+``lower()`` that SQLite would answer with a full scan. Pages are keyset
+cursors on the username.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple
+
+from flask import request, url_for
+from sqlalchemy import select
+
+from app import db
+from app.models import User
+
+# Rows per directory page
+USER_PAGE_SIZE = 50
+
+
+def normalize_username(s: str | None) -> str:
+    return (s or '').strip().lower()
+
+
+def prefix_range(prefix: str) -> tuple[str, str]:
+    """[lo, hi) bounds covering every string that starts with ``prefix``."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class UserPage(NamedTuple):
+    rows: list
+    next: str | None   # cursor for the following page
+    prev: str | None   # cursor for the preceding page
+
+
+def user_page(*, q: str | None = None, after: str | None = None, before: str | None = None,
+              limit: int = USER_PAGE_SIZE) -> UserPage:
+    """One page of users ordered by username, optionally limited to a username prefix.
+
+    Rows have ``id``, ``username``, ``full_name``, ``role`` and ``created_at``.
+    """
+    name = User.username
+    stmt = select(User.id, name, User.full_name, User.role, User.created_at)
+    prefix = normalize_username(q)
+    if prefix:
+        lo, hi = prefix_range(prefix)
+        stmt = stmt.where(name >= lo, name < hi)
+
+    if before and not after:
+        rows = db.session.execute(stmt.where(name < before).order_by(name.desc()).limit(limit + 1)).all()
+        has_prev = len(rows) > limit
+        rows = rows[:limit][::-1]
+        if not rows:
+            return UserPage([], None, None)
+        return UserPage(rows, rows[-1].username, rows[0].username if has_prev else None)
+
+    if after:
+        stmt = stmt.where(name > after)
+    rows = db.session.execute(stmt.order_by(name.asc()).limit(limit + 1)).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return UserPage([], None, None)
+    return UserPage(rows, rows[-1].username if has_next else None, rows[0].username if after else None)
+
+
+def directory_urls(page: UserPage, endpoint: str) -> dict:
+    """first/prev/next links for ``page``, keeping the current search."""
+    args = {'q': request.args['q']} if request.args.get('q') else {}
+    return {
+        'first': url_for(endpoint, **args),
+        'prev': url_for(endpoint, before=page.prev, **args) if page.prev else None,
+        'next': url_for(endpoint, after=page.next, **args) if page.next else None,
+    }
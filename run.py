@@ -1,6 +1,8 @@
 from app import create_app
 
-app = create_app()
-
+# Build the app only when run as a script: the embedding engine's spawned
+# workers re-import this module and need nothing but the face pipeline.
+# Production servers load wsgi:app instead.
 if __name__ == '__main__':
+    app = create_app()
     app.run(debug=True)
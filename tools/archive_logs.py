@@ -0,0 +1,81 @@
+# tools/archive_logs.py
+"""
+Move old attendance logs out of SQLite into the columnar archive tier.
+
+  python tools/archive_logs.py                      # older than ARCHIVE_AFTER_DAYS (default 365)
+  python tools/archive_logs.py --older-than-days 180 --dry-run
+  python tools/archive_logs.py --before 2025-01-01 --vacuum
+  python tools/archive_logs.py --stats
+
+Whole months before the cutoff (rounded down to the 1st) are written to
+per-month partitions under ARCHIVE_PATH, then deleted from attendance_logs.
+Log pages and CSV exports keep showing archived rows, and the daily rollup
+that reports read is left untouched. Safe to re-run, e.g. monthly from cron;
+an interrupted run is completed by the next one.
+
+Deleted rows leave free pages in the database file; ``--vacuum`` returns
+them to the filesystem (it rewrites the file, so run it off-hours).
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import func, select, text
+
+from app import create_app, db, init_db
+from app.archive import archive_logs, get_archive
+from app.models import AttendanceLog
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Archive old attendance logs into monthly columnar partitions.")
+    when = ap.add_mutually_exclusive_group()
+    when.add_argument("--older-than-days", type=int, help="cutoff age in days (default: ARCHIVE_AFTER_DAYS)")
+    when.add_argument("--before", help="cutoff date YYYY-MM-DD")
+    ap.add_argument("--dry-run", action="store_true", help="report what would move, change nothing")
+    ap.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards")
+    ap.add_argument("--stats", action="store_true", help="print archive stats and exit")
+    args = ap.parse_args()
+
+    app = create_app(cli=True)
+    init_db(app)
+    with app.app_context():
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        archive = get_archive()
+        print("Archive:", archive.path)
+        if args.stats:
+            print(json.dumps(archive.stats(), indent=2))
+            return
+
+        if args.before:
+            try:
+                before = datetime.strptime(args.before, "%Y-%m-%d")
+            except ValueError:
+                raise SystemExit("--before must be YYYY-MM-DD")
+        else:
+            days = app.config['ARCHIVE_AFTER_DAYS'] if args.older_than_days is None else args.older_than_days
+            before = datetime.utcnow() - timedelta(days=days)
+
+        t0 = time.perf_counter()
+        res = archive_logs(archive, before, dry_run=args.dry_run,
+                           progress=lambda name, n: print(f"  {name}: {n} row(s)", flush=True))
+        total = sum(res["moved"].values())
+        left = db.session.execute(select(func.count()).select_from(AttendanceLog)).scalar()
+        verb = "Would move" if args.dry_run else "Moved"
+        print(f"{verb} {total} row(s) from {len(res['moved'])} month(s) before {res['cutoff']:%Y-%m-%d} "
+              f"in {time.perf_counter() - t0:.1f}s; {left} row(s) in attendance_logs")
+        if args.vacuum and not args.dry_run:
+            t0 = time.perf_counter()
+            db.session.commit()
+            with db.engine.connect() as conn:
+                conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+            print(f"VACUUM done in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# tools/backfill_rollups.py
+import sys
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app import create_app, init_db
+from app.reports import rebuild_daily_rollups
+
+USAGE = "Usage: python tools/backfill_rollups.py [<from YYYY-MM-DD> [<to YYYY-MM-DD>]]"
+
+def _day(s):
+    try:
+        return datetime.strptime(s, "%Y-%m-%d").date()
+    except ValueError:
+        print(USAGE)
+        raise SystemExit(1)
+
+def main():
+    if len(sys.argv) > 3:
+        print(USAGE)
+        raise SystemExit(1)
+
+    start = _day(sys.argv[1]) if len(sys.argv) > 1 else None
+    end = _day(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    app = create_app(cli=True)
+    init_db(app)
+    with app.app_context():
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        n = rebuild_daily_rollups(start, end)
+        print(f"Rebuilt {n} daily rollup rows ({start or 'beginning'} .. {end or 'now'})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# tools/bench_pipeline.py
+"""
+Micro-benchmarks for app/face_utils/pipeline.py and gallery matching.
+
+Times every stage separately on synthetic face-like images (or a real photo
+via --image) at several resolutions:
+
+  imdecode, cvtColor, detectMultiScale (per scaleFactor/minNeighbors combo),
+  the pipeline's detect_faces in fast and full mode, resize_equalize,
+  standardize_l2, and cosine matching against galleries of different sizes.
+
+Results are JSON so runs can be diffed between commits:
+
+  python tools/bench_pipeline.py --out bench_before.json
+  ... change code ...
+  python tools/bench_pipeline.py --compare bench_before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import cv2
+import numpy as np
+
+from app.face_utils import pipeline
+from app.face_utils.camera import synthetic_face_frame
+from app.face_utils.gallery import FaceGallery
+
+DEFAULT_RESOLUTIONS = "320x240,640x480,1280x720,1920x1080,4032x3024"
+DEFAULT_GALLERIES = "100,10000,100000"
+EMBED_DIM = 96 * 96
+
+
+def _csv(s, cast=str):
+    return [cast(x) for x in s.split(",") if x.strip()]
+
+
+def _res(s):
+    w, h = s.lower().split("x")
+    return int(w), int(h)
+
+
+def _time(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    a = np.asarray(samples)
+    return {
+        "n": repeats,
+        "min_ms": round(float(a.min()), 4),
+        "median_ms": round(float(np.median(a)), 4),
+        "mean_ms": round(float(a.mean()), 4),
+        "p95_ms": round(float(np.percentile(a, 95)), 4),
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _make_image(w, h, photo, rng):
+    if photo is not None:
+        return cv2.resize(photo, (w, h), interpolation=cv2.INTER_AREA)
+    return synthetic_face_frame(w, h, rng)
+
+
+def bench_image_stages(resolutions, detect_params, repeats, photo, rng):
+    out = []
+    cascade = pipeline._cascade()
+    for w, h in resolutions:
+        res = f"{w}x{h}"
+        img = _make_image(w, h, photo, rng)
+        ok, enc = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        buf = np.frombuffer(enc.tobytes(), np.uint8)
+
+        out.append({"stage": "imdecode", "resolution": res, "bytes": int(buf.size),
+                    **_time(lambda: cv2.imdecode(buf, cv2.IMREAD_COLOR), repeats)})
+        decoded = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        out.append({"stage": "cvtColor", "resolution": res,
+                    **_time(lambda: cv2.cvtColor(decoded, cv2.COLOR_BGR2GRAY), repeats)})
+        gray = cv2.cvtColor(decoded, cv2.COLOR_BGR2GRAY)
+
+        for sf, mn in detect_params:
+            faces = cascade.detectMultiScale(gray, scaleFactor=sf, minNeighbors=mn)
+            out.append({"stage": "detectMultiScale", "resolution": res,
+                        "params": {"scaleFactor": sf, "minNeighbors": mn}, "faces": int(len(faces)),
+                        **_time(lambda: cascade.detectMultiScale(gray, scaleFactor=sf, minNeighbors=mn),
+                                repeats)})
+
+        for mode in ("fast", "full"):
+            faces = pipeline._detect_faces(gray, mode=mode)
+            out.append({"stage": "detect_faces", "resolution": res, "params": {"mode": mode},
+                        "faces": int(len(faces)),
+                        **_time(lambda: pipeline._detect_faces(gray, mode=mode), repeats)})
+
+        crop = pipeline._extract_face(gray)
+        out.append({"stage": "resize_equalize", "resolution": res, "crop": list(crop.shape[:2]),
+                    **_time(lambda: pipeline._resize_equalize([crop]), repeats)})
+        batch = pipeline._resize_equalize([crop])
+        out.append({"stage": "standardize_l2", "resolution": res,
+                    **_time(lambda: pipeline._standardize_l2(batch.copy()), repeats)})
+        out.append({"stage": "end_to_end", "resolution": res,
+                    **_time(lambda: pipeline.get_image_embedding(buf.tobytes()), repeats)})
+    return out
+
+
+def bench_matching(sizes, dim, repeats, max_mb, rng):
+    out = []
+    for n in sizes:
+        mb = n * dim * 4 / 2**20
+        if mb > max_mb:
+            out.append({"stage": "match", "gallery": n, "dim": dim, "skipped": f"needs {mb:.0f} MB > --max-gallery-mb"})
+            continue
+        g = FaceGallery()
+        mat = np.empty((n, dim), dtype=np.float32)
+        for i in range(0, n, 4096):  # chunked fill keeps peak memory near one copy
+            mat[i:i + 4096] = rng.standard_normal((min(4096, n - i), dim), dtype=np.float32)
+        g.load((i, i, v) for i, v in enumerate(mat))
+        del mat
+        probe = rng.standard_normal(dim).astype(np.float32)
+        out.append({"stage": "match", "gallery": n, "dim": dim, "k": 5,
+                    **_time(lambda: g.search(probe, k=5), repeats)})
+        probes = rng.standard_normal((32, dim)).astype(np.float32)
+        out.append({"stage": "match_batch32", "gallery": n, "dim": dim, "k": 1,
+                    **_time(lambda: g.search_many(probes, k=1), max(1, repeats // 4))})
+        del g
+    return out
+
+
+def _key(r):
+    return (r["stage"], r.get("resolution"), r.get("gallery"), json.dumps(r.get("params"), sort_keys=True))
+
+
+def compare(current, baseline_path):
+    base = {_key(r): r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    print(f"{'stage':<18} {'case':<26} {'base ms':>10} {'now ms':>10} {'ratio':>7}", file=sys.stderr)
+    for r in current["results"]:
+        b = base.get(_key(r))
+        if not b or "median_ms" not in r or "median_ms" not in b:
+            continue
+        case = r.get("resolution") or f"gallery={r.get('gallery')}"
+        if r.get("params"):
+            case += " " + " ".join(f"{k}={v}" for k, v in r["params"].items())
+        ratio = r["median_ms"] / b["median_ms"] if b["median_ms"] else float("inf")
+        flag = "  <-- slower" if ratio > 1.10 else ""
+        print(f"{r['stage']:<18} {case:<26} {b['median_ms']:>10.3f} {r['median_ms']:>10.3f} {ratio:>7.2f}{flag}",
+              file=sys.stderr)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS, help="comma list of WxH")
+    ap.add_argument("--scale-factors", default="1.2", help="comma list for detectMultiScale scaleFactor")
+    ap.add_argument("--min-neighbors", default="5", help="comma list for detectMultiScale minNeighbors")
+    ap.add_argument("--galleries", default=DEFAULT_GALLERIES, help="comma list of gallery sizes")
+    ap.add_argument("--dim", type=int, default=EMBED_DIM, help="embedding size for matching")
+    ap.add_argument("--max-gallery-mb", type=float, default=2048, help="skip galleries larger than this")
+    ap.add_argument("--repeats", type=int, default=20)
+    ap.add_argument("--image", help="real photo to resize instead of synthetic frames")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--skip-images", action="store_true")
+    ap.add_argument("--skip-matching", action="store_true")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    ap.add_argument("--compare", help="baseline JSON to compare medians against (printed to stderr)")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    photo = None
+    if args.image:
+        photo = cv2.imread(args.image, cv2.IMREAD_COLOR)
+        if photo is None:
+            ap.error(f"cannot read image: {args.image}")
+
+    detect_params = [(sf, mn) for sf in _csv(args.scale_factors, float) for mn in _csv(args.min_neighbors, int)]
+    results = []
+    if not args.skip_images:
+        results += bench_image_stages([_res(r) for r in _csv(args.resolutions)], detect_params,
+                                      args.repeats, photo, rng)
+    if not args.skip_matching:
+        results += bench_matching(_csv(args.galleries, int), args.dim, args.repeats, args.max_gallery_mb, rng)
+
+    report = {
+        "meta": {
+            "git": _git_rev(),
+            "when": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "opencv_threads": cv2.getNumThreads(),
+            "source": args.image or "synthetic",
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text)
+        print(f"Wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# tools/build_gallery.py
+"""
+Build, compact or inspect the shared on-disk gallery (GALLERY_BACKEND=mmap).
+
+  python tools/build_gallery.py                     # (re)build from face_templates
+  python tools/build_gallery.py --compact           # drop tombstones, re-cluster the tail
+  python tools/build_gallery.py --compact --if-needed   # for cron: only when stats say so
+  python tools/build_gallery.py --stats
+  python tools/build_gallery.py --check 500         # IVF top-1 agreement with a full scan
+
+Web workers append registrations to the store's tail and tombstone removed
+templates; searches scan the tail in full, so run ``--compact`` periodically
+(e.g. nightly) to fold it back into the IVF lists. Running workers pick up a
+rebuilt or compacted store on their next request. The store path and IVF
+settings come from GALLERY_PATH / GALLERY_NLIST / GALLERY_NPROBE; this tool
+works whichever backend the web app is currently using.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from app import create_app, db, init_db
+from app.models import FaceTemplate
+from app.face_utils.embedding_format import decode_current
+from app.face_utils.gallery_store import store_from_config
+
+
+def check(store, n: int, noise: float, seed: int = 0) -> None:
+    """Query noisy copies of ``n`` stored templates with the configured nprobe and with a full scan."""
+    rng = np.random.default_rng(seed)
+    count = int(store._state[0])
+    rows = np.flatnonzero(np.asarray(store._owners[:count]) >= 0)
+    rows = rng.choice(rows, min(n, rows.size), replace=False)
+    probes = np.asarray(store._vectors[rows]) + rng.normal(0, noise, (rows.size, store.dim)).astype(np.float32)
+
+    nprobe = store.nprobe
+    t0 = time.perf_counter()
+    ivf = store.search_many(probes, k=1)
+    t_ivf = time.perf_counter() - t0
+    store.nprobe = 1 << 30
+    t0 = time.perf_counter()
+    full = store.search_many(probes, k=1)
+    t_full = time.perf_counter() - t0
+    store.nprobe = nprobe
+    agree = sum(1 for a, b in zip(ivf, full) if a and b and a[0][0] == b[0][0])
+    print(f"Top-1 agreement at nprobe={nprobe}: {agree}/{len(rows)} ({agree / max(1, len(rows)):.1%}); "
+          f"batched search {t_ivf * 1000:.1f} ms vs full scan {t_full * 1000:.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build, compact or inspect the memory-mapped face gallery.")
+    ap.add_argument("--compact", action="store_true", help="compact the existing store instead of rebuilding")
+    ap.add_argument("--if-needed", action="store_true", help="with --compact: skip unless needs_compaction")
+    ap.add_argument("--stats", action="store_true", help="print the store's stats and exit")
+    ap.add_argument("--nlist", type=int, help="IVF lists (default: GALLERY_NLIST, 0 = auto)")
+    ap.add_argument("--check", type=int, default=0, metavar="N", help="after building, compare N noisy probes")
+    ap.add_argument("--noise", type=float, default=0.02, help="per-dimension noise for --check probes")
+    args = ap.parse_args()
+
+    app = create_app(cli=True)
+    init_db(app)
+    store = store_from_config(app.config, app.instance_path)
+    if args.nlist is not None:
+        store.nlist = args.nlist
+    with app.app_context():
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        print("Store:", store.path)
+        t0 = time.perf_counter()
+        if args.stats:
+            if not store.open():
+                raise SystemExit("No usable store (missing, or built for another embedding format).")
+            print(json.dumps(store.stats(), indent=2))
+            return
+        if args.compact:
+            if not store.open():
+                raise SystemExit("No usable store to compact; run without --compact to build one.")
+            if args.if_needed and not store.stats()["needs_compaction"]:
+                print("Compaction not needed:", json.dumps(store.stats()))
+                return
+            res = store.compact()
+            b, a = res["before"], res["after"]
+            print(f"Compacted in {time.perf_counter() - t0:.1f}s: {b['listed']} listed + {b['tail']} tail "
+                  f"- {b['tombstones']} tombstones -> {a['listed']} rows in {a['nlist']} list(s), "
+                  f"generation {a['generation']}")
+        else:
+            rows = db.session.query(FaceTemplate.id, FaceTemplate.user_id, FaceTemplate.embedding).yield_per(2000)
+            n = store.load((tid, uid, decode_current(blob)) for tid, uid, blob in rows)
+            s = store.stats()
+            skipped = store._meta.get("skipped", 0)
+            print(f"Built generation {s['generation']} in {time.perf_counter() - t0:.1f}s: {n} templates, "
+                  f"{s['users']} users, {s['nlist']} list(s), {s['file_mb']} MB"
+                  + (f"; {skipped} template(s) not in the current embedding format were skipped" if skipped else ""))
+        if args.check and len(store):
+            check(store, args.check, args.noise)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# tools/create_device.py
+import argparse
+import secrets
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app import create_app, db, init_db
+from app.models import Device
+
+def main():
+    ap = argparse.ArgumentParser(description="Register a kiosk device for the JSON API (or revoke one).")
+    ap.add_argument("name", help="unique device name, e.g. kiosk-lobby")
+    ap.add_argument("--location", help="default location recorded on this device's marks")
+    ap.add_argument("--rotate", action="store_true", help="issue a new token for an existing device")
+    ap.add_argument("--revoke", action="store_true", help="disable the device")
+    args = ap.parse_args()
+
+    app = create_app(cli=True)
+    init_db(app)
+    with app.app_context():
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        device = Device.query.filter_by(name=args.name).first()
+
+        if args.revoke:
+            if not device:
+                print("Device not found:", args.name)
+                raise SystemExit(1)
+            device.is_active = False
+            db.session.commit()
+            print(f"Revoked device '{device.name}'")
+            return
+
+        if device and not args.rotate:
+            print(f"Device '{device.name}' already exists; use --rotate for a new token.")
+            raise SystemExit(1)
+
+        token = secrets.token_urlsafe(32)
+        if device is None:
+            device = Device(name=args.name)
+            db.session.add(device)
+        device.token_hash = Device.hash_token(token)
+        device.is_active = True
+        if args.location is not None:
+            device.location = args.location.strip() or None
+        db.session.commit()
+        print(f"Device '{device.name}' ready. Token (shown once, store it on the kiosk):")
+        print(token)
+
+if __name__ == "__main__":
+    main()
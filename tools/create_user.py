@@ -5,8 +5,8 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(ROOT))
 
-from app import create_app, db
-from app.models import User
+from app import create_app, db, init_db
+from app.models import ROLES, User
 
 USAGE = "Usage: python tools/create_user.py <role: admin|faculty|student> <username> <password>"
 
@@ -19,11 +19,12 @@ def main():
     role = role.strip().lower()
     username = username.strip().lower()
 
-    if role not in {"admin", "faculty", "student"}:
+    if role not in ROLES:
         print("Role must be one of: admin, faculty, student")
         raise SystemExit(1)
 
-    app = create_app()
+    app = create_app(cli=True)
+    init_db(app)
     with app.app_context():
         print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
         u = User.query.filter_by(username=username).first()
@@ -0,0 +1,224 @@
+# tools/enroll_faces.py
+"""
+Batch face enrollment from a directory or archive of ID photos.
+
+  python tools/enroll_faces.py registered_faces/
+  python tools/enroll_faces.py dept_photos.zip --workers 4 --report enroll.csv
+  python tools/enroll_faces.py photos.tar.gz --largest-face
+
+Every image named ``<username>.<jpg|jpeg|png|bmp|webp>`` (any depth; the
+username is matched case-insensitively) becomes a face template for that
+student, stored like a web enrollment (source ``batch``).
+
+- images are embedded in parallel by the embedding engine's worker pool,
+  the same pipeline the web app uses
+- templates are written in batches of ``--batch-size``, and each user is
+  pruned back to FACE_TEMPLATES_PER_USER after every batch
+- the SHA-256 of each image is stored with its template; an image already
+  enrolled for that user is skipped, so re-running over the same folder
+  only processes new or changed photos
+- failures are reported per file: unknown user, not a student, unreadable
+  image, no face found, multiple faces (``--largest-face`` takes the
+  biggest one instead)
+
+Running web workers keep the gallery they loaded; restart them to match
+against the new templates.
+"""
+import argparse
+import collections
+import csv
+import hashlib
+import sys
+import tarfile
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import insert, select, text
+
+from app import create_app, db, init_db
+from app.models import FaceTemplate, User
+from app.face_utils.embedding_format import current_format, encode_current
+from app.face_utils.engine import EmbeddingEngine
+from app.user_directory import normalize_username
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+SHOW_FAILURES = 20
+
+# Keep the newest :cap templates of each affected user (same rule as register_face)
+PRUNE_SQL = """
+DELETE FROM face_templates WHERE id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY captured_at DESC, id DESC) AS rn
+        FROM face_templates WHERE user_id IN ({users})
+    ) WHERE rn > :cap
+)
+"""
+
+
+# -----------------------------------------------------------
+# Input
+# -----------------------------------------------------------
+def _wanted(name: str) -> bool:
+    p = PurePosixPath(name)
+    return p.suffix.lower() in IMAGE_EXTS and not p.name.startswith(".") and "__MACOSX" not in p.parts
+
+
+def iter_images(source: Path):
+    """Yield ``(name, image_bytes)`` from a directory, .zip or .tar[.gz|.bz2|.xz]."""
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file() and _wanted(path.name):
+                yield str(path.relative_to(source)), path.read_bytes()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            for info in sorted(zf.infolist(), key=lambda i: i.filename):
+                if not info.is_dir() and _wanted(info.filename):
+                    yield info.filename, zf.read(info)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as tf:
+            for member in tf:
+                if member.isfile() and _wanted(member.name):
+                    yield member.name, tf.extractfile(member).read()
+    else:
+        raise SystemExit(f"Not a directory, zip or tar archive: {source}")
+
+
+# -----------------------------------------------------------
+# Enrollment
+# -----------------------------------------------------------
+class Enrollment:
+    def __init__(self, engine: EmbeddingEngine, batch_size: int, cap: int, largest_face: bool, dry_run: bool):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.cap = cap
+        self.largest_face = largest_face
+        self.dry_run = dry_run
+        self.fmt_name = current_format().name
+        self.counts = collections.Counter()
+        self.failures: list[tuple[str, str, str, str]] = []
+        self.batch: list[dict] = []
+        self.written = 0
+
+    def fail(self, name: str, username: str, status: str, detail: str = "") -> None:
+        self.counts[status] += 1
+        self.failures.append((name, username, status, detail))
+
+    def collect(self, name: str, username: str, user_id: int, digest: str, fut) -> None:
+        try:
+            res = self.engine.result(fut)
+        except Exception as e:
+            self.fail(name, username, "error", str(e))
+            return
+        if res is None:
+            self.fail(name, username, "unreadable", "could not decode image")
+            return
+        vecs, boxes = res
+        if len(vecs) == 0:
+            self.fail(name, username, "no_face")
+            return
+        if len(vecs) > 1 and not self.largest_face:
+            self.fail(name, username, "multiple_faces", f"{len(vecs)} faces")
+            return
+        i = int(max(range(len(boxes)), key=lambda j: int(boxes[j][2]) * int(boxes[j][3])))
+        self.batch.append({
+            "user_id": user_id,
+            "embedding": encode_current(vecs[i]),
+            "source": "batch",
+            "source_hash": digest,
+            "capture_meta": {"filename": name, "format": self.fmt_name, "box": [int(v) for v in boxes[i]]},
+        })
+        self.counts["enrolled"] += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.batch or self.dry_run:
+            self.batch = []
+            return
+        users = sorted({row["user_id"] for row in self.batch})
+        db.session.execute(insert(FaceTemplate), self.batch)
+        db.session.execute(text(PRUNE_SQL.format(users=",".join(str(u) for u in users))), {"cap": self.cap})
+        db.session.commit()
+        self.written += len(self.batch)
+        self.batch = []
+        print(f"  {self.written} template(s) written", flush=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Enroll face templates from a folder or archive of <username>.jpg files.")
+    ap.add_argument("source", type=Path, help="directory, .zip or .tar[.gz] of ID photos")
+    ap.add_argument("--workers", type=int, default=2, help="embedding processes (0 = embed in this process)")
+    ap.add_argument("--batch-size", type=int, default=100, help="templates per insert transaction")
+    ap.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for one image")
+    ap.add_argument("--largest-face", action="store_true", help="use the largest face when several are found")
+    ap.add_argument("--dry-run", action="store_true", help="embed and report, but write nothing")
+    ap.add_argument("--report", type=Path, help="write failures (file, username, status, detail) to this CSV")
+    args = ap.parse_args()
+
+    if not args.source.exists():
+        raise SystemExit(f"No such file or directory: {args.source}")
+
+    app = create_app(cli=True)
+    init_db(app)
+    engine = EmbeddingEngine(workers=args.workers, max_pending=max(4, args.workers * 4),
+                             timeout=args.timeout, warmup=False)
+    t0 = time.perf_counter()
+    with app.app_context():
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        users = {name: (uid, role) for uid, name, role in
+                 db.session.execute(select(User.id, User.username, User.role))}
+        enrolled = {(uid, h) for uid, h in db.session.execute(
+            select(FaceTemplate.user_id, FaceTemplate.source_hash).where(FaceTemplate.source_hash.isnot(None)))}
+
+        job = Enrollment(engine, args.batch_size, app.config['FACE_TEMPLATES_PER_USER'],
+                         args.largest_face, args.dry_run)
+        inflight = collections.deque()
+        seen = 0
+        try:
+            for name, data in iter_images(args.source):
+                seen += 1
+                username = normalize_username(PurePosixPath(name).stem)
+                user = users.get(username)
+                if user is None:
+                    job.fail(name, username, "unknown_user")
+                    continue
+                user_id, role = user
+                if role != "student":
+                    job.fail(name, username, "not_student", f"role={role}")
+                    continue
+                digest = hashlib.sha256(data).hexdigest()
+                if (user_id, digest) in enrolled:
+                    job.counts["unchanged"] += 1
+                    continue
+                enrolled.add((user_id, digest))  # the same photo twice in one run counts once
+                if len(inflight) >= engine.max_pending:
+                    job.collect(*inflight.popleft())
+                inflight.append((name, username, user_id, digest, engine.submit("group", data)))
+            while inflight:
+                job.collect(*inflight.popleft())
+            job.flush()
+        finally:
+            engine.shutdown()
+
+        elapsed = time.perf_counter() - t0
+        summary = ", ".join(f"{k}={v}" for k, v in sorted(job.counts.items()))
+        print(f"Processed {seen} image(s) in {elapsed:.1f}s ({seen / max(elapsed, 1e-9):.1f}/s): {summary or 'nothing to do'}")
+        for name, username, status, detail in job.failures[:SHOW_FAILURES]:
+            print(f"  {name}: {status}" + (f" ({detail})" if detail else ""))
+        if len(job.failures) > SHOW_FAILURES:
+            print(f"  ... and {len(job.failures) - SHOW_FAILURES} more")
+        if args.report and job.failures:
+            with args.report.open("w", newline="") as f:
+                csv.writer(f).writerows([("file", "username", "status", "detail"), *job.failures])
+            print(f"Failures written to {args.report}")
+        if args.dry_run:
+            print("Dry run; nothing written.")
+        elif job.written:
+            print("Restart running web workers to match against the new templates.")
+
+if __name__ == "__main__":
+    main()
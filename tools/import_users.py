@@ -0,0 +1,238 @@
+# tools/import_users.py
+"""
+Bulk-create users from a CSV or JSONL file (e.g. a new student intake).
+
+  python tools/import_users.py intake.csv
+  python tools/import_users.py intake.jsonl --default-role student --workers 8
+  python tools/import_users.py intake.csv --dry-run --rejects rejects.csv
+
+Columns / keys: ``username``, ``password`` (required), ``full_name``
+(defaults to the username) and ``role`` (defaults to ``--default-role``).
+
+- usernames are normalized (trimmed, lowercased) and validated up front; a
+  username repeated in the file keeps its first row
+- existing usernames are read in one query and skipped, and inserts use
+  ON CONFLICT DO NOTHING, so re-running the same file is a no-op
+- passwords are hashed in a process pool while earlier batches are inserted,
+  one transaction per ``--batch-size`` rows
+- after each committed batch the last file line is saved to a checkpoint
+  (``<file>.import-checkpoint.json``); a rerun of the same file resumes after
+  it. ``--restart`` ignores the checkpoint.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.security import generate_password_hash
+
+from app import create_app, db, init_db
+from app.models import ROLES, User
+from app.passwords import PASSWORD_HASH_ARGS
+from app.user_directory import normalize_username
+
+MAX_USERNAME = User.__table__.c.username.type.length
+MAX_FULL_NAME = User.__table__.c.full_name.type.length
+SHOW_REJECTS = 20
+
+
+# -----------------------------------------------------------
+# Reading and validation
+# -----------------------------------------------------------
+def read_records(path: Path, fmt: str):
+    """Yield ``(line, record | None, error | None)`` for every data row."""
+    if fmt == "csv":
+        with path.open(newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            reader.fieldnames = [(n or "").strip().lower() for n in reader.fieldnames or []]
+            for record in reader:
+                yield reader.line_num, record, None
+        return
+    with path.open(encoding="utf-8") as f:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                yield line, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line, None, "expected a JSON object"
+                continue
+            yield line, record, None
+
+
+def validate(record: dict, default_role: str) -> tuple[dict | None, str | None]:
+    username = normalize_username(str(record.get("username") or ""))
+    password = record.get("password")
+    password = "" if password is None else str(password)
+    full_name = str(record.get("full_name") or "").strip() or username
+    role = str(record.get("role") or "").strip().lower() or default_role
+
+    if not username:
+        return None, "missing username"
+    if len(username) > MAX_USERNAME or any(c.isspace() for c in username):
+        return None, "invalid username"
+    if not password:
+        return None, "missing password"
+    if len(full_name) > MAX_FULL_NAME:
+        return None, "full_name too long"
+    if role not in ROLES:
+        return None, f"unknown role {role!r}"
+    return {"username": username, "full_name": full_name, "role": role, "password": password}, None
+
+
+def plan(path: Path, fmt: str, default_role: str):
+    """Valid, in-file-deduplicated rows (with their line numbers) and the rejects."""
+    rows, rejects = [], []
+    first_line: dict[str, int] = {}
+    for line, record, error in read_records(path, fmt):
+        row = None
+        if error is None:
+            row, error = validate(record, default_role)
+        if error is None and row["username"] in first_line:
+            error = f"duplicate of line {first_line[row['username']]}"
+        if error is not None:
+            rejects.append((line, str((record or {}).get("username") or ""), error))
+            continue
+        first_line[row["username"]] = line
+        row["line"] = line
+        rows.append(row)
+    return rows, rejects
+
+
+# -----------------------------------------------------------
+# Checkpoint
+# -----------------------------------------------------------
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_checkpoint(path: Path, digest: str) -> int:
+    """Last committed file line for this exact input, or 0."""
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return 0
+    if data.get("sha256") != digest:
+        print(f"Checkpoint {path} is for a different version of the file; ignoring it.")
+        return 0
+    return int(data.get("line", 0))
+
+
+def save_checkpoint(path: Path, source: Path, digest: str, line: int, inserted: int) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"source": str(source), "sha256": digest, "line": line, "inserted": inserted,
+                               "updated_at": datetime.utcnow().isoformat(timespec="seconds") + "Z"}))
+    os.replace(tmp, path)
+
+
+# -----------------------------------------------------------
+# Import
+# -----------------------------------------------------------
+def insert_rows(pending: list[dict], hashes, batch_size: int, on_batch) -> tuple[int, int]:
+    """Insert ``pending`` (passwords from ``hashes``, in order) batch by batch."""
+    stmt = sqlite_insert(User.__table__).on_conflict_do_nothing(index_elements=["username"])
+    inserted = conflicts = 0
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        values = [{"username": r["username"], "full_name": r["full_name"], "role": r["role"],
+                   "password_hash": next(hashes)} for r in chunk]
+        n = db.session.execute(stmt, values).rowcount
+        db.session.commit()
+        inserted += n
+        conflicts += len(chunk) - n
+        on_batch(chunk[-1]["line"], start + len(chunk), inserted)
+    return inserted, conflicts
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Bulk-create users from a CSV or JSONL file.")
+    ap.add_argument("path", type=Path, help="input file (.csv, .jsonl or .ndjson)")
+    ap.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from the extension)")
+    ap.add_argument("--default-role", default="student", choices=ROLES, help="role for rows without one")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="password hashing processes (0 = hash in this process)")
+    ap.add_argument("--batch-size", type=int, default=200, help="rows per insert transaction")
+    ap.add_argument("--checkpoint", type=Path, help="checkpoint file (default: <path>.import-checkpoint.json)")
+    ap.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    ap.add_argument("--dry-run", action="store_true", help="validate and report only")
+    ap.add_argument("--rejects", type=Path, help="write rejected rows (line, username, reason) to this CSV")
+    args = ap.parse_args()
+
+    if not args.path.is_file():
+        raise SystemExit(f"No such file: {args.path}")
+    fmt = args.format or ("csv" if args.path.suffix.lower() == ".csv" else "jsonl")
+    checkpoint = args.checkpoint or args.path.with_name(args.path.name + ".import-checkpoint.json")
+    digest = file_digest(args.path)
+
+    t0 = time.perf_counter()
+    rows, rejects = plan(args.path, fmt, args.default_role)
+    resume_after = 0 if args.restart else load_checkpoint(checkpoint, digest)
+
+    app = create_app(cli=True)
+    init_db(app)
+    with app.app_context():
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        # One indexed scan; cheaper than thousands of per-row lookups
+        existing = set(db.session.scalars(select(User.username)))
+        pending = [r for r in rows if r["line"] > resume_after and r["username"] not in existing]
+        already = sum(1 for r in rows if r["username"] in existing)
+
+        print(f"Read {len(rows) + len(rejects)} row(s) from {args.path} in {time.perf_counter() - t0:.2f}s: "
+              f"{len(rows)} valid, {len(rejects)} rejected, {already} already exist"
+              + (f", resuming after line {resume_after}" if resume_after else ""))
+        for line, username, reason in rejects[:SHOW_REJECTS]:
+            print(f"  line {line}: {username or '-'}: {reason}")
+        if len(rejects) > SHOW_REJECTS:
+            print(f"  ... and {len(rejects) - SHOW_REJECTS} more")
+        if args.rejects and rejects:
+            with args.rejects.open("w", newline="") as f:
+                csv.writer(f).writerows([("line", "username", "reason"), *rejects])
+            print(f"Rejected rows written to {args.rejects}")
+
+        if args.dry_run or not pending:
+            print("Dry run; nothing written." if args.dry_run else "Nothing to import.")
+            return
+
+        started = time.perf_counter()
+
+        def progress(line: int, done: int, inserted: int) -> None:
+            save_checkpoint(checkpoint, args.path, digest, line, inserted)
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            print(f"  {done}/{len(pending)} rows committed ({rate:.0f}/s), checkpoint at line {line}", flush=True)
+
+        hasher = partial(generate_password_hash, **PASSWORD_HASH_ARGS)
+        passwords = (r["password"] for r in pending)
+        if args.workers > 0:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as pool:
+                chunksize = max(1, min(16, args.batch_size // (args.workers * 4)))
+                inserted, conflicts = insert_rows(pending, pool.map(hasher, passwords, chunksize=chunksize),
+                                                  args.batch_size, progress)
+        else:
+            inserted, conflicts = insert_rows(pending, map(hasher, passwords), args.batch_size, progress)
+
+        print(f"Created {inserted} user(s) in {time.perf_counter() - started:.1f}s"
+              + (f"; {conflicts} appeared concurrently and were skipped" if conflicts else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+# tools/loadtest.py
+"""
+Offline load test for the recognition endpoints: how many simultaneous
+students / kiosks one server process keeps up with.
+
+  python tools/loadtest.py                                   # morning_rush, 20 clients, 30 s
+  python tools/loadtest.py --scenario steady --clients 100 --duration 120
+  python tools/loadtest.py --scenario mixed --mix mark=6,register=1,admin_export=1
+  python tools/loadtest.py --set ATTENDANCE_WRITER_ENABLED=0 --out no_writer.json
+  python tools/loadtest.py --list
+
+Everything runs locally in this process, against a throwaway database:
+
+- a temp directory gets a fresh SQLite DB (plus gallery/archive paths),
+  seeded with ``--students`` students holding one synthetic face template
+  each, an admin, a faculty account and ``--history`` past attendance rows
+- the real app (``create_app``: same config and env vars as production,
+  embedding worker pool included; ``--set`` overrides any key) is served by
+  werkzeug's threaded server on a free 127.0.0.1 port
+- ``--clients`` threads make HTTP requests as their own student (or as the
+  admin / faculty account for exports). Every upload is a freshly generated
+  JPEG (``synthetic_face_frame``, or ``--image`` with jitter), so nothing is
+  answered from the embedding cache
+
+Session cookies are signed with the app's key instead of logging in, so
+password hashing is not part of the measurement; clients keep that cookie,
+and the flash message in each response's cookie tells the outcome
+(``ok`` / ``rejected`` / ``error``).
+
+The report has throughput, p50/p95/p99 latency and outcomes per operation,
+``database is locked`` occurrences (in responses and in the app log), and
+where server time went, taken from app/metrics.py: pipeline stages,
+embedding queue wait and run time, attendance write latency, and request
+and DB time per endpoint (for streamed CSV exports that only covers
+starting the response; the client latency includes the whole download).
+The clients share an interpreter with the server, so at high client counts
+the numbers are somewhat pessimistic.
+"""
+import argparse
+import collections
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from pathlib import Path
+from typing import NamedTuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import cv2
+import numpy as np
+from sqlalchemy import insert, select
+
+from app import create_app, db, init_db, metrics
+from app.models import AttendanceLog, FaceTemplate, User
+from app.passwords import hash_password
+from app.face_utils import pipeline
+from app.face_utils.camera import synthetic_face_frame
+from app.face_utils.embedding_format import current_format, encode_current
+
+LOCKED = "database is locked"
+IMAGE_SIZE = (640, 480)
+FLASH_OUTCOMES = {"success": "ok", "info": "ok", "warning": "rejected", "danger": "error"}
+
+
+class Scenario(NamedTuple):
+    description: str
+    mix: dict                  # operation -> relative weight
+    think: tuple               # seconds between a client's requests (uniform min, max)
+    ramp: float                # seconds over which clients start
+
+
+SCENARIOS = {
+    "morning_rush": Scenario("everyone marks at once, back to back",
+                             {"mark": 1.0}, (0.0, 0.05), 0.0),
+    "steady": Scenario("marks trickle in with think time, some re-enrollment",
+                       {"mark": 0.9, "register": 0.1}, (1.0, 3.0), 10.0),
+    "mixed": Scenario("marking while faculty and admins pull exports and reports",
+                      {"mark": 0.7, "register": 0.05, "faculty_export": 0.1, "admin_export": 0.1,
+                       "faculty_report": 0.05}, (0.2, 1.0), 2.0),
+}
+
+# Server-side histograms broken down in the report: (title, metric)
+STAGE_METRICS = [
+    ("pipeline stage", metrics.PIPELINE_STAGE_SECONDS),
+    ("embed queue wait", metrics.EMBED_QUEUE_WAIT_SECONDS),
+    ("embed run", metrics.EMBED_RUN_SECONDS),
+    ("attendance write", metrics.ATTENDANCE_WRITE_SECONDS),
+    ("request", metrics.HTTP_REQUEST_SECONDS),
+    ("request db time", metrics.HTTP_REQUEST_DB_SECONDS),
+]
+
+
+# ---------------------------------------------------------
+# Seeding
+# ---------------------------------------------------------
+def face_jpeg(rng, photo=None) -> bytes:
+    """A new face image: the synthetic pattern, or ``photo`` with a random shift, scale and exposure."""
+    w, h = IMAGE_SIZE
+    if photo is None:
+        img = synthetic_face_frame(w, h, rng, float(rng.uniform(-1.5, 1.5)))
+    else:
+        s = rng.uniform(0.95, 1.05)
+        m = np.float32([[s, 0, rng.uniform(-10, 10)], [0, s, rng.uniform(-10, 10)]])
+        img = cv2.warpAffine(photo, m, (photo.shape[1], photo.shape[0]), borderMode=cv2.BORDER_REFLECT)
+        img = cv2.convertScaleAbs(img, alpha=rng.uniform(0.9, 1.1), beta=rng.uniform(-10, 10))
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def seed(app, students: int, history: int, photo, rng) -> dict:
+    """Create the accounts, one template per student and past attendance; returns user ids by role."""
+    from app.reports import rebuild_daily_rollups
+
+    with app.app_context():
+        pw = hash_password(uuid.uuid4().hex)   # nobody logs in with it
+        rows = [{"username": "lt_admin", "full_name": "Load Admin", "role": "admin", "password_hash": pw},
+                {"username": "lt_faculty", "full_name": "Load Faculty", "role": "faculty", "password_hash": pw}]
+        rows += [{"username": f"lt_s{i:05d}", "full_name": f"Student {i}", "role": "student", "password_hash": pw}
+                 for i in range(students)]
+        db.session.execute(insert(User), rows)
+        db.session.commit()
+        ids = dict(db.session.execute(select(User.username, User.id)).all())
+        student_ids = [ids[f"lt_s{i:05d}"] for i in range(students)]
+
+        templates = []
+        for uid in student_ids:
+            vec = pipeline.get_image_embedding(face_jpeg(rng, photo))
+            if vec is None or not vec.size:
+                raise SystemExit("Seed image has no detectable face; try another --image.")
+            templates.append({"user_id": uid, "embedding": encode_current(vec), "source": "batch",
+                              "capture_meta": {"format": current_format().name, "loadtest": True}})
+        db.session.execute(insert(FaceTemplate), templates)
+
+        now = datetime.utcnow()
+        for start in range(0, history, 10000):
+            db.session.execute(insert(AttendanceLog), [
+                {"user_id": random.choice(student_ids), "status": "TIME_IN", "location": "Gate",
+                 "timestamp": now - timedelta(seconds=random.randint(60, 90 * 86400))}
+                for _ in range(min(10000, history - start))])
+        db.session.commit()
+        rebuild_daily_rollups()
+    return {"admin": ids["lt_admin"], "faculty": ids["lt_faculty"], "students": student_ids}
+
+
+# ---------------------------------------------------------
+# Clients
+# ---------------------------------------------------------
+class Result(NamedTuple):
+    op: str
+    started: float       # seconds since the run began
+    latency: float       # seconds
+    outcome: str         # ok | rejected | error | http_<status> | conn_error
+    message: str
+    locked: bool
+
+
+class Session:
+    """One keep-alive connection with a fixed, pre-signed session cookie."""
+
+    def __init__(self, port: int, cookie: str, serializer):
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        self.cookie = cookie
+        self.serializer = serializer
+
+    def request(self, method: str, path: str, body: bytes | None = None, content_type: str | None = None):
+        headers = {"Cookie": f"session={self.cookie}"}
+        if content_type:
+            headers["Content-Type"] = content_type
+        t0 = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+        return resp, data, time.perf_counter() - t0
+
+    def flash(self, resp) -> tuple[str, str] | None:
+        """The newest flashed (category, message) in the response's session cookie."""
+        for header in resp.headers.get_all("Set-Cookie") or ():
+            c = SimpleCookie()
+            c.load(header)
+            if "session" in c:
+                flashes = self.serializer.loads(c["session"].value).get("_flashes") or []
+                if flashes:
+                    return tuple(flashes[-1])
+        return None
+
+
+def _multipart(field: str, filename: str, data: bytes) -> tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _upload(path: str):
+    def op(sessions, rng, photo):
+        body, ctype = _multipart("image", "capture.jpg", face_jpeg(rng, photo))
+        s = sessions["student"]
+        resp, data, dt = s.request("POST", path, body, ctype)
+        if resp.status >= 400:
+            return dt, f"http_{resp.status}", "", LOCKED in data.decode(errors="replace")
+        category, message = s.flash(resp) or ("error", "no flash message")
+        return dt, FLASH_OUTCOMES.get(category, "error"), message, LOCKED in message
+    return op
+
+
+def _download(role: str, path: str):
+    def op(sessions, rng, photo):
+        resp, data, dt = sessions[role].request("GET", path)
+        if resp.status != 200:
+            return dt, f"http_{resp.status}", "", LOCKED in data.decode(errors="replace")
+        return dt, "ok", "", False
+    return op
+
+
+OPERATIONS = {
+    "mark": _upload("/recognition/mark"),
+    "register": _upload("/recognition/register_face"),
+    "faculty_export": _download("faculty", "/faculty/logs/export"),
+    "admin_export": _download("admin", "/admin/all_logs/export"),
+    "faculty_report": _download("faculty", "/faculty/reports/export"),
+}
+
+
+def run_client(idx, port, cookies, serializer, scenario, t_start, deadline, max_requests, photo, seed_, out):
+    rng = np.random.default_rng(seed_ + idx)
+    sessions = {role: Session(port, cookie, serializer) for role, cookie in cookies.items()}
+    ops, weights = zip(*scenario.mix.items())
+    p = np.asarray(weights, dtype=float) / sum(weights)
+    if scenario.ramp:
+        time.sleep(scenario.ramp * idx / max(1, len(out)))
+    done = 0
+    while time.perf_counter() < deadline and (not max_requests or done < max_requests):
+        name = ops[rng.choice(len(ops), p=p)]
+        started = time.perf_counter() - t_start
+        try:
+            dt, outcome, message, locked = OPERATIONS[name](sessions, rng, photo)
+        except (OSError, http.client.HTTPException) as e:
+            dt, outcome, message, locked = time.perf_counter() - t_start - started, "conn_error", str(e), False
+        out[idx].append(Result(name, started, dt, outcome, message, locked))
+        done += 1
+        think = rng.uniform(*scenario.think)
+        if think:
+            time.sleep(think)
+
+
+# ---------------------------------------------------------
+# Server-side measurements
+# ---------------------------------------------------------
+class LockCounter(logging.Handler):
+    """Counts app log records (and their exceptions) that mention a locked database."""
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record):
+        text = record.getMessage()
+        if record.exc_info and record.exc_info[1] is not None:
+            text += str(record.exc_info[1])
+        if LOCKED in text:
+            self.count += 1
+
+
+def histogram_snapshot() -> dict:
+    snap = {}
+    for title, h in STAGE_METRICS:
+        with h._lock:
+            snap[title] = {k: (sum(counts), total) for k, (counts, total) in h._series.items()}
+    return snap
+
+
+def stage_breakdown(before: dict, after: dict) -> list[dict]:
+    rows = []
+    for title, _ in STAGE_METRICS:
+        for key, (n, total) in sorted(after[title].items()):
+            n0, total0 = before[title].get(key, (0, 0.0))
+            if n - n0:
+                rows.append({"metric": title, "label": "/".join(key) or "-", "count": n - n0,
+                             "total_s": round(total - total0, 3),
+                             "mean_ms": round((total - total0) / (n - n0) * 1000, 2)})
+    return rows
+
+
+# ---------------------------------------------------------
+# Report
+# ---------------------------------------------------------
+def summarize(results: list[Result], wall: float) -> dict:
+    by_op = collections.defaultdict(list)
+    for r in results:
+        by_op[r.op].append(r)
+    by_op["total"] = results
+    out = {}
+    for op, rs in by_op.items():
+        lat = np.asarray([r.latency for r in rs]) * 1000
+        outcomes = collections.Counter(r.outcome for r in rs)
+        out[op] = {
+            "requests": len(rs),
+            "rps": round(len(rs) / wall, 2),
+            "outcomes": dict(outcomes),
+            "p50_ms": round(float(np.percentile(lat, 50)), 1) if rs else None,
+            "p95_ms": round(float(np.percentile(lat, 95)), 1) if rs else None,
+            "p99_ms": round(float(np.percentile(lat, 99)), 1) if rs else None,
+            "max_ms": round(float(lat.max()), 1) if rs else None,
+        }
+    return out
+
+
+def print_report(report: dict) -> None:
+    cfg = report["config"]
+    print(f"\nScenario {cfg['scenario']} ({SCENARIOS[cfg['scenario']].description}): {cfg['clients']} clients, "
+          f"{report['wall_s']:.1f} s measured, mix {cfg['mix']}")
+    print(f"{'operation':<16}{'n':>7}{'req/s':>8}{'ok':>7}{'rej':>6}{'err':>6}{'other':>7}"
+          f"{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for op, s in report["operations"].items():
+        o = s["outcomes"]
+        other = s["requests"] - o.get("ok", 0) - o.get("rejected", 0) - o.get("error", 0)
+        print(f"{op:<16}{s['requests']:>7}{s['rps']:>8.1f}{o.get('ok', 0):>7}{o.get('rejected', 0):>6}"
+              f"{o.get('error', 0):>6}{other:>7}{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{s['max_ms']:>9}")
+    locked = report["database_locked"]
+    print(f"'{LOCKED}': {locked['responses']} response(s), {locked['log_records']} app log record(s)")
+    if report["messages"]:
+        print("Non-ok outcomes:")
+        for m in report["messages"]:
+            print(f"  {m['count']:>6}  {m['op']:<10} {m['outcome']:<10} {m['message']}")
+    print(f"\n{'server time':<20}{'label':<36}{'count':>8}{'mean ms':>10}{'total s':>10}")
+    for row in report["stages"]:
+        print(f"{row['metric']:<20}{row['label'][:35]:<36}{row['count']:>8}{row['mean_ms']:>10.2f}{row['total_s']:>10.2f}")
+
+
+def _parse_mix(s: str) -> dict:
+    mix = {}
+    for part in s.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}.")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def _parse_set(items) -> dict:
+    out = {}
+    for item in items or ():
+        key, _, value = item.partition("=")
+        try:
+            out[key] = json.loads(value)
+        except ValueError:
+            out[key] = value
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenario", default="morning_rush", choices=sorted(SCENARIOS))
+    ap.add_argument("--list", action="store_true", help="list scenarios and operations, then exit")
+    ap.add_argument("--clients", type=int, default=20, help="concurrent simulated clients")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds to run (after warmup)")
+    ap.add_argument("--requests", type=int, default=0, help="stop each client after this many requests")
+    ap.add_argument("--mix", help="override the scenario's mix, e.g. mark=8,register=1,admin_export=1")
+    ap.add_argument("--think", help="override think time between requests: MIN,MAX seconds")
+    ap.add_argument("--ramp", type=float, help="override the ramp-up period in seconds")
+    ap.add_argument("--students", type=int, default=200, help="students to seed")
+    ap.add_argument("--history", type=int, default=20000, help="past attendance rows to seed")
+    ap.add_argument("--image", help="real face photo to jitter instead of synthetic frames")
+    ap.add_argument("--set", action="append", metavar="KEY=VALUE", help="app config override (JSON value)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--keep", action="store_true", help="keep the temp directory (DB, gallery) afterwards")
+    ap.add_argument("--out", help="also write the full report as JSON here")
+    args = ap.parse_args()
+
+    if args.list:
+        for name, sc in SCENARIOS.items():
+            print(f"{name:<14} {sc.description}; mix {sc.mix}, think {sc.think} s, ramp {sc.ramp} s")
+        print("operations:", ", ".join(OPERATIONS))
+        return
+
+    base = SCENARIOS[args.scenario]
+    scenario = base._replace(
+        mix=_parse_mix(args.mix) if args.mix else base.mix,
+        think=tuple(float(x) for x in args.think.split(",")) if args.think else base.think,
+        ramp=base.ramp if args.ramp is None else args.ramp,
+    )
+    photo = None
+    if args.image:
+        photo = cv2.imread(args.image, cv2.IMREAD_COLOR)
+        if photo is None:
+            ap.error(f"cannot read image: {args.image}")
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    tmp = Path(tempfile.mkdtemp(prefix="facial-loadtest-"))
+    overrides = {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp / 'loadtest.db'}",
+        "GALLERY_PATH": str(tmp / "gallery"),
+        "ARCHIVE_PATH": str(tmp / "archive"),
+        **_parse_set(args.set),
+    }
+    server = None
+    try:
+        seed_app = create_app(overrides, cli=True)
+        init_db(seed_app)
+        print("DB:", seed_app.config['SQLALCHEMY_DATABASE_URI'])
+        t0 = time.perf_counter()
+        ids = seed(seed_app, args.students, args.history, photo, rng)
+        print(f"Seeded {args.students} students and {args.history} log rows in {time.perf_counter() - t0:.1f}s")
+
+        # the web app warms its pool and gallery now, so the first requests don't pay for it
+        app = create_app({**overrides, "FACE_ENGINE_EAGER": True})
+        locks = LockCounter()
+        app.logger.addHandler(locks)
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+        from werkzeug.serving import make_server
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+        port = server.server_port
+        print(f"Serving on 127.0.0.1:{port} (FACE_ENGINE_WORKERS={app.config['FACE_ENGINE_WORKERS']})")
+
+        serializer = app.session_interface.get_signing_serializer(app)
+        sign = lambda uid: serializer.dumps({"_user_id": str(uid), "_fresh": True})
+        students = ids["students"]
+        cookies = [{"student": sign(students[i % len(students)]), "faculty": sign(ids["faculty"]),
+                    "admin": sign(ids["admin"])} for i in range(args.clients)]
+
+        out: list[list[Result]] = [[] for _ in range(args.clients)]
+        before = histogram_snapshot()
+        locks.count = 0
+        t_start = time.perf_counter()
+        deadline = t_start + scenario.ramp + args.duration
+        threads = [threading.Thread(target=run_client, name=f"client-{i}",
+                                    args=(i, port, cookies[i], serializer, scenario, t_start, deadline,
+                                          args.requests, photo, args.seed, out))
+                   for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t_start
+        after = histogram_snapshot()
+
+        results = [r for rs in out for r in rs]
+        messages = collections.Counter((r.op, r.outcome, r.message) for r in results if r.outcome != "ok")
+        with app.app_context():
+            from app.attendance_writer import get_writer
+            from app.face_utils.engine import get_engine
+            engine_stats, writer_stats = get_engine().stats(), get_writer().stats()
+        report = {
+            "config": {"scenario": args.scenario, "clients": args.clients, "duration_s": args.duration,
+                       "mix": scenario.mix, "think_s": scenario.think, "ramp_s": scenario.ramp,
+                       "students": args.students, "history": args.history, "overrides": _parse_set(args.set),
+                       "face_engine_workers": app.config["FACE_ENGINE_WORKERS"], "cpus": os.cpu_count()},
+            "wall_s": round(wall, 2),
+            "operations": summarize(results, wall),
+            "database_locked": {"responses": sum(r.locked for r in results), "log_records": locks.count},
+            "messages": [{"op": op, "outcome": o, "message": m, "count": n}
+                         for (op, o, m), n in messages.most_common(10)],
+            "stages": stage_breakdown(before, after),
+            "engine": engine_stats,
+            "attendance_writer": writer_stats,
+        }
+        print_report(report)
+        if args.out:
+            Path(args.out).write_text(json.dumps(report, indent=2, default=str))
+            print(f"\nWrote {args.out}")
+    finally:
+        if server is not None:
+            server.shutdown()
+        if args.keep:
+            print("Kept", tmp)
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# tools/make_test_video.py
+"""
+Generate an entrance-clip test video from face photos.
+
+Each ``--face`` photo walks across a noisy background in turn, with empty
+stretches before, between and after (which exercises the adaptive frame
+skip). ``--together`` has them walk past in single file, all in view at once.
+
+  python tools/make_test_video.py clip.avi --face registered_faces/student1.jpg
+  python tools/make_test_video.py crowd.avi --face a.jpg --face b.jpg --together --walk 6
+  python tools/make_test_video.py hd.avi --face registered_faces/student1.jpg --size 1920x1080 --scale 0.12 --check
+
+``--check`` runs the finished clip through ``track_video`` with the default
+VideoOptions (what the web app uses unless VIDEO_* is configured) and exits
+non-zero unless it finds one track per ``--face``.
+
+Upload the result on /recognition/video. Output is MJPG in an .avi
+container, which every OpenCV build can read back.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import cv2
+import numpy as np
+
+
+def _paste(frame: np.ndarray, img: np.ndarray, x: int, y: int) -> None:
+    h, w = img.shape[:2]
+    fh, fw = frame.shape[:2]
+    x0, y0, x1, y1 = max(0, x), max(0, y), min(fw, x + w), min(fh, y + h)
+    if x1 > x0 and y1 > y0:
+        frame[y0:y1, x0:x1] = img[y0 - y : y1 - y, x0 - x : x1 - x]
+
+
+def check(path: Path, expected: int) -> None:
+    from app.face_utils.video import VideoJob, track_video
+
+    t0 = time.perf_counter()
+    res = track_video(VideoJob(str(path)))
+    if res is None:
+        raise SystemExit(f"track_video could not read {path}")
+    print(f"track_video: {len(res.tracks)} track(s) for {expected} face(s); {res.frames_sampled} of "
+          f"{res.frames_read} frames sampled in {time.perf_counter() - t0:.1f}s")
+    for tr in res.tracks:
+        print(f"  track {tr.track_id}: {tr.first_s:.1f}-{tr.last_s:.1f}s, {tr.hits} hits, "
+              f"box {tr.box}, {len(tr.samples)} sample(s)")
+    if len(res.tracks) != expected:
+        raise SystemExit(1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate a test video of faces walking past the camera.")
+    ap.add_argument("out", type=Path, help="output .avi path")
+    ap.add_argument("--face", action="append", required=True, help="face photo (repeatable)")
+    ap.add_argument("--size", default="640x480", help="frame size WxH")
+    ap.add_argument("--fps", type=float, default=25.0)
+    ap.add_argument("--walk", type=float, default=4.0, help="seconds each face takes to cross the frame")
+    ap.add_argument("--idle", type=float, default=3.0, help="seconds of empty frames before, between and after")
+    ap.add_argument("--scale", type=float, default=0.6, help="photo height as a fraction of the frame height")
+    ap.add_argument("--together", action="store_true", help="all faces in view at the same time")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--check", action="store_true", help="track the finished clip and expect one track per face")
+    args = ap.parse_args()
+
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    photos = []
+    for path in args.face:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            raise SystemExit(f"Cannot read image: {path}")
+        ph = int(h * args.scale)
+        photos.append(cv2.resize(img, (int(img.shape[1] * ph / img.shape[0]), ph), interpolation=cv2.INTER_AREA))
+
+    # (start frame, photo index, x offset behind the leader) for every walk-by
+    walk_n, idle_n = int(args.walk * args.fps), int(args.idle * args.fps)
+    if args.together:
+        offsets = np.cumsum([0] + [p.shape[1] + 20 for p in photos[:-1]])
+        walks = [(idle_n, i, int(offsets[i])) for i in range(len(photos))]
+        total = idle_n * 2 + walk_n
+    else:
+        walks = [(idle_n + i * (walk_n + idle_n), i, 0) for i in range(len(photos))]
+        total = idle_n + len(photos) * (walk_n + idle_n)
+    span = max(off + photos[i].shape[1] for _, i, off in walks)
+
+    writer = cv2.VideoWriter(str(args.out), cv2.VideoWriter_fourcc(*"MJPG"), args.fps, (w, h))
+    if not writer.isOpened():
+        raise SystemExit(f"Cannot open video writer for {args.out}")
+    rng = np.random.default_rng(args.seed)
+    try:
+        for n in range(total):
+            frame = rng.integers(60, 120, size=(h, w, 3), dtype=np.uint8)
+            for start, i, offset in walks:
+                if not start <= n < start + walk_n:
+                    continue
+                img = photos[i]
+                progress = (n - start) / max(1, walk_n - 1)
+                # enter from the left, leave on the right
+                x = int(-span + progress * (w + span)) + span - img.shape[1] - offset
+                _paste(frame, img, x, (h - img.shape[0]) // 2)
+            writer.write(frame)
+    finally:
+        writer.release()
+    print(f"Wrote {args.out}: {total} frames, {total / args.fps:.1f}s at {args.fps:g} fps, {len(photos)} face(s)")
+    if args.check:
+        check(args.out, len(photos))
+
+if __name__ == "__main__":
+    main()
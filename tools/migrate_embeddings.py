@@ -0,0 +1,82 @@
+# tools/migrate_embeddings.py
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import update
+from app import create_app, db
+from app.models import FaceTemplate
+from app.face_utils.embedding_format import PROJ_NONE, RAW_DIM, decode, encode, parse_format, quantize
+
+BATCH = 500
+
+def convert(blob, fmt):
+    """Re-encode one stored blob in ``fmt``; None if it cannot be converted."""
+    d = decode(blob)
+    if d is None:
+        return None
+    if d.fmt == fmt.name:
+        return blob
+    if d.projection == PROJ_NONE and d.vec.size == RAW_DIM:
+        return encode(d.vec, fmt)
+    if d.projection == fmt.projection and d.vec.size == fmt.dims:
+        # same space, different precision: re-quantize without projecting again
+        return quantize(d.vec, fmt)
+    return None
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert stored face templates to another format.")
+    ap.add_argument("--format", default=None, help="target format (default: app EMBEDDING_FORMAT)")
+    ap.add_argument("--dry-run", action="store_true", help="report only, do not write")
+    args = ap.parse_args()
+
+    app = create_app(cli=True)
+    with app.app_context():
+        fmt = parse_format(args.format or app.config['EMBEDDING_FORMAT'])
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        print("Target format:", fmt.name)
+
+        total = before = after = converted = skipped = failed = 0
+        last_id = 0
+        while True:
+            # keyset batches: never more than BATCH blobs in memory
+            rows = (db.session.query(FaceTemplate.id, FaceTemplate.embedding)
+                    .filter(FaceTemplate.id > last_id)
+                    .order_by(FaceTemplate.id)
+                    .limit(BATCH)
+                    .all())
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            total += len(rows)
+            pending = []
+            for tid, blob in rows:
+                new = convert(blob, fmt)
+                before += len(blob)
+                if new is None:
+                    failed += 1
+                    after += len(blob)
+                    d = decode(blob)
+                    print(f"  template {tid}: cannot convert {d.fmt if d else 'unreadable blob'} -> {fmt.name}")
+                    continue
+                after += len(new)
+                if new is blob:
+                    skipped += 1
+                    continue
+                converted += 1
+                pending.append({"id": tid, "embedding": new})
+            if pending and not args.dry_run:
+                db.session.execute(update(FaceTemplate), pending)
+                db.session.commit()
+
+        print(f"Rows: {total}  converted: {converted}  already in format: {skipped}  failed: {failed}")
+        if total:
+            print(f"Bytes: {before} -> {after} ({before / max(after, 1):.1f}x smaller)")
+        if args.dry_run:
+            print("Dry run: nothing written.")
+
+if __name__ == "__main__":
+    main()
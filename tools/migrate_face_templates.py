@@ -0,0 +1,39 @@
+# tools/migrate_face_templates.py
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import text
+from app import copy_legacy_templates, create_app, db, init_db
+
+def main():
+    ap = argparse.ArgumentParser(description="Move legacy users.face_embedding blobs into face_templates.")
+    ap.add_argument("--drop-column", action="store_true",
+                    help="drop users.face_embedding afterwards (needs SQLite 3.35+)")
+    args = ap.parse_args()
+
+    app = create_app(cli=True)
+    with app.app_context():
+        print("DB:", app.config['SQLALCHEMY_DATABASE_URI'])
+        # init_db copies them as well (web apps run it at startup); copy first to report the count
+        db.create_all()
+        copied = copy_legacy_templates()
+        init_db(app)
+        cols = [row[1] for row in db.session.execute(text("PRAGMA table_info(users)"))]
+        if "face_embedding" not in cols:
+            print("Nothing to migrate: users.face_embedding does not exist.")
+            return
+        print(f"Copied {copied} legacy embedding(s) into face_templates.")
+
+        if args.drop_column:
+            db.session.execute(text("ALTER TABLE users DROP COLUMN face_embedding"))
+            db.session.commit()
+            print("Dropped users.face_embedding.")
+        else:
+            print("Legacy column kept; rerun with --drop-column to remove it.")
+
+if __name__ == "__main__":
+    main()
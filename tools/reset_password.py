@@ -17,7 +17,7 @@ def main():
 
     uname, new_pwd = sys.argv[1], sys.argv[2]
 
-    app = create_app()
+    app = create_app(cli=True)
     with app.app_context():
         u = User.query.filter(func.lower(User.username) == uname.lower()).first()
         if not u:
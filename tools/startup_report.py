@@ -0,0 +1,87 @@
+# tools/startup_report.py
+"""
+Cold-start timings for the app factory, each measured in a fresh interpreter:
+
+  cli     create_app(cli=True)            (what admin tools pay)
+  web     create_app()                    (what a web worker pays before its first request)
+  eager   create_app() + warmup(app)      (FACE_ENGINE_EAGER=1)
+
+For every mode it prints the import time, create_app's own phase breakdown
+(see app/startup.py) and whether OpenCV ended up loaded.
+
+  python tools/startup_report.py
+  python tools/startup_report.py --runs 5 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+MODES = ("cli", "web", "eager")
+
+_PROBE = r"""
+import json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+from app import create_app
+import_s = time.perf_counter() - t0
+app = create_app(cli={cli})
+report = app.extensions["startup"].as_dict()
+warm = None
+if {eager}:
+    from app.startup import warmup
+    warm = warmup(app).as_dict()
+    app.extensions["face_engine"].shutdown()
+print(json.dumps({{"import_ms": import_s * 1000, "wall_ms": (time.perf_counter() - t0) * 1000,
+                  "startup": report, "warmup": warm, "opencv_loaded": "cv2" in sys.modules}}))
+"""
+
+
+def probe(mode: str) -> dict:
+    code = _PROBE.format(root=str(ROOT), cli=mode == "cli", eager=mode == "eager")
+    env = {**os.environ, "FACE_ENGINE_EAGER": "0"}
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure cold-start time of the app factory.")
+    ap.add_argument("--runs", type=int, default=3, help="fresh interpreters per mode (median is shown)")
+    ap.add_argument("--modes", default=",".join(MODES), help=f"comma-separated subset of {MODES}")
+    ap.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = ap.parse_args()
+
+    results = {}
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        if mode not in MODES:
+            raise SystemExit(f"unknown mode: {mode}")
+        runs = [probe(mode) for _ in range(max(1, args.runs))]
+        results[mode] = runs
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':6} {'import':>9} {'factory':>9} {'warmup':>9} {'wall':>9}  opencv  phases")
+    for mode, runs in results.items():
+        med = lambda f: statistics.median(f(r) for r in runs)
+        last = runs[-1]
+        phases = dict(last["startup"]["phases_ms"])
+        if last["warmup"]:
+            phases.update({f"warmup.{k}": v for k, v in last["warmup"]["phases_ms"].items()})
+        print(f"{mode:6} {med(lambda r: r['import_ms']):8.1f}ms "
+              f"{med(lambda r: r['startup']['total_ms']):8.1f}ms "
+              f"{med(lambda r: (r['warmup'] or {}).get('total_ms', 0.0)):8.1f}ms "
+              f"{med(lambda r: r['wall_ms']):8.1f}ms  "
+              f"{'yes' if last['opencv_loaded'] else 'no ':6}  "
+              + ", ".join(f"{k}={v:.1f}" for k, v in phases.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+# wsgi.py
+"""
+WSGI entry point for production servers, e.g. ``gunicorn wsgi:app``.
+
+Kept apart from run.py so that importing the entry script never builds the
+app: embedding workers started with "spawn" re-import ``__main__``, and each
+would otherwise run create_app() (schema checks, services) for nothing.
+"""
+from app import create_app
+
+app = create_app()